@@ -0,0 +1,323 @@
+"""ASGI front end for the posture API: connections on an event loop, analysis on a bounded executor.
+
+Phones on slow cellular links keep an upload open for seconds. Under the
+threaded WSGI servers each such connection holds an OS thread while its
+body trickles in. Here connections belong to the event loop and bodies are
+read with async receive() calls, so a slow or idle upload costs a coroutine
+and its buffer, not a thread.
+
+Once a request's body has fully arrived, the Flask app from
+working_posture_app handles it on a pool of ASGI_EXECUTOR_THREADS threads
+(the core count by default). That is where decode, pose inference and the
+rest of the request run, with the same behaviour as under the WSGI servers:
+quality tiers, rules, caches, frame gate, history and response encoding.
+CPU concurrency stays at the pool size however many connections are open.
+At most ASGI_MAX_PENDING complete requests wait for or run on the pool;
+beyond that the answer is 503 with Retry-After, as when the pose workers'
+frame ring is full. That is checked before the body is read as well as
+after, so a full pool doesn't cost the upload.
+
+The upload limits are applied while the body arrives. A declared
+Content-Length over the limit is answered 413 without reading the body. A
+raw image body sent to /analyze-posture is probed for its signature and
+pixel count as its first bytes come in (see upload_ingest).
+
+/, /health and /test are answered on the event loop. So is the long poll of
+GET /jobs/<id>?wait=<seconds>, which would otherwise hold a pool thread for
+up to JOB_MAX_WAIT seconds. The live WebSocket (/ws/live-posture) is only
+served by the WSGI servers.
+
+Serve it with serve_asgi.py, or any ASGI server:
+    uvicorn --factory asgi_app:create_asgi_app
+"""
+import asyncio
+import io
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+
+import working_posture_app
+from jobs import JOB_MAX_WAIT
+from metrics import METRICS_DIR
+from response_encoding import GZIP_LEVEL, GZIP_MIN_BYTES, JSON_MIMETYPE
+from upload_ingest import (MULTIPART_OVERHEAD, RAW_IMAGE_MIMETYPES, ImageProbe, UploadError,
+                           check_content_length, too_large_error)
+
+logger = logging.getLogger(__name__)
+
+ASGI_EXECUTOR_THREADS = int(os.environ.get('ASGI_EXECUTOR_THREADS', os.cpu_count() or 1))
+ASGI_MAX_PENDING = int(os.environ.get('ASGI_MAX_PENDING', 256))
+ASGI_RETRY_AFTER = 1
+# How often a long-polled job is checked for completion
+JOB_POLL_INTERVAL = 0.1
+
+# Paths taking a photo upload, limited to UPLOAD_MAX_BYTES (plus the
+# multipart overhead); only /analyze-posture takes a raw image body
+PHOTO_PATHS = ('/analyze-posture', '/jobs/analyze-posture')
+RAW_UPLOAD_PATHS = ('/analyze-posture',)
+
+# Set by create_asgi_app()
+bridge = None
+
+metrics_registry = working_posture_app.metrics_registry
+rejected_total = metrics_registry.counter(
+    'posture_asgi_rejected_total', 'Requests answered by the ASGI front end without reaching the app',
+    ['reason'])
+metrics_registry.gauge('posture_asgi_receiving_requests', 'Requests whose body is still arriving',
+                       lambda: bridge.receiving if bridge is not None else 0)
+metrics_registry.gauge('posture_asgi_pending_requests', 'Complete requests waiting for or running on the executor',
+                       lambda: bridge.pending if bridge is not None else 0)
+
+
+class ClientDisconnected(Exception):
+    """The client went away before its request body was complete"""
+
+
+def request_mimetype(headers):
+    content_type = headers.get('content-type', '')
+    return content_type.split(';', 1)[0].strip().lower()
+
+
+async def receive_body(receive, max_bytes, probe=None):
+    """Read the whole request body from the ASGI channel, enforcing `max_bytes` as it arrives"""
+    body = bytearray()
+    more = True
+    while more:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        body += message.get('body', b'')
+        more = message.get('more_body', False)
+        if len(body) > max_bytes:
+            raise too_large_error(max_bytes)
+        if probe is not None:
+            probe.feed(body, complete=not more)
+    return body
+
+
+def wsgi_environ(scope, headers, body):
+    """WSGI environ for an ASGI HTTP request whose body has been read"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': '',
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        # The body is complete, so its length is known even if it came chunked
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in headers.items():
+        if name == 'content-length':
+            continue
+        key = name.upper().replace('-', '_')
+        environ[key if key == 'CONTENT_TYPE' else f'HTTP_{key}'] = value
+    return environ
+
+
+def call_wsgi(app, environ):
+    """Run a WSGI app to completion; returns (status code, headers, body)"""
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+        return chunks.append
+
+    result = app(environ, start_response)
+    try:
+        chunks.extend(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], b''.join(chunks)
+
+
+async def send_response(send, status, headers, body):
+    if not any(name.lower() == 'content-length' for name, _ in headers):
+        headers = [*headers, ('Content-Length', str(len(body)))]
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class WSGIBridge:
+    """ASGI app that reads each request body on the event loop, then runs the WSGI app on the executor"""
+
+    def __init__(self, app, executor, max_pending=ASGI_MAX_PENDING):
+        self.app = app
+        self.executor = executor
+        self.max_pending = max_pending
+        self.receiving = 0
+        self.pending = 0
+
+    def body_limit(self, path, mimetype):
+        """(byte limit, ImageProbe or None) for a request body"""
+        config = self.app.config
+        if path in RAW_UPLOAD_PATHS and mimetype in RAW_IMAGE_MIMETYPES:
+            return config['UPLOAD_MAX_BYTES'], ImageProbe(config['UPLOAD_MAX_PIXELS'])
+        if path in PHOTO_PATHS:
+            return config['UPLOAD_MAX_BYTES'] + MULTIPART_OVERHEAD, None
+        return config['MAX_CONTENT_LENGTH'], None
+
+    async def error(self, send, reason, status, message, headers=()):
+        rejected_total.inc(reason)
+        body = self.app.json.dumps({
+            'success': False,
+            'error': message
+        }).encode()
+        await send_response(send, status, [('Content-Type', JSON_MIMETYPE), *headers], body)
+
+    async def busy(self, send):
+        logger.debug("%d requests already pending on the executor, answering 503", self.pending)
+        await self.error(send, 'busy', 503, 'Server is busy, retry later',
+                         [('Retry-After', str(ASGI_RETRY_AFTER))])
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            if scope['type'] == 'websocket':
+                await send({'type': 'websocket.close', 'code': 1008})
+            return
+
+        headers = {}
+        for name, value in scope['headers']:
+            name, value = name.decode('latin-1').lower(), value.decode('latin-1')
+            headers[name] = f'{headers[name]},{value}' if name in headers else value
+
+        if self.pending >= self.max_pending:
+            await self.busy(send)
+            return
+        max_bytes, probe = self.body_limit(scope['path'], request_mimetype(headers))
+        self.receiving += 1
+        try:
+            length = headers.get('content-length')
+            check_content_length(int(length) if length and length.isdigit() else None, max_bytes)
+            body = await receive_body(receive, max_bytes, probe)
+        except UploadError as e:
+            reason = 'too_large' if e.status == 413 else 'bad_image'
+            await self.error(send, reason, e.status, str(e))
+            return
+        except ClientDisconnected:
+            rejected_total.inc('disconnected')
+            return
+        finally:
+            self.receiving -= 1
+
+        # The pool may have filled up while the body arrived
+        if self.pending >= self.max_pending:
+            await self.busy(send)
+            return
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            status, response_headers, response_body = await loop.run_in_executor(
+                self.executor, call_wsgi, self.app, wsgi_environ(scope, headers, body))
+        finally:
+            self.pending -= 1
+        await send_response(send, status, response_headers, response_body)
+
+
+def json_response(request, body, status=200):
+    """JSON the way Flask's jsonify would write it"""
+    return Response(request.app.state.flask_app.json.dumps(body), status, media_type=JSON_MIMETYPE)
+
+
+async def home(request):
+    return json_response(request, working_posture_app.API_INFO)
+
+
+async def health_check(request):
+    """Health check endpoint"""
+    return json_response(request, working_posture_app.health_status())
+
+
+async def test_endpoint(request):
+    """Simple test endpoint to verify server is reachable"""
+    return json_response(request, working_posture_app.test_status('ASGI'))
+
+
+async def get_analysis_job(request):
+    """Job status; ?wait=<seconds> long-polls on the event loop instead of holding a thread"""
+    try:
+        wait = float(request.query_params.get('wait', 0))
+    except ValueError:
+        wait = 0
+
+    job = working_posture_app.job_queue.get(request.path_params['job_id'])
+    if job is None:
+        return json_response(request, {
+            'success': False,
+            'error': 'Unknown or expired job id'
+        }, 404)
+
+    deadline = time.monotonic() + min(wait, JOB_MAX_WAIT)
+    while not job.done.is_set() and time.monotonic() < deadline:
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+    body = job.to_dict()
+    body['success'] = True
+    return json_response(request, body)
+
+
+def create_asgi_app(config=None, threads=ASGI_EXECUTOR_THREADS, max_pending=ASGI_MAX_PENDING):
+    """ASGI application factory.
+
+    Builds the Flask app (and with it the shared analysis resources) with
+    working_posture_app.create_app(config), and the executor that runs it.
+    """
+    global bridge
+
+    flask_app = working_posture_app.create_app(config)
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='posture-asgi')
+    bridge = WSGIBridge(flask_app, executor, max_pending=max_pending)
+    if METRICS_DIR:
+        metrics_registry.share(METRICS_DIR)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        # Requests already on the executor finish before the resources they use are closed
+        executor.shutdown(wait=True, cancel_futures=True)
+        working_posture_app.close_resources()
+        metrics_registry.close()
+
+    # What Flask-CORS and the gzip after_request hook do for the bridged routes
+    middleware = [
+        Middleware(CORSMiddleware, allow_origins=flask_app.config['CORS_ORIGINS']),
+        Middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES, compresslevel=GZIP_LEVEL),
+    ]
+    app = Starlette(routes=[
+        Route('/', home, middleware=middleware),
+        Route('/health', health_check, methods=['GET'], middleware=middleware),
+        Route('/test', test_endpoint, methods=['GET'], middleware=middleware),
+        Route('/jobs/stats', bridge),
+        Route('/jobs/{job_id}', get_analysis_job, methods=['GET'], middleware=middleware),
+        Mount('', app=bridge),
+    ], lifespan=lifespan)
+    app.state.flask_app = flask_app
+    return app
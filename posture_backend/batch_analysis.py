@@ -0,0 +1,159 @@
+import logging
+import multiprocessing
+import os
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from upload_ingest import (UPLOAD_MAX_BYTES, UPLOAD_MAX_PIXELS, UploadError, check_content_length, check_image,
+                           stream_length)
+
+logger = logging.getLogger(__name__)
+
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 1))
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 100))
+# Cap on the photos' combined (decompressed) size in one batch
+BATCH_MAX_TOTAL_BYTES = int(os.environ.get('BATCH_MAX_TOTAL_BYTES', 256 * 1024 * 1024))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+class BatchError(Exception):
+    """Raised when a batch request cannot be turned into a list of images"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def archive_entries(archive):
+    """The image members of a zip archive, without reading any of them"""
+    entries = []
+    for info in archive.infolist():
+        name = info.filename
+        if info.is_dir() or name.startswith('__MACOSX/') or os.path.basename(name).startswith('.'):
+            continue
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            entries.append(info)
+    return entries
+
+
+def read_item(filename, read, size, max_bytes, max_pixels):
+    """(filename, bytes, None), or (filename, None, error) for an item over the upload limits.
+
+    `size` is the item's declared size; an item declaring more than
+    `max_bytes` is never read.
+    """
+    try:
+        check_content_length(size, max_bytes)
+        data = read(max_bytes + 1)
+        check_image(data, max_bytes, max_pixels)
+    except UploadError as e:
+        return filename, None, str(e)
+    return filename, data, None
+
+
+def collect_batch_items(files, max_items=BATCH_MAX_ITEMS, max_bytes=UPLOAD_MAX_BYTES,
+                        max_pixels=UPLOAD_MAX_PIXELS, max_total_bytes=BATCH_MAX_TOTAL_BYTES):
+    """Gather uploaded images from repeated 'photo' parts or one 'archive' part.
+
+    Returns [(filename, bytes, error), ...] in upload order. The item count
+    and combined size are checked before anything is read or decompressed
+    (BatchError). Each photo is held to the single-upload limits: one over
+    them gets an error message and no bytes, and is not analysed.
+    """
+    photos = [file for file in files.getlist('photo') if file.filename != '']
+    archive = None
+    entries = []
+    if 'archive' in files:
+        try:
+            # The parsed part is a seekable file, so members are read from it in place
+            archive = zipfile.ZipFile(files['archive'].stream)
+        except zipfile.BadZipFile:
+            raise BatchError('Archive is not a valid zip file')
+        entries = archive_entries(archive)
+
+    count = len(photos) + len(entries)
+    if not count:
+        raise BatchError('No photos provided')
+    if count > max_items:
+        raise BatchError(f'Too many photos in batch ({count} > {max_items})')
+
+    sizes = [stream_length(file.stream) for file in photos] + [info.file_size for info in entries]
+    total = sum(min(size, max_bytes + 1) for size in sizes if size is not None)
+    if total > max_total_bytes:
+        raise BatchError(f'Photos in batch add up to more than the {max_total_bytes}-byte limit', 413)
+
+    items = [read_item(file.filename, file.read, size, max_bytes, max_pixels)
+             for file, size in zip(photos, sizes)]
+    if archive is not None:
+        with archive:
+            for info, size in zip(entries, sizes[len(photos):]):
+                try:
+                    with archive.open(info) as member:
+                        items.append(read_item(info.filename, member.read, size, max_bytes, max_pixels))
+                except (zipfile.BadZipFile, zlib.error, EOFError, RuntimeError, NotImplementedError) as e:
+                    items.append((info.filename, None, f'Cannot read archive member: {e}'))
+    return items
+
+
+class BatchExecutor:
+    """Process pool used to run image analysis across all CPU cores.
+
+    Workers are started lazily with the 'spawn' method so they never inherit
+    the parent's MediaPipe graphs, and each worker keeps its own pose pool
+    for the lifetime of the process.
+    """
+
+    def __init__(self, max_workers=BATCH_WORKERS):
+        self.max_workers = max(1, int(max_workers))
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def map_ordered(self, func, payloads):
+        """Run func over payloads and return results in input order.
+
+        A failing item yields {'success': False, 'error': ...} instead of
+        failing the whole batch.
+        """
+        executor = self._get_executor()
+        futures = [executor.submit(func, payload) for payload in payloads]
+
+        results = []
+        broken = False
+        for future in futures:
+            try:
+                results.append(future.result())
+            except BrokenProcessPool as e:
+                broken = True
+                results.append({'success': False, 'error': f'Worker process failed: {e}'})
+            except Exception as e:
+                logger.error(f"Batch item failed: {e}")
+                results.append({'success': False, 'error': f'Failed to process image: {str(e)}'})
+
+        if broken:
+            self._reset(executor)
+        return results
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,279 @@
+"""Load comparison of the Flask servers and the ASGI front end under slow mobile uploads.
+
+Usage:
+    python benchmarks/bench_asgi_load.py [--targets flask serve asgi] [--slow 0 200 1000]
+                                         [--fast 8] [--duration 20] [--output bench_asgi_load.json]
+
+Each target is started in its own process on --port (cwd is the
+posture_backend directory):
+
+    flask   working_posture_app under Werkzeug with threaded=True
+    serve   serve.py, one worker with --threads threads
+    asgi    serve_asgi.py, one uvicorn worker with --threads executor threads
+
+For every --slow count, that many connections upload the photo at
+--trickle-bytes per --trickle-interval, like phones on a poor cellular link,
+and start again when their upload completes. Once they are all connected,
+--fast clients post the same photo at full speed for --duration seconds.
+Each request gets a few random bytes after the JPEG's end marker, so neither
+the result cache nor the frame gate can answer it. The report gives the fast
+clients' throughput, p50/p95 latency and errors (timeouts after --timeout
+seconds included). It also gives the server's peak thread count and RSS
+while the slow connections are open.
+
+The threaded server needs a thread per open connection. serve.py's fixed
+pool is used up by slow uploads, and the fast clients time out, or get 503
+once a worker has --max-pending connections (64 by default). The ASGI
+front end keeps the connections on its event loop and runs only --threads
+requests at a time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_pipeline import build_corpus  # noqa: E402
+
+FLASK_THREADED = ("import sys, working_posture_app; "
+                  "working_posture_app.create_app().run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)")
+
+
+def target_command(name, port, threads):
+    if name == 'flask':
+        return [sys.executable, '-c', FLASK_THREADED, str(port)]
+    if name == 'serve':
+        return [sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(port),
+                '--workers', '1', '--threads', str(threads)]
+    return [sys.executable, 'serve_asgi.py', '--host', '127.0.0.1', '--port', str(port),
+            '--workers', '1', '--threads', str(threads)]
+
+
+TARGETS = ('flask', 'serve', 'asgi')
+
+
+def wait_until_up(port, process, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with status {process.returncode}')
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/test', timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError('Server did not come up')
+
+
+def process_tree(pid):
+    pids = [pid]
+    for child in pids:
+        try:
+            with open(f'/proc/{child}/task/{child}/children') as f:
+                pids.extend(int(p) for p in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def server_usage(pid):
+    """(threads, RSS in MB) over the server's process tree"""
+    threads = rss = 0
+    for child in process_tree(pid):
+        try:
+            with open(f'/proc/{child}/status') as f:
+                for line in f:
+                    if line.startswith('Threads:'):
+                        threads += int(line.split()[1])
+                    elif line.startswith('VmRSS:'):
+                        rss += int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    return threads, rss
+
+
+def request_head(port, length):
+    return (f'POST /analyze-posture HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n'
+            f'Content-Type: image/jpeg\r\nContent-Length: {length}\r\nConnection: close\r\n\r\n').encode()
+
+
+async def read_status(reader):
+    """Status code of the response, reading it to the end"""
+    status_line = await reader.readline()
+    await reader.read()
+    return int(status_line.split()[1]) if status_line else None
+
+
+async def post_photo(port, body):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(request_head(port, len(body)) + body)
+        await writer.drain()
+        return await read_status(reader)
+    finally:
+        writer.close()
+
+
+async def fast_client(port, photo, deadline, timeout, latencies, errors):
+    while time.monotonic() < deadline:
+        body = photo + os.urandom(16)
+        start = time.perf_counter()
+        try:
+            status = await asyncio.wait_for(post_photo(port, body), timeout)
+        except asyncio.TimeoutError:
+            status = 'timeout'
+        except OSError as e:
+            status = type(e).__name__
+            await asyncio.sleep(0.1)
+        if status == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+
+
+async def slow_client(port, photo, args, stop, connected, stats):
+    announced = False
+    while not stop.is_set():
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        except OSError:
+            stats['connect_errors'] += 1
+            await asyncio.sleep(1)
+            continue
+        try:
+            body = photo + os.urandom(16)
+            writer.write(request_head(port, len(body)))
+            await writer.drain()
+            if not announced:
+                announced = True
+                connected.release()
+            for offset in range(0, len(body), args.trickle_bytes):
+                if stop.is_set():
+                    break
+                writer.write(body[offset:offset + args.trickle_bytes])
+                await writer.drain()
+                await asyncio.sleep(args.trickle_interval)
+            else:
+                if await read_status(reader) == 200:
+                    stats['completed'] += 1
+        except OSError:
+            stats['errors'] += 1
+        finally:
+            writer.close()
+
+
+async def run_scenario(port, pid, photo, slow, args):
+    stop = asyncio.Event()
+    connected = asyncio.Semaphore(0)
+    slow_stats = {'completed': 0, 'errors': 0, 'connect_errors': 0}
+    slow_tasks = []
+    for i in range(slow):
+        slow_tasks.append(asyncio.create_task(slow_client(port, photo, args, stop, connected, slow_stats)))
+        if i % 100 == 99:
+            await asyncio.sleep(0.05)
+    for _ in range(slow):
+        await connected.acquire()
+    await asyncio.sleep(1)
+
+    peak_threads, peak_rss = server_usage(pid)
+    latencies, errors = [], {}
+    deadline = time.monotonic() + args.duration
+    fast_tasks = [asyncio.create_task(fast_client(port, photo, deadline, args.timeout, latencies, errors))
+                  for _ in range(args.fast)]
+    start = time.perf_counter()
+    while not all(task.done() for task in fast_tasks):
+        await asyncio.sleep(0.5)
+        threads, rss = server_usage(pid)
+        peak_threads, peak_rss = max(peak_threads, threads), max(peak_rss, rss)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await asyncio.gather(*slow_tasks, return_exceptions=True)
+    latencies = np.array(latencies) * 1000 if latencies else np.array([np.nan])
+    return {
+        'slow_connections': slow,
+        'fast_clients': args.fast,
+        'completed': int(np.isfinite(latencies).sum()),
+        'requests_per_sec': round(float(np.isfinite(latencies).sum()) / elapsed, 2),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 1),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 1),
+        'errors': errors,
+        'slow_completed': slow_stats['completed'],
+        'slow_errors': slow_stats['errors'] + slow_stats['connect_errors'],
+        'server_threads': peak_threads,
+        'server_rss_mb': round(peak_rss, 1),
+    }
+
+
+def run_target(name, photo, args):
+    env = dict(os.environ, POSTURE_HISTORY_PATH='', POSTURE_LOG_LEVEL='ERROR')
+    process = subprocess.Popen(target_command(name, args.port, args.threads), cwd=SOURCE_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(args.port, process)
+        return [asyncio.run(run_scenario(args.port, process.pid, photo, slow, args)) for slow in args.slow]
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--targets', nargs='+', choices=TARGETS, default=list(TARGETS))
+    parser.add_argument('--slow', type=int, nargs='+', default=[0, 200, 1000])
+    parser.add_argument('--fast', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--trickle-bytes', type=int, default=1024)
+    parser.add_argument('--trickle-interval', type=float, default=0.5)
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1,
+                        help='threads for serve.py and executor threads for the ASGI front end')
+    parser.add_argument('--image', default='person_480x640_q90.jpg', help='corpus image to upload')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--output', default='bench_asgi_load.json')
+    args = parser.parse_args()
+
+    # Every slow connection is a file descriptor here and in the server
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if max(args.slow) + args.fast + 64 > hard:
+        sys.exit(f'--slow needs more file descriptors than the limit of {hard}')
+
+    photo = dict(build_corpus())[args.image]
+    results = {}
+    print(f"{'target':>7} {'slow':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7} "
+          f"{'slow done':>10} {'threads':>8} {'RSS MB':>8}")
+    for name in args.targets:
+        results[name] = run_target(name, photo, args)
+        for row in results[name]:
+            print(f"{name:>7} {row['slow_connections']:>6} {row['requests_per_sec']:>8.1f} "
+                  f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {sum(row['errors'].values()):>7} "
+                  f"{row['slow_completed']:>10} {row['server_threads']:>8} {row['server_rss_mb']:>8.0f}")
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'machine': {'python': platform.python_version(), 'cpu_count': os.cpu_count()},
+            'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'targets')},
+            'results': results,
+        }, f, indent=2)
+    print(f'\nWrote {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""Compare the posture CNN's deployment formats: latency, size, memory and accuracy.
+
+Usage:
+    python benchmarks/bench_cnn_formats.py --keras posture_model.h5
+    python benchmarks/bench_cnn_formats.py --keras posture_model.h5 --threads 1 2 4 --output cnn_formats.json
+    python benchmarks/bench_cnn_formats.py --random    # untrained weights: speed, size and memory only
+
+The Keras model is exported with PostureTrainer.export_tflite into --export-dir
+as float32, float16 and int8 TFLite files. int8 is calibrated on training
+images from --dataset-dir. Each format is then measured in a fresh
+subprocess, so its memory figures cover only that runtime and model:
+
+    keras            PostureModel on the Keras file (TensorFlow)
+    tflite-float32   TFLiteModel, once per --threads value
+    tflite-float16
+    tflite-int8
+
+For each format and thread count the report gives:
+
+- file size and load time (runtime import included)
+- process RSS after warm-up, and peak RSS
+- predict_batch latency (p50/p95 per call) and images/sec per --batch-sizes
+- accuracy on the dataset's validation split
+- agreement with the Keras predictions: same class, and max |probability difference|
+
+Without a dataset, random images stand in for both calibration and
+evaluation, so only agreement with Keras is meaningful.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bench_pipeline import measure, summarize  # noqa: E402
+from posture_dataset import DATASET_DIR, PostureDataset  # noqa: E402
+
+TFLITE_FORMATS = {
+    'tflite-float32': None,
+    'tflite-float16': 'float16',
+    'tflite-int8': 'int8',
+}
+FORMATS = ('keras',) + tuple(TFLITE_FORMATS)
+
+
+def memory_mb():
+    """(current, peak) resident set size of this process in MiB"""
+    try:
+        values = {}
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    key, kib = line.split()[:2]
+                    values[key] = int(kib) / 1024
+        return round(values['VmRSS:'], 1), round(values['VmHWM:'], 1)
+    except (OSError, KeyError):
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return None, round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def measure_format(spec):
+    """Runs in the subprocess: load one format, predict the evaluation set, time predict_batch"""
+    rss_before, _ = memory_mb()
+    start = time.perf_counter()
+    if spec['format'] == 'keras':
+        from posture_model import PostureModel
+        model = PostureModel(spec['path'])
+        model.load_model()
+    else:
+        from tflite_model import TFLiteModel
+        model = TFLiteModel(spec['path'], num_threads=spec['threads'])
+    load_ms = (time.perf_counter() - start) * 1000
+
+    images = np.load(spec['eval'])['images']
+    probabilities = np.array([prediction['probability']
+                              for i in range(0, len(images), 32)
+                              for prediction in model.predict_batch(images[i:i + 32])])
+    np.save(spec['predictions'], probabilities)
+
+    latency = {}
+    for batch_size in spec['batch_sizes']:
+        batch = images[np.arange(batch_size) % len(images)]
+        stats = summarize(measure(model.predict_batch, [batch], spec['iterations'], spec['warmup']))
+        stats['images_per_sec'] = round(batch_size * 1000 / stats['mean_ms'], 1)
+        latency[str(batch_size)] = stats
+
+    rss, peak_rss = memory_mb()
+    return {
+        'load_ms': round(load_ms, 1),
+        'rss_before_load_mb': rss_before,
+        'rss_mb': rss,
+        'peak_rss_mb': peak_rss,
+        'latency': latency,
+    }
+
+
+def run_worker(spec):
+    """Measure one format in a fresh interpreter and return its result dict"""
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(spec, f)
+    try:
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), '_measure', f.name],
+                                   capture_output=True, text=True)
+    finally:
+        os.remove(f.name)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Measuring {spec['format']} failed:\n{completed.stderr[-2000:]}")
+    # The result is the last stdout line; runtimes may print before it
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def export_formats(args, representative_images):
+    """Write the Keras model and its TFLite exports to args.export_dir; returns {format: path}"""
+    from posture_training import PostureTrainer
+
+    os.makedirs(args.export_dir, exist_ok=True)
+    if args.random:
+        keras_path = os.path.join(args.export_dir, 'posture_model_random.h5')
+        model = PostureTrainer(keras_path)
+        model.model = model.build_model()
+        model.model.save(keras_path)
+    else:
+        keras_path = args.keras
+        model = PostureTrainer(keras_path)
+        model.load_model()
+
+    paths = {'keras': keras_path}
+    stem = os.path.splitext(os.path.basename(keras_path))[0]
+    for name, quantization in TFLITE_FORMATS.items():
+        if name in args.formats:
+            path = os.path.join(args.export_dir, f"{stem}_{quantization or 'float32'}.tflite")
+            paths[name] = model.export_tflite(path, quantization, representative_images=representative_images)
+    return paths
+
+
+def evaluation_data(args):
+    """(eval images uint8, eval labels or None, int8 calibration images or None)"""
+    if PostureDataset.exists(args.dataset_dir):
+        dataset = PostureDataset(args.dataset_dir)
+        _, val_idx = dataset.split()
+        val_idx = val_idx[:args.samples]
+        # None: export_tflite samples the training split itself
+        return dataset.gather(val_idx), dataset.labels[val_idx], None
+
+    print(f"No dataset in {args.dataset_dir}: using random images, accuracy is not reported")
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 256, (args.samples,) + (64, 64, 3), dtype=np.uint8)
+    calibration = rng.integers(0, 256, (100, 64, 64, 3), dtype=np.uint8).astype(np.float32) / 255
+    return images, None, calibration
+
+
+def add_quality(result, probabilities, reference, labels):
+    if labels is not None:
+        result['accuracy'] = round(float(np.mean((probabilities > 0.5) == labels)), 4)
+    if reference is not None:
+        result['agreement'] = round(float(np.mean((probabilities > 0.5) == (reference > 0.5))), 4)
+        result['max_probability_diff'] = round(float(np.max(np.abs(probabilities - reference))), 6)
+
+
+def print_table(results, batch_sizes):
+    columns = ['format', 'threads', 'size MB', 'load ms', 'RSS MB', 'peak MB']
+    columns += [f'b{b} p50 ms' for b in batch_sizes] + [f'b{batch_sizes[-1]} img/s', 'accuracy', 'agree', 'max dp']
+    rows = []
+    for r in results:
+        rows.append([r['format'], r['threads'] or '-', f"{r['size_bytes'] / 1e6:.2f}", r['load_ms'], r['rss_mb'],
+                     r['peak_rss_mb']]
+                    + [f"{r['latency'][str(b)]['p50_ms']:.2f}" for b in batch_sizes]
+                    + [r['latency'][str(batch_sizes[-1])]['images_per_sec'],
+                       r.get('accuracy', '-'), r.get('agreement', '-'), r.get('max_probability_diff', '-')])
+    widths = [max(len(str(value)) for value in column) for column in zip(columns, *rows)]
+    for row in [columns] + rows:
+        print('  '.join(str(value).rjust(width) for value, width in zip(row, widths)))
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == '_measure':
+        with open(sys.argv[2]) as f:
+            print(json.dumps(measure_format(json.load(f))))
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--keras', help='Trained Keras model to export and compare')
+    source.add_argument('--random', action='store_true', help='Use an untrained model with random weights')
+    parser.add_argument('--dataset-dir', default=DATASET_DIR)
+    parser.add_argument('--export-dir', default='cnn_exports')
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, os.cpu_count() or 1],
+                        help='TFLite interpreter thread counts to try')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 32])
+    parser.add_argument('--samples', type=int, default=1000, help='Evaluation images')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--output', default='bench_cnn_formats.json')
+    args = parser.parse_args()
+
+    images, labels, calibration = evaluation_data(args)
+    paths = export_formats(args, calibration)
+
+    results, predictions = [], {}
+    with tempfile.TemporaryDirectory() as directory:
+        eval_path = os.path.join(directory, 'eval.npz')
+        np.savez(eval_path, images=images)
+        for name in args.formats:
+            for threads in ([None] if name == 'keras' else sorted(set(args.threads))):
+                print(f"Measuring {name}" + (f" with {threads} thread(s)" if threads else '') + '...')
+                predictions_path = os.path.join(directory, f'{name}-{threads}.npy')
+                result = {'format': name, 'threads': threads, 'path': paths[name],
+                          'size_bytes': os.path.getsize(paths[name])}
+                result.update(run_worker({
+                    'format': name, 'path': paths[name], 'threads': threads, 'eval': eval_path,
+                    'predictions': predictions_path, 'batch_sizes': args.batch_sizes,
+                    'iterations': args.iterations, 'warmup': args.warmup,
+                }))
+                predictions[(name, threads)] = np.load(predictions_path)
+                results.append(result)
+
+    reference = predictions.get(('keras', None))
+    for result in results:
+        add_quality(result, predictions[(result['format'], result['threads'])], reference, labels)
+
+    print()
+    print_table(results, args.batch_sizes)
+    report = {
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpu_count': os.cpu_count(), 'numpy': np.__version__},
+        'evaluation': {'samples': len(images), 'labelled': labels is not None, 'dataset_dir': args.dataset_dir},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Benchmark the vectorised posture feature engine against the per-pose scalar code.
+
+Usage:
+    python benchmarks/bench_features.py [--sizes 1 1000 1000000] [--repeat 5]
+
+Reports the best-of-repeat wall time and the cost per pose for each batch size.
+The scalar reference (the geometry analyze_posture used to run one pose at a
+time) is only timed up to --scalar-limit poses and is also used to check that
+both implementations agree.
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from posture_features import (FEATURE_DTYPE, FEATURE_NAMES, LEFT_EAR, LEFT_HIP, LEFT_SHOULDER,  # noqa: E402
+                              RIGHT_EAR, RIGHT_HIP, RIGHT_SHOULDER, compute_features)
+
+
+def scalar_features(points):
+    """Per-pose reference implementation (signed distances, as in app.py)"""
+    def get_landmark(landmark_id):
+        return np.array([points[landmark_id, 0], points[landmark_id, 1]], dtype=np.float64)
+
+    left_shoulder = get_landmark(LEFT_SHOULDER)
+    right_shoulder = get_landmark(RIGHT_SHOULDER)
+    left_ear = get_landmark(LEFT_EAR)
+    right_ear = get_landmark(RIGHT_EAR)
+    left_hip = get_landmark(LEFT_HIP)
+    right_hip = get_landmark(RIGHT_HIP)
+
+    mid_shoulder = (left_shoulder + right_shoulder) / 2
+    mid_ear = (left_ear + right_ear) / 2
+    mid_hip = (left_hip + right_hip) / 2
+
+    neck_vector = mid_ear - mid_shoulder
+    torso_vector = mid_shoulder - mid_hip
+    norms = np.linalg.norm(neck_vector) * np.linalg.norm(torso_vector)
+    if norms > 0:
+        neck_angle = math.degrees(math.acos(np.clip(np.dot(neck_vector, torso_vector) / norms, -1, 1)))
+    else:
+        neck_angle = 90.0
+
+    return (
+        mid_ear[0] - mid_shoulder[0],
+        abs(left_shoulder[1] - right_shoulder[1]),
+        abs(math.atan2(right_ear[1] - left_ear[1], right_ear[0] - left_ear[0])),
+        mid_shoulder[0] - mid_hip[0],
+        abs(mid_ear[0] - mid_shoulder[0]) + abs(mid_shoulder[0] - mid_hip[0]),
+        neck_angle,
+    )
+
+
+def make_landmarks(n, seed=0):
+    """Random but plausible upright poses: ears above shoulders above hips"""
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0.0, 1.0, size=(n, 33, 4)).astype(np.float32)
+    for joint, y in ((LEFT_EAR, 0.2), (RIGHT_EAR, 0.2), (LEFT_SHOULDER, 0.4),
+                     (RIGHT_SHOULDER, 0.4), (LEFT_HIP, 0.8), (RIGHT_HIP, 0.8)):
+        points[:, joint, 1] = y + rng.normal(0.0, 0.03, size=n)
+    points[:, [LEFT_EAR, LEFT_SHOULDER, LEFT_HIP], 0] = 0.45 + rng.normal(0.0, 0.03, size=(n, 3))
+    points[:, [RIGHT_EAR, RIGHT_SHOULDER, RIGHT_HIP], 0] = 0.55 + rng.normal(0.0, 0.03, size=(n, 3))
+    return points
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def check_agreement(points):
+    vectorised = compute_features(points)
+    for i in range(len(points)):
+        expected = scalar_features(points[i])
+        actual = [float(vectorised[name][i]) for name in FEATURE_NAMES]
+        if not np.allclose(actual, expected, rtol=1e-4, atol=1e-4):
+            raise AssertionError(f'Mismatch at pose {i}: {actual} != {expected}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 1000, 1000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--scalar-limit', type=int, default=10000)
+    args = parser.parse_args()
+
+    check_agreement(make_landmarks(200, seed=1))
+    print('Vectorised and scalar implementations agree on 200 random poses\n')
+
+    print(f"{'N':>10} {'vectorised':>14} {'per pose':>12} {'scalar':>14} {'per pose':>12} {'speedup':>9}")
+    for n in args.sizes:
+        points = make_landmarks(n)
+        out = np.empty(n, dtype=FEATURE_DTYPE)
+
+        vec = best_time(lambda: compute_features(points, out=out), args.repeat)
+        line = f'{n:>10} {vec * 1e3:>11.3f} ms {vec / n * 1e6:>9.3f} us'
+
+        if n <= args.scalar_limit:
+            scalar = best_time(lambda: [scalar_features(p) for p in points], min(args.repeat, 3))
+            line += f' {scalar * 1e3:>11.3f} ms {scalar / n * 1e6:>9.3f} us {scalar / vec:>8.1f}x'
+        else:
+            line += f" {'skipped':>14} {'':>12} {'':>9}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
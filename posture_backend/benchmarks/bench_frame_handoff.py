@@ -0,0 +1,181 @@
+"""Compare frame hand-off to worker processes: pickled arrays vs the shared-memory ring.
+
+Usage:
+    python benchmarks/bench_frame_handoff.py
+    python benchmarks/bench_frame_handoff.py --sides 640 1280 1920 --workers 2 --clients 4
+    python benchmarks/bench_frame_handoff.py --work pose     # real MediaPipe inference in the workers
+
+For each decoded frame size (--sides: longest side in pixels, 4:3 frames
+decoded from a drawn-person JPEG) and each transport:
+
+    pickle          decode into a new array, submit(func, frame): the frame
+                    is pickled through the executor's pipe
+    shared_memory   decode into a FrameRing slot, submit(func, slot, shape):
+                    the worker wraps the slot without copying (pose_workers)
+
+the benchmark reports:
+- sequential per-frame latency (p50/p95) from upload bytes to worker result
+- throughput with --clients concurrent request threads
+- server-process CPU time per frame
+- bytes pickled per frame
+
+--work checksum (the default) sums the frame in the worker, so the numbers
+isolate the transport. --work pose runs the real pose model on it.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_pipeline import draw_scene, summarize  # noqa: E402
+from image_decode import decode_image  # noqa: E402
+from pose_workers import FrameRing, frame_landmarks, init_worker, worker_frame  # noqa: E402
+
+TRANSPORTS = ('pickle', 'shared_memory')
+
+
+def checksum_frame(frame):
+    return int(frame.sum(dtype=np.uint64))
+
+
+def checksum_slot(index, shape):
+    return checksum_frame(worker_frame(index, shape))
+
+
+def pose_slot(index, shape):
+    return frame_landmarks(worker_frame(index, shape))
+
+
+WORKER_FUNCS = {
+    ('checksum', 'pickle'): checksum_frame,
+    ('checksum', 'shared_memory'): checksum_slot,
+    ('pose', 'pickle'): frame_landmarks,
+    ('pose', 'shared_memory'): pose_slot,
+}
+
+
+def test_jpeg(side, seed=7):
+    image = draw_scene(side, side * 4 // 3, True, seed)
+    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return encoded.tobytes()
+
+
+def make_handoff(transport, work, executor, ring, side):
+    """A function that takes upload bytes through decode and hand-off to a worker result"""
+    func = WORKER_FUNCS[(work, transport)]
+    if transport == 'pickle':
+        def handoff(data):
+            frame, _ = decode_image(data, max_side=side, reuse_buffer=False)
+            return executor.submit(func, frame).result()
+    else:
+        def handoff(data):
+            with ring.acquire() as slot:
+                decode_image(data, max_side=side, out=slot.array)
+                return executor.submit(func, slot.index, slot.shape).result()
+    return handoff
+
+
+def pickled_bytes(transport, work, data, side):
+    frame, _ = decode_image(data, max_side=side, reuse_buffer=False)
+    func = WORKER_FUNCS[(work, transport)]
+    args = (frame,) if transport == 'pickle' else (0, frame.shape)
+    return len(pickle.dumps((func, args), protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def sequential(handoff, data, iterations, warmup):
+    for _ in range(warmup):
+        handoff(data)
+    samples = []
+    cpu_start = time.process_time()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        handoff(data)
+        samples.append(time.perf_counter() - start)
+    cpu_ms = (time.process_time() - cpu_start) / iterations * 1000
+    stats = summarize(samples)
+    stats['server_cpu_ms_per_frame'] = round(cpu_ms, 3)
+    return stats
+
+
+def concurrent(handoff, data, clients, frames_per_client):
+    errors = []
+
+    def client():
+        try:
+            for _ in range(frames_per_client):
+                handoff(data)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+    return round(clients * frames_per_client / elapsed, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sides', type=int, nargs='+', default=[640, 1280, 1920])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--work', choices=('checksum', 'pose'), default='checksum')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--output', default='bench_frame_handoff.json')
+    args = parser.parse_args()
+
+    ring = FrameRing(slots=max(args.clients, 2 * args.workers), slot_bytes=max(args.sides) ** 2 * 3)
+    executors = {
+        'pickle': ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context('spawn')),
+        'shared_memory': ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=init_worker, initargs=(ring.name, ring.slot_bytes)),
+    }
+    results = []
+    try:
+        print(f"{'side':>5} {'frame MB':>9} {'transport':<14} {'p50 ms':>8} {'p95 ms':>8} {'cpu ms':>7} "
+              f"{'frames/s':>9} {'pickled':>10}")
+        for side in args.sides:
+            data = test_jpeg(side)
+            for transport in TRANSPORTS:
+                handoff = make_handoff(transport, args.work, executors[transport], ring, side)
+                stats = sequential(handoff, data, args.iterations, args.warmup)
+                stats['concurrent_frames_per_sec'] = concurrent(handoff, data, args.clients,
+                                                                max(1, args.iterations // args.clients))
+                stats['pickled_bytes'] = pickled_bytes(transport, args.work, data, side)
+                frame_mb = side * (side * 3 // 4) * 3 / 1e6
+                stats.update({'side': side, 'transport': transport, 'frame_mb': round(frame_mb, 2)})
+                results.append(stats)
+                print(f"{side:>5} {frame_mb:>9.2f} {transport:<14} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} "
+                      f"{stats['server_cpu_ms_per_frame']:>7.2f} {stats['concurrent_frames_per_sec']:>9.1f} "
+                      f"{stats['pickled_bytes']:>10}")
+    finally:
+        for executor in executors.values():
+            executor.shutdown()
+        ring.close()
+
+    with open(args.output, 'w') as f:
+        json.dump({'work': args.work, 'workers': args.workers, 'clients': args.clients,
+                   'cpu_count': os.cpu_count(), 'results': results}, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark the posture history store: batched writes and trend reads.
+
+Usage:
+    python benchmarks/bench_history.py [--rows 100000] [--users 100] [--batch-sizes 1 50 500]
+
+Writes --rows synthetic analyses (spread over --users users and the last
+90 days) through HistoryStore.write in batches of each --batch-sizes value,
+each into a fresh database, and reports rows/sec. It then times
+HistoryStore.trends for one user with half and then all of its rows
+stored. Trend reads come from the rollups, so both take about as long.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from posture_features import FEATURE_NAMES  # noqa: E402
+from posture_history import HistoryStore  # noqa: E402
+
+CODES = ('forward_head', 'shoulder_imbalance', 'head_tilt', 'slouching', 'alignment', 'neck_angle')
+
+
+def make_rows(n, users, seed=0):
+    rng = np.random.default_rng(seed)
+    now = time.time()
+    timestamps = now - rng.uniform(0, 90 * 86400, size=n)
+    user_ids = rng.choice(users, size=n)
+    flags = rng.random((n, len(CODES))) < 0.3
+    rows = []
+    for i in range(n):
+        codes = [code for code, flag in zip(CODES, flags[i]) if flag]
+        rows.append((f'user-{user_ids[i]}', float(timestamps[i]), 'default',
+                     max(0.0, 100 - 16.67 * len(codes)), ','.join(codes),
+                     *rng.random(len(FEATURE_NAMES)).tolist()))
+    return rows
+
+
+def time_trends(store, user_id, repeat=50):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        store.trends(user_id)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 50, 500])
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows, args.users)
+    directory = tempfile.mkdtemp()
+    print(f"{'batch size':>10} {'rows/sec':>12} {'transactions':>13}")
+    for batch_size in args.batch_sizes:
+        # Batch size 1 is slow; time it on a slice of the rows
+        sample = rows if batch_size > 1 else rows[:min(len(rows), 2000)]
+        store = HistoryStore(os.path.join(directory, f'history-{batch_size}.sqlite3'))
+        start = time.perf_counter()
+        for offset in range(0, len(sample), batch_size):
+            store.write(sample[offset:offset + batch_size])
+        elapsed = time.perf_counter() - start
+        print(f'{batch_size:>10} {len(sample) / elapsed:>12.0f} {store.batches:>13}')
+
+    # Time the same user's trends with half and then all of its history
+    # stored: the window's buckets are full either way, so the cost should not change
+    store = HistoryStore(os.path.join(directory, 'history-trends.sqlite3'))
+    user_rows = [('heavy-user',) + row[1:] for row in make_rows(args.rows, 1, seed=1)]
+    half = len(user_rows) // 2
+    print('\ntrends() best of 50:')
+    for chunk in (user_rows[:half], user_rows[half:]):
+        for offset in range(0, len(chunk), 500):
+            store.write(chunk[offset:offset + 500])
+        count = store.trends('heavy-user')['all_time']['count']
+        print(f'  {count:>8} analyses  {time_trends(store, "heavy-user") * 1e3:.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
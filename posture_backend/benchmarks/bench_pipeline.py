@@ -0,0 +1,353 @@
+"""Reproducible latency benchmark for the posture pipeline, with a regression check.
+
+Usage:
+    python benchmarks/bench_pipeline.py corpus
+    python benchmarks/bench_pipeline.py run --output baseline.json
+    python benchmarks/bench_pipeline.py run --output current.json --baseline baseline.json
+    python benchmarks/bench_pipeline.py compare baseline.json current.json --threshold 10
+
+`corpus` renders a deterministic set of JPEGs (several resolutions and
+qualities, each with and without a person) into benchmarks/corpus/. The
+person is a drawn figure that MediaPipe detects reliably, so the corpus
+needs no downloads and is identical on every machine with the same OpenCV.
+`run` builds the corpus if needed and times each stage over it:
+
+    decode                       image_decode.decode_image
+    <app>.analyze_posture        pose inference + features on a decoded image
+    <app>.recommendations        get_posture_issues_and_recommendations
+    <app>.full_request           POST /analyze-posture through the test client
+
+for both app (app.py) and working_posture_app. The result cache is disabled
+so every request does the full work. Each stage reports p50/p95/p99/mean
+latency in milliseconds and images/sec, and results are written as JSON.
+
+`compare` (or `run --baseline`) exits with status 1 if any stage's latency
+(p50 by default) is more than --threshold percent above the baseline. Only
+compare results from the same machine.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# Keep the apps' per-request logging and the result cache out of the timings
+os.environ.setdefault('POSTURE_LOG_LEVEL', 'WARNING')
+os.environ['RESULT_CACHE_BACKEND'] = 'none'
+
+from image_decode import decode_image  # noqa: E402
+
+DEFAULT_CORPUS_DIR = os.path.join(BENCH_DIR, 'corpus')
+
+# Portrait phone-camera shapes from a small upload up to a full 12 MP photo
+RESOLUTIONS = ((480, 640), (1080, 1440), (3024, 4032))
+JPEG_QUALITIES = (60, 90)
+CORPUS_SEED = 1234
+
+BACKGROUND = (200, 205, 210)
+FLOOR = (120, 130, 140)
+SKIN = (140, 170, 215)
+SHIRT = (60, 80, 160)
+PANTS = (70, 50, 40)
+HAIR = (30, 30, 40)
+
+STAGES = ('decode', 'analyze_posture', 'recommendations', 'full_request')
+APPS = ('app', 'working_posture_app')
+
+
+def draw_scene(width, height, person, seed):
+    """Render one BGR test image: a plain room, optionally with a standing person"""
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = BACKGROUND
+    image[int(height * 0.8):] = FLOOR
+
+    if person:
+        # Figure is drawn on a 720x960 grid and scaled to the image height
+        scale = height / 960
+        center = width // 2
+
+        def at(x, y):
+            return int(center + x * scale), int(y * scale)
+
+        def px(value):
+            return max(1, int(value * scale))
+
+        for side in (-1, 1):
+            cv2.line(image, at(35 * side, 560), at(45 * side, 900), PANTS, px(55))
+        cv2.ellipse(image, at(0, 420), (px(95), px(170)), 0, 0, 360, SHIRT, -1)
+        for side in (-1, 1):
+            cv2.line(image, at(90 * side, 300), at(120 * side, 470), SHIRT, px(40))
+            cv2.line(image, at(120 * side, 470), at(125 * side, 600), SKIN, px(32))
+        cv2.line(image, at(0, 230), at(0, 270), SKIN, px(40))
+        cv2.ellipse(image, at(0, 160), (px(62), px(80)), 0, 0, 360, SKIN, -1)
+        cv2.ellipse(image, at(0, 105), (px(64), px(40)), 0, 180, 360, HAIR, -1)
+        for side in (-1, 1):
+            cv2.circle(image, at(22 * side, 150), px(7), (255, 255, 255), -1)
+            cv2.circle(image, at(22 * side, 150), px(4), (40, 30, 20), -1)
+            cv2.line(image, at(22 * side - 12, 135), at(22 * side + 12, 135), HAIR, px(4))
+            cv2.ellipse(image, at(62 * side, 160), (px(10), px(18)), 0, 0, 360, SKIN, -1)
+        cv2.line(image, at(0, 155), at(-5, 180), (110, 135, 180), px(4))
+        cv2.ellipse(image, at(0, 200), (px(18), px(7)), 0, 0, 180, (80, 80, 170), px(4))
+
+    # Sensor-like noise so JPEG sizes and decode work resemble real photos
+    noise = np.random.default_rng(seed).integers(-6, 7, size=image.shape, dtype=np.int16)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def build_corpus(directory=DEFAULT_CORPUS_DIR):
+    """Write the corpus (if missing) and return [(name, bytes)] in a fixed order"""
+    os.makedirs(directory, exist_ok=True)
+    corpus = []
+    for index, (width, height) in enumerate(RESOLUTIONS):
+        for person in (True, False):
+            image = None
+            for quality in JPEG_QUALITIES:
+                name = f"{'person' if person else 'empty'}_{width}x{height}_q{quality}.jpg"
+                path = os.path.join(directory, name)
+                if not os.path.exists(path):
+                    if image is None:
+                        image = draw_scene(width, height, person, CORPUS_SEED + index)
+                    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                    if not ok:
+                        raise RuntimeError(f'Could not encode {name}')
+                    with open(path, 'wb') as f:
+                        f.write(encoded.tobytes())
+                with open(path, 'rb') as f:
+                    corpus.append((name, f.read()))
+    return corpus
+
+
+def corpus_digest(corpus):
+    digest = hashlib.sha256()
+    for name, data in corpus:
+        digest.update(name.encode())
+        digest.update(hashlib.sha256(data).digest())
+    return digest.hexdigest()
+
+
+def summarize(samples):
+    """Latency percentiles (ms) and throughput for a list of per-image times (s)"""
+    times = np.asarray(samples, dtype=np.float64)
+    p50, p95, p99 = np.percentile(times, [50, 95, 99]) * 1000
+    return {
+        'count': len(times),
+        'p50_ms': round(float(p50), 6),
+        'p95_ms': round(float(p95), 6),
+        'p99_ms': round(float(p99), 6),
+        'mean_ms': round(float(times.mean() * 1000), 6),
+        'images_per_sec': round(len(times) / float(times.sum()), 2),
+    }
+
+
+def measure(func, inputs, iterations, warmup, batch=1):
+    """Call func on each input round-robin; return the per-call times of the timed calls.
+
+    With batch > 1 each sample is the mean over `batch` consecutive calls on
+    the same input, for stages too fast to time one call at a time.
+    """
+    for i in range(warmup):
+        func(inputs[i % len(inputs)])
+    samples = []
+    for i in range(iterations):
+        item = inputs[i % len(inputs)]
+        start = time.perf_counter()
+        for _ in range(batch):
+            func(item)
+        samples.append((time.perf_counter() - start) / batch)
+    return samples
+
+
+def load_app(app_name):
+    """Import one of the apps and return (module, flask_app) with a warm pose pool"""
+    if app_name == 'app':
+        import app as module
+        flask_app = module.app
+    else:
+        import working_posture_app as module
+        flask_app = module.create_app({'WARM_UP': False, 'RESULT_CACHE_BACKEND': 'none'})
+    module.pose_pool.warm_up()
+    return module, flask_app
+
+
+def multipart_body(name, data):
+    """Pre-encode an upload so client-side encoding isn't part of the measurement"""
+    from werkzeug.datastructures import FileStorage
+    from werkzeug.test import encode_multipart
+
+    upload = FileStorage(io.BytesIO(data), filename=name, content_type='image/jpeg')
+    boundary, body = encode_multipart({'photo': upload})
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def run_benchmarks(corpus, apps, stages, iterations, warmup):
+    results = {}
+    person_images = [(name, data) for name, data in corpus if name.startswith('person')]
+
+    if 'decode' in stages:
+        results['decode'] = summarize(measure(lambda item: decode_image(item[1]), corpus,
+                                              iterations, warmup))
+
+    for app_name in apps:
+        module, flask_app = load_app(app_name)
+
+        if 'analyze_posture' in stages or 'recommendations' in stages:
+            # Decode once up front; copies because decode_image reuses its buffer
+            decoded = [decode_image(data, reuse_buffer=False)[0] for _, data in corpus]
+            if 'analyze_posture' in stages:
+                results[f'{app_name}.analyze_posture'] = summarize(
+                    measure(module.analyze_posture, decoded, iterations, warmup))
+
+            if 'recommendations' in stages:
+                analyses = [module.analyze_posture(decode_image(data, reuse_buffer=False)[0])[0]
+                            for _, data in person_images]
+                analyses = [analysis for analysis in analyses if analysis is not None]
+                if not analyses:
+                    raise RuntimeError('No pose detected in any person image of the corpus')
+                # Microsecond-scale, so each sample averages 1000 calls
+                results[f'{app_name}.recommendations'] = summarize(
+                    measure(module.get_posture_issues_and_recommendations, analyses,
+                            iterations, warmup, batch=1000))
+
+        if 'full_request' in stages:
+            client = flask_app.test_client()
+            bodies = [multipart_body(name, data) for name, data in corpus]
+
+            # A benchmark of error responses would look great and mean nothing
+            for (name, _), (body, content_type) in zip(corpus, bodies):
+                response = client.post('/analyze-posture', data=body, content_type=content_type)
+                expected = 200 if name.startswith('person') else 400
+                if response.status_code != expected:
+                    raise RuntimeError(f'{app_name}: {name} returned {response.status_code}, '
+                                       f'expected {expected}: {response.get_data(as_text=True)[:200]}')
+
+            def post(item):
+                body, content_type = item
+                client.post('/analyze-posture', data=body, content_type=content_type)
+
+            results[f'{app_name}.full_request'] = summarize(
+                measure(post, bodies, iterations, warmup))
+
+    return results
+
+
+def environment_info():
+    import mediapipe
+    import flask
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'mediapipe': mediapipe.__version__,
+        'flask': flask.__version__,
+    }
+
+
+def compare(baseline, current, threshold, metric='p50_ms'):
+    """Print a per-stage comparison; return the names of stages that regressed"""
+    regressions = []
+    print(f"{'stage':<38} {'baseline':>11} {'current':>11} {'change':>9}")
+    for stage, stats in current['stages'].items():
+        base = baseline['stages'].get(stage)
+        if base is None:
+            print(f'{stage:<38} {"-":>11} {stats[metric]:>8.4f} ms {"new":>9}')
+            continue
+        change = (stats[metric] - base[metric]) / base[metric] * 100 if base[metric] else 0.0
+        flag = ''
+        if change > threshold:
+            regressions.append(stage)
+            flag = '  REGRESSION'
+        print(f'{stage:<38} {base[metric]:>8.4f} ms {stats[metric]:>8.4f} ms {change:>+8.1f}%{flag}')
+    return regressions
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def check_against(baseline_path, current, threshold, metric):
+    baseline = load_results(baseline_path)
+    if baseline.get('corpus_sha256') != current.get('corpus_sha256'):
+        print('Warning: baseline was measured on a different corpus')
+    regressions = compare(baseline, current, threshold, metric)
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) slower than baseline by more than {threshold}%: "
+              f"{', '.join(regressions)}")
+        return 1
+    print(f'\nNo stage slower than baseline by more than {threshold}%')
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    corpus_parser = subparsers.add_parser('corpus', help='Write the test image corpus')
+    corpus_parser.add_argument('--corpus', default=DEFAULT_CORPUS_DIR)
+
+    run_parser = subparsers.add_parser('run', help='Run the benchmarks')
+    run_parser.add_argument('--corpus', default=DEFAULT_CORPUS_DIR)
+    run_parser.add_argument('--output', default='bench_pipeline.json')
+    run_parser.add_argument('--iterations', type=int, default=60,
+                            help='Timed samples per stage')
+    run_parser.add_argument('--warmup', type=int, default=6)
+    run_parser.add_argument('--apps', nargs='+', choices=APPS, default=list(APPS))
+    run_parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    run_parser.add_argument('--baseline', help='Compare against this result file after the run')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+
+    for sub in (run_parser, compare_parser):
+        sub.add_argument('--threshold', type=float, default=10.0,
+                         help='Allowed slowdown in percent before a stage counts as a regression')
+        sub.add_argument('--metric', choices=('p50_ms', 'p95_ms', 'p99_ms', 'mean_ms'), default='p50_ms')
+
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        sys.exit(check_against(args.baseline, load_results(args.current), args.threshold, args.metric))
+
+    corpus = build_corpus(args.corpus)
+    if args.command == 'corpus':
+        print(f'{len(corpus)} images in {args.corpus}')
+        return
+
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': environment_info(),
+        'corpus_sha256': corpus_digest(corpus),
+        'corpus': [{'name': name, 'bytes': len(data)} for name, data in corpus],
+        'iterations': args.iterations,
+        'warmup': args.warmup,
+        'stages': run_benchmarks(corpus, args.apps, args.stages, args.iterations, args.warmup),
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{'stage':<38} {'p50':>10} {'p95':>10} {'p99':>10} {'img/s':>10}")
+    for stage, stats in results['stages'].items():
+        print(f"{stage:<38} {stats['p50_ms']:>7.4f} ms {stats['p95_ms']:>7.4f} ms "
+              f"{stats['p99_ms']:>7.4f} ms {stats['images_per_sec']:>10.1f}")
+    print(f'\nResults written to {args.output}')
+
+    if args.baseline:
+        print()
+        sys.exit(check_against(args.baseline, results, args.threshold, args.metric))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark the compiled rule table against the per-pose threshold if-chain.
+
+Usage:
+    python benchmarks/bench_rules.py [--sizes 1 10000 100000 1000000] [--repeat 5]
+
+Reports the best-of-repeat wall time of RuleTable.evaluate and the cost per
+pose for each batch size. The scalar reference (the thresholds and score
+arithmetic the app used before the rule engine) is only timed up to
+--scalar-limit poses and is also used to check that both agree.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bench_features import best_time, make_landmarks  # noqa: E402
+from posture_features import FEATURE_DTYPE, compute_features  # noqa: E402
+from posture_rules import RuleTable  # noqa: E402
+
+THRESHOLDS = {
+    'forward_head_distance': 0.08,
+    'shoulder_imbalance': 0.05,
+    'head_tilt': 0.2,
+    'slouch_distance': 0.05,
+    'total_misalignment': 0.12,
+    'neck_angle_deviation': 25,
+}
+
+
+def scalar_rules(row):
+    """Per-pose reference: the if-chain and score the default rules replace"""
+    flags = (
+        1 if abs(float(row['forward_head_distance'])) > THRESHOLDS['forward_head_distance'] else 0,
+        1 if float(row['shoulder_imbalance']) > THRESHOLDS['shoulder_imbalance'] else 0,
+        1 if float(row['head_tilt']) > THRESHOLDS['head_tilt'] else 0,
+        1 if abs(float(row['slouch_distance'])) > THRESHOLDS['slouch_distance'] else 0,
+        1 if float(row['total_misalignment']) > THRESHOLDS['total_misalignment'] else 0,
+        1 if abs(float(row['neck_angle']) - 90) > THRESHOLDS['neck_angle_deviation'] else 0,
+    )
+    return flags, max(0, 100 - sum(flags) * 16.67)
+
+
+def check_agreement(table, features):
+    evaluation = table.evaluate(features)
+    for i in range(len(features)):
+        flags, score = scalar_rules(features[i])
+        if tuple(int(flag) for flag in evaluation.flags[i]) != flags \
+                or not np.isclose(evaluation.scores[i], score):
+            raise AssertionError(f'Mismatch at pose {i}: {evaluation.flags[i]} != {flags}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--scalar-limit', type=int, default=10000)
+    args = parser.parse_args()
+
+    table = RuleTable()
+    sample = compute_features(make_landmarks(5000, seed=1))
+    check_agreement(table, sample)
+    rates = table.evaluate(sample).flags.mean(axis=0)
+    print(f'Rule table and scalar if-chain agree on {len(sample)} random poses')
+    print('Flag rate per rule: ' + ', '.join(f'{code} {rate:.1%}' for code, rate in zip(table.codes, rates)) + '\n')
+
+    print(f"{'N':>10} {'rule table':>14} {'per pose':>12} {'scalar':>14} {'per pose':>12} {'speedup':>9}")
+    for n in args.sizes:
+        features = np.empty(n, dtype=FEATURE_DTYPE)
+        compute_features(make_landmarks(n), out=features)
+
+        vec = best_time(lambda: table.evaluate(features), args.repeat)
+        line = f'{n:>10} {vec * 1e3:>11.3f} ms {vec / n * 1e6:>9.3f} us'
+
+        if n <= args.scalar_limit:
+            scalar = best_time(lambda: [scalar_rules(row) for row in features], min(args.repeat, 3))
+            line += f' {scalar * 1e3:>11.3f} ms {scalar / n * 1e6:>9.3f} us {scalar / vec:>8.1f}x'
+        else:
+            line += f" {'skipped':>14} {'':>12} {'':>9}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""Cold-start benchmark: import time, memory and heavy modules loaded by each entry point.
+
+Usage:
+    python benchmarks/bench_startup.py --output startup.json
+    python benchmarks/bench_startup.py --output current.json --baseline startup.json
+    python benchmarks/bench_startup.py --importtime working_posture_app
+
+Each target runs --repeat times in a fresh interpreter (cwd is --source-dir,
+the posture_backend directory by default). The report gives wall time (p50,
+min and max), RSS after the import, peak RSS and the module count. It also
+lists which heavy modules were loaded: pandas, sklearn, tensorflow, keras,
+mediapipe, PIL, requests.
+
+Serving entry points must not load the training stack. They also must not
+load mediapipe before the pose pool warms up. A target that loads one of
+its FORBIDDEN modules fails the run (exit status 1), whatever the timings.
+With --baseline, a target whose p50 time is more than --threshold percent
+above the baseline also fails the run.
+
+--importtime prints the slowest imports of one target, by cumulative time,
+from `python -X importtime`.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_pipeline import check_against  # noqa: E402
+
+HEAVY_MODULES = ('pandas', 'sklearn', 'tensorflow', 'keras', 'mediapipe', 'PIL', 'requests')
+TRAINING_MODULES = ('pandas', 'sklearn', 'tensorflow', 'keras', 'posture_training')
+
+# name: (code run in the fresh interpreter, modules it must not load)
+TARGETS = {
+    'posture_model': ('import posture_model', TRAINING_MODULES),
+    'tflite_model': ('import tflite_model', TRAINING_MODULES),
+    'app': ('import app', TRAINING_MODULES + ('mediapipe',)),
+    'working_posture_app': ('import working_posture_app', TRAINING_MODULES + ('mediapipe',)),
+    'working_posture_app.create_app': (
+        "import working_posture_app; working_posture_app.create_app({'WARM_UP': False})",
+        TRAINING_MODULES + ('mediapipe',)),
+    # Where the deferred cost goes: MediaPipe loads while the pose pool warms
+    # up, and MediaPipe itself imports TensorFlow when it is installed
+    'working_posture_app.warm_up': (
+        "import working_posture_app; working_posture_app.create_app({'WARM_UP': True})",
+        ('posture_training',)),
+    'posture_training': ('import posture_training', ()),
+}
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+exec(compile(sys.argv[1], '<target>', 'exec'))
+elapsed = time.perf_counter() - start
+status = {}
+try:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(('VmRSS:', 'VmHWM:')):
+                status[line.split(':')[0]] = int(line.split()[1]) / 1024
+except OSError:
+    pass  # Memory is only reported on Linux
+print(json.dumps({
+    'seconds': elapsed,
+    'rss_mb': status.get('VmRSS'),
+    'peak_rss_mb': status.get('VmHWM'),
+    'modules': len(sys.modules),
+    'loaded': sorted(m for m in sys.modules if '.' not in m),
+}))
+'''
+
+
+def run_target(code, source_dir):
+    completed = subprocess.run([sys.executable, '-c', CHILD, code], cwd=source_dir,
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{code!r} failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _median(values):
+    values = [value for value in values if value is not None]
+    return round(float(np.median(values)), 1) if values else None
+
+
+def measure_target(code, forbidden, source_dir, repeat):
+    runs = [run_target(code, source_dir) for _ in range(repeat)]
+    times = np.array([run['seconds'] for run in runs]) * 1000
+    loaded = set(runs[-1]['loaded'])
+    return {
+        'code': code,
+        'p50_ms': round(float(np.median(times)), 1),
+        'min_ms': round(float(times.min()), 1),
+        'max_ms': round(float(times.max()), 1),
+        'rss_mb': _median(run['rss_mb'] for run in runs),
+        'peak_rss_mb': _median(run['peak_rss_mb'] for run in runs),
+        'modules': runs[-1]['modules'],
+        'heavy_modules': [name for name in HEAVY_MODULES if name in loaded],
+        'forbidden_loaded': [name for name in forbidden if name in loaded],
+    }
+
+
+def import_time_report(code, source_dir, top=25):
+    """The top-level imports with the largest cumulative time, from -X importtime"""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=source_dir,
+                               capture_output=True, text=True)
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        # Nesting depth is the indentation of the module name, two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(cumulative_us), int(self_us), depth, name.strip()))
+    top_level = sorted((row for row in rows if row[2] <= 1), reverse=True)[:top]
+    return [{'module': name, 'cumulative_ms': round(cumulative / 1000, 1), 'self_ms': round(self_us / 1000, 1)}
+            for cumulative, self_us, depth, name in top_level]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source-dir', default=os.path.dirname(BENCH_DIR),
+                        help='Directory holding the modules to import (e.g. an older checkout)')
+    parser.add_argument('--targets', nargs='+', choices=TARGETS, default=list(TARGETS))
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters per target')
+    parser.add_argument('--output', default='bench_startup.json')
+    parser.add_argument('--baseline', help='Compare p50 times against this result file')
+    parser.add_argument('--threshold', type=float, default=20.0,
+                        help='Allowed slowdown in percent before a target counts as a regression')
+    parser.add_argument('--importtime', choices=TARGETS, help='Only print the import-time report of this target')
+    args = parser.parse_args()
+
+    if args.importtime:
+        print(f"{'module':<40} {'cumulative ms':>14} {'self ms':>9}")
+        for row in import_time_report(TARGETS[args.importtime][0], args.source_dir):
+            print(f"{row['module']:<40} {row['cumulative_ms']:>14.1f} {row['self_ms']:>9.1f}")
+        return
+
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpu_count': os.cpu_count()},
+        'stages': {},
+    }
+    print(f"{'target':<32} {'p50 ms':>9} {'min ms':>9} {'RSS MB':>8} {'modules':>8}  heavy modules")
+    violations = []
+    for name in args.targets:
+        code, forbidden = TARGETS[name]
+        stats = measure_target(code, forbidden, args.source_dir, args.repeat)
+        results['stages'][name] = stats
+        print(f"{name:<32} {stats['p50_ms']:>9.1f} {stats['min_ms']:>9.1f} {stats['rss_mb'] or 0:>8.1f} "
+              f"{stats['modules']:>8}  {', '.join(stats['heavy_modules']) or '-'}")
+        if stats['forbidden_loaded']:
+            violations.append(f"{name} loads {', '.join(stats['forbidden_loaded'])}")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    status = 0
+    if violations:
+        print('\nForbidden imports:\n  ' + '\n  '.join(violations))
+        status = 1
+    if args.baseline:
+        print()
+        status = check_against(args.baseline, results, args.threshold, 'p50_ms') or status
+    sys.exit(status)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""Check the NumPy TF.js engine (tfjs_model) against Keras and time it.
+
+Usage:
+    python benchmarks/check_tfjs_parity.py                 # against Keras, if TensorFlow is installed
+    python benchmarks/check_tfjs_parity.py --reference numpy
+    python benchmarks/check_tfjs_parity.py --model model.json --timing-only
+
+Builds the PostureTrainer.build_model architecture with random weights. The BatchNorm
+statistics are randomised too, including negative gammas, so every folding
+path runs. The model is exported in the TF.js layers format (model.json plus
+weight shards split mid-tensor), loaded back with TFJSModel, and its outputs
+are compared with the reference on random inputs. With --reference numpy
+the reference is a plain, unfolded NumPy implementation of each layer, so
+the check also runs without TensorFlow. Exits with status 1 if any output
+differs by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tfjs_model import TFJSModel  # noqa: E402
+
+SHARD_BYTES = 4 * 1024 * 1024
+
+
+def posture_layers():
+    """Layer configs of PostureTrainer.build_model, in the Keras 3 TF.js topology format"""
+    layers = [{'class_name': 'InputLayer', 'config': {'name': 'input_layer', 'batch_shape': [None, 64, 64, 3]}}]
+    for block, filters in enumerate((32, 64, 128)):
+        suffix = f'_{block}' if block else ''
+        layers += [
+            {'class_name': 'Conv2D', 'config': {'name': f'conv2d{suffix}', 'filters': filters, 'kernel_size': [3, 3],
+                                                'strides': [1, 1], 'padding': 'same', 'activation': 'relu'}},
+            {'class_name': 'BatchNormalization', 'config': {'name': f'batch_normalization{suffix}', 'axis': -1,
+                                                            'epsilon': 0.001}},
+            {'class_name': 'MaxPooling2D', 'config': {'name': f'max_pooling2d{suffix}', 'pool_size': [2, 2],
+                                                      'strides': [2, 2], 'padding': 'valid'}},
+            {'class_name': 'Dropout', 'config': {'name': f'dropout{suffix}', 'rate': 0.25}},
+        ]
+    layers += [
+        {'class_name': 'Flatten', 'config': {'name': 'flatten'}},
+        {'class_name': 'Dense', 'config': {'name': 'dense', 'units': 128, 'activation': 'relu'}},
+        {'class_name': 'Dropout', 'config': {'name': 'dropout_3', 'rate': 0.5}},
+        {'class_name': 'Dense', 'config': {'name': 'dense_1', 'units': 64, 'activation': 'relu'}},
+        {'class_name': 'Dropout', 'config': {'name': 'dropout_4', 'rate': 0.5}},
+        {'class_name': 'Dense', 'config': {'name': 'dense_2', 'units': 1, 'activation': 'sigmoid'}},
+    ]
+    return layers
+
+
+def random_weights(layers, rng):
+    """He-scaled kernels, non-trivial biases and BatchNorm statistics (some gammas negative)"""
+    weights = {}
+    channels, flat = 3, None
+    for layer in layers:
+        config = layer['config']
+        name = config['name']
+        if layer['class_name'] == 'Conv2D':
+            fan_in = 9 * channels
+            weights[f'{name}/kernel'] = rng.normal(0, np.sqrt(2 / fan_in), (3, 3, channels, config['filters']))
+            weights[f'{name}/bias'] = rng.normal(0, 0.05, config['filters'])
+            channels = config['filters']
+        elif layer['class_name'] == 'BatchNormalization':
+            gamma = rng.uniform(0.5, 1.5, channels)
+            gamma[rng.random(channels) < 0.1] *= -1
+            weights[f'{name}/gamma'] = gamma
+            weights[f'{name}/beta'] = rng.normal(0, 0.1, channels)
+            weights[f'{name}/moving_mean'] = rng.uniform(0, 0.5, channels)
+            weights[f'{name}/moving_variance'] = rng.uniform(0.05, 0.5, channels)
+        elif layer['class_name'] == 'Flatten':
+            flat = 8 * 8 * channels
+        elif layer['class_name'] == 'Dense':
+            fan_in = flat
+            weights[f'{name}/kernel'] = rng.normal(0, np.sqrt(2 / fan_in), (fan_in, config['units']))
+            weights[f'{name}/bias'] = rng.normal(0, 0.05, config['units'])
+            flat = config['units']
+    return {name: value.astype(np.float32) for name, value in weights.items()}
+
+
+def write_tfjs(directory, topology, weights):
+    """Write model.json and weight shards split every SHARD_BYTES, like the TF.js converter"""
+    specs, buffer = [], bytearray()
+    for name, value in weights.items():
+        specs.append({'name': name, 'shape': list(value.shape), 'dtype': 'float32'})
+        buffer += np.ascontiguousarray(value, dtype='<f4').tobytes()
+
+    count = max(1, -(-len(buffer) // SHARD_BYTES))
+    paths = [f'group1-shard{i + 1}of{count}.bin' for i in range(count)]
+    for i, path in enumerate(paths):
+        with open(os.path.join(directory, path), 'wb') as f:
+            f.write(buffer[i * SHARD_BYTES:(i + 1) * SHARD_BYTES])
+
+    model_path = os.path.join(directory, 'model.json')
+    with open(model_path, 'w') as f:
+        json.dump({'format': 'layers-model', 'modelTopology': topology,
+                   'weightsManifest': [{'paths': paths, 'weights': specs}]}, f)
+    return model_path
+
+
+def numpy_reference(layers, weights, x):
+    """Straightforward per-layer forward pass: no folding, no op reordering"""
+    x = x.astype(np.float64)
+    for layer in layers:
+        config = layer['config']
+        name = config['name']
+        kind = layer['class_name']
+        if kind == 'Conv2D':
+            kernel = weights[f'{name}/kernel'].astype(np.float64)
+            padded = np.pad(x, ((0, 0), (1, 1), (1, 1), (0, 0)))
+            h, w = x.shape[1:3]
+            out = np.zeros(x.shape[:3] + (kernel.shape[3],))
+            for i in range(3):
+                for j in range(3):
+                    out += np.einsum('nhwc,cf->nhwf', padded[:, i:i + h, j:j + w], kernel[i, j])
+            x = np.maximum(out + weights[f'{name}/bias'], 0)
+        elif kind == 'BatchNormalization':
+            x = ((x - weights[f'{name}/moving_mean']) / np.sqrt(weights[f'{name}/moving_variance'] + 0.001)
+                 * weights[f'{name}/gamma'] + weights[f'{name}/beta'])
+        elif kind == 'MaxPooling2D':
+            n, h, w, c = x.shape
+            x = x.reshape(n, h // 2, 2, w // 2, 2, c).max(axis=(2, 4))
+        elif kind == 'Flatten':
+            x = x.reshape(len(x), -1)
+        elif kind == 'Dense':
+            x = x @ weights[f'{name}/kernel'] + weights[f'{name}/bias']
+            x = np.maximum(x, 0) if config['activation'] == 'relu' else 1 / (1 + np.exp(-x))
+    return x
+
+
+def keras_reference(weights, x):
+    """Outputs of the real PostureModel architecture in Keras with the same weights"""
+    from posture_training import PostureTrainer
+
+    model = PostureTrainer().build_model()
+    for layer in model.layers:
+        values = [weights.get(f'{layer.name}/{variable.name.split("/")[-1].split(":")[0]}')
+                  for variable in layer.weights]
+        if values and all(value is not None for value in values):
+            layer.set_weights(values)
+    return model.predict(x, verbose=0)
+
+
+def time_model(model, batch_sizes, repeat=5):
+    rng = np.random.default_rng(0)
+    for n in batch_sizes:
+        x = rng.random((n,) + model.input_shape, dtype=np.float32)
+        model.forward(x)
+        best = min(_timed(model.forward, x) for _ in range(repeat))
+        print(f'  batch {n:>4}: {best * 1e3:8.2f} ms  ({best / n * 1e3:.3f} ms/image, {n / best:8.1f} images/s)')
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reference', choices=('keras', 'numpy'), default='keras')
+    parser.add_argument('--samples', type=int, default=16)
+    parser.add_argument('--tolerance', type=float, default=1e-4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--model', help='Only time this model.json instead of a random one')
+    parser.add_argument('--timing-only', action='store_true')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    args = parser.parse_args()
+
+    if args.model:
+        start = time.perf_counter()
+        model = TFJSModel.load(args.model)
+        print(f'Loaded {args.model} in {(time.perf_counter() - start) * 1e3:.1f} ms: {", ".join(model.describe())}')
+        time_model(model, args.batch_sizes)
+        return
+
+    rng = np.random.default_rng(args.seed)
+    layers = posture_layers()
+    weights = random_weights(layers, rng)
+
+    with tempfile.TemporaryDirectory() as directory:
+        topology = {'keras_version': '3', 'model_config': {'class_name': 'Functional', 'config': {'layers': layers}}}
+        model_path = write_tfjs(directory, topology, weights)
+        start = time.perf_counter()
+        model = TFJSModel.load(model_path)
+        load_ms = (time.perf_counter() - start) * 1e3
+    print(f'Loaded random model in {load_ms:.1f} ms as: {", ".join(model.describe())}')
+
+    if not args.timing_only:
+        x = rng.random((args.samples, 64, 64, 3), dtype=np.float32)
+        if args.reference == 'keras':
+            expected = keras_reference(weights, x)
+        else:
+            expected = numpy_reference(layers, weights, x)
+        actual = model.forward(x)
+        difference = float(np.max(np.abs(actual.reshape(expected.shape) - expected)))
+        print(f'Max |difference| vs {args.reference} over {args.samples} inputs: {difference:.2e} '
+              f'(outputs span {float(expected.min()):.3f}..{float(expected.max()):.3f})')
+        if not difference <= args.tolerance:
+            print(f'FAIL: exceeds tolerance {args.tolerance}')
+            sys.exit(1)
+        print('OK')
+
+    print('Forward pass timing:')
+    time_model(model, args.batch_sizes)
+
+
+if __name__ == '__main__':
+    main()
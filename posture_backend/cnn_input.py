@@ -0,0 +1,41 @@
+"""Input preparation and output formatting shared by the posture CNN backends.
+
+NumPy and OpenCV only, so the TensorFlow-free backends can use it without
+importing posture_model.
+"""
+import cv2
+import numpy as np
+
+INPUT_SIZE = (64, 64)
+
+
+def prepare_batch(images, height=INPUT_SIZE[0], width=INPUT_SIZE[1]):
+    """Resize RGB images (uint8, or float in [0, 1]) into one uint8 (N, height, width, 3) batch"""
+    if isinstance(images, np.ndarray) and images.dtype == np.uint8 and images.shape[1:] == (height, width, 3):
+        return images
+
+    batch = np.empty((len(images), height, width, 3), dtype=np.uint8)
+    for i, image in enumerate(images):
+        if image.dtype != np.uint8:
+            image = (image * 255 if image.max() <= 1.0 else image).astype(np.uint8)
+        if image.shape[:2] == (height, width):
+            batch[i] = image
+        else:
+            # Area averaging is the antialiased downscale, like PIL's resize in training
+            cv2.resize(image, (width, height), dst=batch[i], interpolation=cv2.INTER_AREA)
+    return batch
+
+
+def normalise(batch):
+    """uint8 batch -> float32 in [0, 1], in one pass over the whole batch"""
+    return np.divide(batch, np.float32(255), dtype=np.float32)
+
+
+def prediction_to_dict(prediction):
+    """Format one sigmoid output the way the API reports ml_prediction"""
+    return {
+        'probability': float(prediction),
+        'binary_prediction': int(prediction > 0.5),
+        'posture_quality': 'Good' if prediction > 0.5 else 'Poor',
+        'confidence': float(abs(prediction - 0.5) * 2)  # Distance from 0.5, scaled to 0-1
+    }
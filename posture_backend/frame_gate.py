@@ -0,0 +1,142 @@
+"""Near-duplicate frame gate: reuse a client's last result for an unchanged scene.
+
+In auto mode the phone sits still and uploads nearly identical frames a few
+seconds apart. The gate keeps a signature of each client's last analysed
+frame. The frame is decoded at 1/8 scale in grayscale (libjpeg skips most of
+the IDCT work) and area-averaged down to a 32x32 thumbnail. The thumbnail is
+normalised to zero mean and a standard deviation of 64, so exposure and gain
+changes cancel out.
+
+Two frames differ by the largest change of any one cell. Averaging each
+cell over a few thousand pixels removes sensor noise and JPEG artefacts.
+Someone moving their head or shoulders changes the cells those cover a lot,
+however still the rest of the frame is. A whole-frame hash averages such a
+local change away.
+
+When a new frame is within FRAME_GATE_DISTANCE of the client's last one, was
+analysed with the same parameters, and that analysis is younger than
+FRAME_GATE_MAX_AGE seconds, the previous analysis is returned instead of
+running decode and pose. The age limit forces a fresh inference now and
+then, so slow drift is never hidden for long. FRAME_GATE_MAX_AGE=0 disables
+the gate.
+
+The default distance comes from the benchmark corpus people, at full, 1/4
+and 1/10 contrast:
+- re-encoding, Gaussian noise (sigma 8), a +15 exposure offset and a 10%
+  gain change: at most 20;
+- the top third of the frame (head and shoulders) shifted 15 px at 1080 px
+  wide, or rotated 2 degrees: at least 40.
+
+The gate lives in process memory (1 KB per client), bounded to
+FRAME_GATE_MAX_CLIENTS clients (least recently seen are dropped).
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FRAME_GATE_DISTANCE = int(os.environ.get('FRAME_GATE_DISTANCE', 32))
+FRAME_GATE_MAX_AGE = float(os.environ.get('FRAME_GATE_MAX_AGE', 30))
+FRAME_GATE_MAX_CLIENTS = int(os.environ.get('FRAME_GATE_MAX_CLIENTS', 10000))
+
+GATE_OUTCOMES = ('reused', 'changed', 'expired', 'new')
+
+SIGNATURE_SIZE = 32
+# Normalised thumbnail standard deviation; distances are in these units
+SIGNATURE_SCALE = 64
+
+
+def frame_signature(data):
+    """Normalised 32x32 grayscale thumbnail of encoded image bytes, or None if they can't be decoded"""
+    gray = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if gray is None:
+        return None
+    small = cv2.resize(gray, (SIGNATURE_SIZE, SIGNATURE_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32)
+    # A flat frame has no contrast to normalise; keep its small differences small
+    small = (small - small.mean()) * (SIGNATURE_SCALE / max(float(small.std()), 1.0))
+    return np.rint(small).astype(np.int16)
+
+
+def signature_distance(a, b):
+    """Largest change of any one thumbnail cell between two signatures"""
+    return int(np.abs(a - b).max())
+
+
+class FrameGate:
+    """Per-client last frame signature and analysis, with reuse counters"""
+
+    def __init__(self, max_distance=FRAME_GATE_DISTANCE, max_age=FRAME_GATE_MAX_AGE,
+                 max_clients=FRAME_GATE_MAX_CLIENTS):
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.max_clients = max_clients
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.outcomes = dict.fromkeys(GATE_OUTCOMES, 0)
+        self.saved_seconds = 0.0
+
+    @property
+    def enabled(self):
+        return self.max_age > 0
+
+    def lookup(self, client_id, signature, params):
+        """(analysis, info) for a frame; analysis is None unless the last one can be reused.
+
+        info holds the outcome (one of GATE_OUTCOMES), the distance to the
+        client's last frame and, when reused, the age of that analysis.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(client_id)
+            if entry is not None:
+                self._entries.move_to_end(client_id)
+            if entry is None or entry['params'] != params:
+                outcome, distance = 'new', None
+            else:
+                distance = signature_distance(signature, entry['signature'])
+                if distance > self.max_distance:
+                    outcome = 'changed'
+                elif now - entry['analysed_at'] > self.max_age:
+                    outcome = 'expired'
+                else:
+                    outcome = 'reused'
+                    self.saved_seconds += entry['cost']
+            self.outcomes[outcome] += 1
+
+        info = {'outcome': outcome, 'distance': distance}
+        if outcome != 'reused':
+            return None, info
+        info['age_s'] = round(now - entry['analysed_at'], 2)
+        return entry['analysis'], info
+
+    def store(self, client_id, signature, params, analysis, cost):
+        """Remember a freshly analysed frame; `cost` is what its analysis took (seconds)"""
+        with self._lock:
+            self._entries[client_id] = {
+                'signature': signature,
+                'params': params,
+                'analysis': analysis,
+                'analysed_at': time.monotonic(),
+                'cost': cost,
+            }
+            self._entries.move_to_end(client_id)
+            while len(self._entries) > self.max_clients:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        checked = sum(self.outcomes.values())
+        return {
+            'enabled': self.enabled,
+            'max_distance': self.max_distance,
+            'max_age_s': self.max_age,
+            'clients': len(self._entries),
+            'outcomes': dict(self.outcomes),
+            'skip_rate': round(self.outcomes['reused'] / checked, 4) if checked else 0.0,
+            'saved_seconds': round(self.saved_seconds, 3),
+        }
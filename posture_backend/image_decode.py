@@ -0,0 +1,137 @@
+import os
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Longest side (in pixels) of the image handed to MediaPipe. The pose models
+# work at 224-256 px internally, so decoding 12 MP photos at full size only
+# burns CPU.
+DECODE_MAX_SIDE = int(os.environ.get('DECODE_MAX_SIDE', 640))
+
+REDUCED_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Start-of-frame markers that carry the image dimensions (baseline,
+# progressive, lossless, arithmetic); C4, C8 and CC are not SOF markers
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+_buffers = threading.local()
+
+
+def read_jpeg_size(data):
+    """Return (width, height) from a JPEG's SOF header, or None if not a JPEG.
+
+    Only walks the marker segments, so it touches a few KB at most.
+    """
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+
+    pos = 2
+    length = len(data)
+    while pos + 4 <= length:
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            # Standalone markers without a length field
+            pos += 2
+            continue
+        segment_length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        if marker in SOF_MARKERS:
+            if pos + 9 > length:
+                return None
+            height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+            return width, height
+        if marker == 0xDA:
+            # Start of scan without a frame header: malformed
+            return None
+        pos += 2 + segment_length
+    return None
+
+
+def choose_scale(width, height, max_side=DECODE_MAX_SIDE):
+    """Largest libjpeg reduction factor that keeps the longest side >= max_side"""
+    longest = max(width, height)
+    for factor in (8, 4, 2):
+        if longest // factor >= max_side:
+            return factor
+    return 1
+
+
+def _rgb_buffer(shape):
+    """Per-thread RGB output buffer, reallocated only when the shape changes"""
+    buffer = getattr(_buffers, 'rgb', None)
+    if buffer is None or buffer.shape != shape:
+        buffer = np.empty(shape, dtype=np.uint8)
+        _buffers.rgb = buffer
+    return buffer
+
+
+def decode_image(data, max_side=DECODE_MAX_SIDE, reuse_buffer=True, out=None):
+    """Decode encoded image bytes into an RGB array no larger than max_side.
+
+    For JPEGs the reduction factor is picked from the SOF header so libjpeg
+    decodes straight at 1/2, 1/4 or 1/8 size; anything still above max_side
+    is downscaled with INTER_AREA. There is exactly one BGR->RGB conversion.
+    With reuse_buffer=True it writes into a per-thread buffer, which stays
+    valid until this thread's next decode_image call. `out`, if given, is
+    called with the RGB shape and returns the uint8 array to write into
+    instead (e.g. a shared-memory frame slot).
+
+    Returns (rgb, info), or (None, info) if the bytes can't be decoded. info
+    holds the decode and colour conversion times and the chosen scale for
+    response debug output.
+    """
+    start = time.perf_counter()
+
+    size = read_jpeg_size(data)
+    scale = choose_scale(*size, max_side=max_side) if size else 1
+
+    buffer = np.frombuffer(data, np.uint8)
+    bgr = cv2.imdecode(buffer, REDUCED_COLOR_FLAGS[scale])
+    if bgr is None and scale != 1:
+        # Some encoders produce headers libjpeg's scaled decode rejects
+        scale = 1
+        bgr = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+    info = {
+        'scale': scale,
+        'original_size': list(size) if size else None,
+    }
+    if bgr is None:
+        info['decode_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        return None, info
+
+    height, width = bgr.shape[:2]
+    longest = max(width, height)
+    if max_side and longest > max_side:
+        ratio = max_side / longest
+        bgr = cv2.resize(bgr, (max(1, round(width * ratio)), max(1, round(height * ratio))),
+                         interpolation=cv2.INTER_AREA)
+
+    decoded = time.perf_counter()
+    if out is not None:
+        rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=out(bgr.shape))
+    elif reuse_buffer:
+        rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=_rgb_buffer(bgr.shape))
+    else:
+        rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    converted = time.perf_counter()
+
+    if info['original_size'] is None:
+        info['original_size'] = [width, height]
+    info['decoded_size'] = [rgb.shape[1], rgb.shape[0]]
+    info['decode_ms'] = round((decoded - start) * 1000, 2)
+    info['convert_ms'] = round((converted - decoded) * 1000, 2)
+    return rgb, info
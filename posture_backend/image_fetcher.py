@@ -0,0 +1,251 @@
+import hashlib
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+FETCH_WORKERS = int(os.environ.get('FETCH_WORKERS', 16))
+FETCH_TIMEOUT = float(os.environ.get('FETCH_TIMEOUT', 10))
+FETCH_RETRIES = int(os.environ.get('FETCH_RETRIES', 3))
+FETCH_BACKOFF = float(os.environ.get('FETCH_BACKOFF', 0.5))
+# Longest Retry-After a server can make a worker sleep for
+FETCH_MAX_RETRY_AFTER = float(os.environ.get('FETCH_MAX_RETRY_AFTER', 30))
+FETCH_CACHE_DIR = os.environ.get('FETCH_CACHE_DIR', 'image_cache')
+
+# Worth another attempt; any other 4xx means the URL itself is bad
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+# Connection trouble, timeouts and bodies cut short or garbled in transit
+RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.ContentDecodingError)
+
+
+class FetchError(Exception):
+    """Raised when an image could not be downloaded after all retries"""
+
+
+class FetchCache:
+    """Raw downloaded bytes on disk, one file per URL keyed by its SHA-256.
+
+    Files are written to a temporary name and renamed into place, so a job
+    that is killed mid-download never leaves a truncated entry behind and a
+    restarted job can trust whatever it finds.
+    """
+
+    def __init__(self, directory=FETCH_CACHE_DIR):
+        self.directory = directory
+
+    def path(self, url):
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        # Two-level fan-out keeps directories small for tens of thousands of images
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, url):
+        try:
+            with open(self.path(url), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, url, data):
+        path = self.path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+class FetchStats:
+    """Thread-safe progress counters for a fetch run"""
+
+    def __init__(self, total=0):
+        self.total = total
+        self.downloaded = 0
+        self.cached = 0
+        self.failed = 0
+        self.retries = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        elapsed = time.perf_counter() - self.started
+        done = self.downloaded + self.cached + self.failed
+        return {
+            'total': self.total,
+            'done': done,
+            'downloaded': self.downloaded,
+            'cached': self.cached,
+            'failed': self.failed,
+            'retries': self.retries,
+            'megabytes': round(self.bytes / 1e6, 2),
+            'elapsed_s': round(elapsed, 1),
+            'images_per_sec': round(done / elapsed, 1) if elapsed > 0 else 0.0,
+            'mb_per_sec': round(self.bytes / 1e6 / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+
+def log_progress(stats):
+    logger.info(
+        f"Fetched {stats['done']}/{stats['total']} images "
+        f"({stats['downloaded']} downloaded, {stats['cached']} cached, {stats['failed']} failed, "
+        f"{stats['retries']} retries) at {stats['images_per_sec']} img/s, {stats['mb_per_sec']} MB/s"
+    )
+
+
+class ImageFetcher:
+    """Concurrent image downloader with per-host connection pools, retries and a disk cache.
+
+    fetch_all() runs downloads (and an optional transform, e.g. decode and
+    resize) on a bounded thread pool and yields results in input order while
+    keeping at most a few batches of images in memory.
+    """
+
+    def __init__(self, cache_dir=FETCH_CACHE_DIR, workers=FETCH_WORKERS, timeout=FETCH_TIMEOUT,
+                 retries=FETCH_RETRIES, backoff=FETCH_BACKOFF, max_retry_after=FETCH_MAX_RETRY_AFTER,
+                 report_interval=10.0, progress=log_progress):
+        self.cache = FetchCache(cache_dir) if cache_dir else None
+        self.workers = max(1, int(workers))
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        self.report_interval = report_interval
+        self.progress = progress
+        self.stats = FetchStats()
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def session(self, url):
+        """Shared keep-alive session for the URL's host, sized for the worker pool"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[host] = session
+            return session
+
+    def _retry_delay(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_retry_after)
+        # Exponential backoff with jitter so workers don't retry in lockstep
+        return self.backoff * (2 ** attempt) * (0.5 + random.random())
+
+    def download(self, url):
+        """GET the URL, retrying connection errors, timeouts, truncated bodies and 429/5xx responses"""
+        session = self.session(url)
+        for attempt in range(self.retries + 1):
+            response = None
+            try:
+                response = session.get(url, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    content = response.content
+                    # Content-Length counts the bytes on the wire, before .content
+                    # undoes any gzip/deflate Content-Encoding
+                    expected = response.headers.get('Content-Length')
+                    received = response.raw.tell()
+                    if expected is None or not expected.isdigit() or int(expected) == received:
+                        return content
+                    error = FetchError(f'Truncated response: {received} of {expected} bytes')
+                else:
+                    error = FetchError(f'HTTP {response.status_code}')
+            except RETRY_EXCEPTIONS as e:
+                error = e
+            except requests.RequestException as e:
+                raise FetchError(str(e)) from e
+
+            if attempt == self.retries:
+                raise FetchError(f'{error} (after {attempt + 1} attempts)') from error
+            self.stats.add(retries=1)
+            time.sleep(self._retry_delay(attempt, response))
+
+    def fetch(self, url):
+        """Return the raw bytes for a URL, from the disk cache if already downloaded"""
+        if self.cache is not None:
+            data = self.cache.get(url)
+            if data is not None:
+                self.stats.add(cached=1)
+                return data
+
+        data = self.download(url)
+        if self.cache is not None:
+            self.cache.put(url, data)
+        self.stats.add(downloaded=1, bytes=len(data))
+        return data
+
+    def _fetch_one(self, url, transform):
+        try:
+            data = self.fetch(url)
+            return (transform(data) if transform else data), None
+        except Exception as e:
+            self.stats.add(failed=1)
+            return None, e
+
+    def fetch_all(self, urls, transform=None):
+        """Yield (index, url, result, error) for every URL, in input order.
+
+        result is transform(bytes) (or the bytes themselves) and error is None
+        on success; on failure result is None and error is the exception.
+        """
+        urls = list(urls)
+        self.stats = FetchStats(total=len(urls))
+        last_report = time.perf_counter()
+        window = deque()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-fetch') as executor:
+            pending = iter(enumerate(urls))
+            for index, url in pending:
+                window.append((index, url, executor.submit(self._fetch_one, url, transform)))
+                # Bounded in-flight window: enough to keep every worker busy
+                if len(window) >= self.workers * 4:
+                    break
+
+            while window:
+                index, url, future = window.popleft()
+                result, error = future.result()
+                if error is not None:
+                    logger.warning(f"Image error for {url}: {error}")
+                yield index, url, result, error
+
+                next_item = next(pending, None)
+                if next_item is not None:
+                    window.append((*next_item, executor.submit(self._fetch_one, next_item[1], transform)))
+
+                now = time.perf_counter()
+                if self.progress and now - last_report >= self.report_interval:
+                    self.progress(self.stats.snapshot())
+                    last_report = now
+
+        if self.progress:
+            self.progress(self.stats.snapshot())
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
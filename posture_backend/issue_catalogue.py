@@ -0,0 +1,69 @@
+"""Stable issue codes and the text shown for them.
+
+An analysis reports the codes of the issues it found (`issue_codes`). The
+English issue lines and tips live here once; posture_rules attaches them to
+its rules (a tenant's rule table can override them) and they are served
+separately at /recommendations/catalogue, so clients fetch the text once.
+"""
+import os
+
+# How long clients may reuse the catalogue before revalidating it (seconds)
+CATALOGUE_MAX_AGE = int(os.environ.get('CATALOGUE_MAX_AGE', 3600))
+
+# Code -> issue line, recommendation title and tips
+ISSUE_CATALOGUE = {
+    'forward_head': {
+        'issue': 'Forward head posture detected',
+        'title': 'Forward Head Posture',
+        'tips': [
+            'Tuck your chin back',
+            'Imagine a string pulling the top of your head up',
+            'Keep your ears aligned over your shoulders'
+        ]
+    },
+    'shoulder_imbalance': {
+        'issue': 'Uneven shoulders',
+        'title': 'Shoulder Imbalance',
+        'tips': [
+            'Check if you\'re carrying weight on one side',
+            'Practice shoulder blade squeezes',
+            'Be aware of which shoulder tends to be higher'
+        ]
+    },
+    'head_tilt': {
+        'issue': 'Head tilted to one side',
+        'title': 'Head Tilt',
+        'tips': [
+            'Practice head alignment exercises',
+            'Check your workspace ergonomics',
+            'Be mindful of phone/computer screen positioning'
+        ]
+    },
+    'slouching': {
+        'issue': 'Slouching/rounded shoulders',
+        'title': 'Slouching',
+        'tips': [
+            'Pull your shoulder blades back and down',
+            'Engage your core muscles',
+            'Keep your chest open'
+        ]
+    },
+    'alignment': {
+        'issue': 'Poor overall alignment',
+        'title': 'Overall Alignment',
+        'tips': [
+            'Practice standing against a wall',
+            'Focus on stacking head over shoulders over hips',
+            'Consider ergonomic adjustments to your workspace'
+        ]
+    },
+    'neck_angle': {
+        'issue': 'Poor neck angle',
+        'title': 'Neck Angle',
+        'tips': [
+            'Adjust your screen to eye level',
+            'Practice neck stretches',
+            'Maintain neutral neck position'
+        ]
+    },
+}
@@ -0,0 +1,183 @@
+import logging
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', os.cpu_count() or 1))
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 64))
+JOB_RESULT_TTL = float(os.environ.get('JOB_RESULT_TTL', 300))
+JOB_MAX_WAIT = float(os.environ.get('JOB_MAX_WAIT', 30))
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+    def __init__(self, retry_after):
+        super().__init__('Job queue is full')
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, payload):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = 'queued'
+        self.result = None
+        self.status_code = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+        }
+        if self.started_at is not None:
+            data['queue_wait_ms'] = round((self.started_at - self.submitted_at) * 1000, 1)
+        if self.finished_at is not None:
+            data['run_ms'] = round((self.finished_at - self.started_at) * 1000, 1)
+            data['result'] = self.result
+            data['result_status_code'] = self.status_code
+        return data
+
+
+class JobQueue:
+    """Fixed pool of worker threads fed by a bounded in-process queue.
+
+    handler(payload) must return (response_dict, status_code). When the queue
+    is full, submit() raises QueueFull instead of letting work pile up.
+    """
+
+    def __init__(self, handler, workers=JOB_WORKERS, max_queue=JOB_QUEUE_SIZE,
+                 result_ttl=JOB_RESULT_TTL):
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.result_ttl = result_ttl
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+        self.busy = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+        self.last_wait = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return self
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'posture-job-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def retry_after(self):
+        """Seconds until a slot is likely to free up, from the mean service time"""
+        finished = self.completed + self.failed
+        mean_run = self._total_run / finished if finished else 1.0
+        return max(1, math.ceil(self._queue.qsize() * mean_run / self.workers))
+
+    def submit(self, payload):
+        self.start()
+        self._expire_old_jobs()
+        job = Job(payload)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+                self.rejected += 1
+            raise QueueFull(self.retry_after())
+        return job
+
+    def get(self, job_id, wait=0):
+        """Look up a job, blocking up to `wait` seconds for it to finish (long poll)"""
+        job = self._jobs.get(job_id)
+        if job is not None and wait > 0:
+            job.done.wait(min(wait, JOB_MAX_WAIT))
+        return job
+
+    def close(self):
+        """Run the jobs already queued, then stop the worker threads"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+            job.started_at = time.time()
+            job.status = 'running'
+            with self._lock:
+                self.busy += 1
+            status = 'failed'
+            try:
+                job.result, job.status_code = self.handler(job.payload)
+                status = 'done'
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                job.result = {
+                    'success': False,
+                    'error': f'Internal server error: {str(e)}'
+                }
+                job.status_code = 500
+                status = 'failed'
+            finally:
+                job.finished_at = time.time()
+                job.status = status
+                # Drop the upload bytes as soon as the job is finished
+                job.payload = None
+                with self._lock:
+                    self.busy -= 1
+                    if job.status == 'done':
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                    self.last_wait = job.started_at - job.submitted_at
+                    self._total_wait += self.last_wait
+                    self._total_run += job.finished_at - job.started_at
+                job.done.set()
+                self._queue.task_done()
+
+    def _expire_old_jobs(self):
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def stats(self):
+        finished = self.completed + self.failed
+        return {
+            'workers': self.workers,
+            'busy': self.busy,
+            'queue_depth': self._queue.qsize(),
+            'queue_capacity': self._queue.maxsize,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'last_wait_ms': round(self.last_wait * 1000, 1),
+            'mean_wait_ms': round(self._total_wait / finished * 1000, 1) if finished else 0.0,
+            'mean_run_ms': round(self._total_run / finished * 1000, 1) if finished else 0.0,
+        }
@@ -0,0 +1,63 @@
+import numpy as np
+
+NUM_LANDMARKS = 33
+LANDMARK_FIELDS = 4  # x, y, z, visibility
+PACKED_SIZE = NUM_LANDMARKS * LANDMARK_FIELDS * 4  # little-endian float32
+
+
+class LandmarkError(ValueError):
+    """Raised when a landmark payload can't be turned into a (33, 4) array"""
+
+
+def landmarks_to_array(landmarks):
+    """Convert MediaPipe NormalizedLandmark objects to a (33, 4) float32 array"""
+    points = np.empty((NUM_LANDMARKS, LANDMARK_FIELDS), dtype=np.float32)
+    for i, lm in enumerate(landmarks):
+        points[i] = (lm.x, lm.y, lm.z, lm.visibility)
+    return points
+
+
+def _validate(points):
+    if points.shape != (NUM_LANDMARKS, LANDMARK_FIELDS):
+        raise LandmarkError(f'Expected {NUM_LANDMARKS} landmarks of (x, y, z, visibility), '
+                            f'got shape {points.shape}')
+    if not np.isfinite(points).all():
+        raise LandmarkError('Landmarks contain NaN or infinite values')
+    return points
+
+
+def parse_packed_landmarks(body):
+    """Parse a packed body of 33 * 4 little-endian float32 values"""
+    if len(body) != PACKED_SIZE:
+        raise LandmarkError(f'Packed landmarks must be exactly {PACKED_SIZE} bytes, got {len(body)}')
+    points = np.frombuffer(body, dtype='<f4').astype(np.float32).reshape(NUM_LANDMARKS, LANDMARK_FIELDS)
+    return _validate(points)
+
+
+def parse_json_landmarks(landmarks):
+    """Parse landmarks sent as JSON.
+
+    Accepts a list of 33 [x, y, z, visibility] rows, a flat list of 132
+    numbers, or a list of 33 {'x', 'y', 'z', 'visibility'} objects (the shape
+    the app's on-device detector produces). z and visibility are optional.
+    """
+    if not isinstance(landmarks, list) or not landmarks:
+        raise LandmarkError("'landmarks' must be a non-empty list")
+
+    try:
+        if isinstance(landmarks[0], dict):
+            rows = [[lm['x'], lm['y'], lm.get('z', 0.0), lm.get('visibility', 1.0)]
+                    for lm in landmarks]
+            points = np.asarray(rows, dtype=np.float32)
+        else:
+            points = np.asarray(landmarks, dtype=np.float32)
+            if points.ndim == 1 and points.size == NUM_LANDMARKS * LANDMARK_FIELDS:
+                points = points.reshape(NUM_LANDMARKS, LANDMARK_FIELDS)
+            elif points.ndim == 2 and points.shape[1] in (2, 3):
+                # Missing z/visibility: default z to 0 and treat every landmark as visible
+                padding = np.tile(np.float32([0.0, 1.0][points.shape[1] - 2:]), (len(points), 1))
+                points = np.hstack([points, padding])
+    except (KeyError, TypeError, ValueError) as e:
+        raise LandmarkError(f'Malformed landmarks: {e}')
+
+    return _validate(points)
@@ -0,0 +1,162 @@
+import base64
+import binascii
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+LIVE_MAX_SESSIONS = int(os.environ.get('LIVE_MAX_SESSIONS', 16))
+LIVE_IDLE_TIMEOUT = float(os.environ.get('LIVE_IDLE_TIMEOUT', 30))
+
+# One semaphore per process so a burst of phones can't open unlimited graphs
+_session_slots = threading.BoundedSemaphore(LIVE_MAX_SESSIONS)
+
+
+class LatestFrameSlot:
+    """Single-slot mailbox that only ever holds the newest unprocessed frame.
+
+    When the client sends faster than inference runs, older frames are
+    overwritten instead of queued, so latency stays bounded.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        with self._cond:
+            self.received += 1
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = frame
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Return the newest frame, or None once closed or timed out"""
+        with self._cond:
+            if self._frame is None and not self._closed:
+                self._cond.wait(timeout)
+            frame, self._frame = self._frame, None
+            return frame
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+def decode_message(message):
+    """Frames arrive as binary JPEG bytes or as base64 text (optionally a data URI)"""
+    if isinstance(message, (bytes, bytearray)):
+        return bytes(message)
+    if message.startswith('data:'):
+        message = message.split(',', 1)[1]
+    try:
+        return base64.b64decode(message, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+class LiveSession:
+    """Streams frames from one WebSocket client through a tracking-mode Pose.
+
+    A background thread reads frames into a LatestFrameSlot while the session
+    thread runs inference on whatever frame is newest and pushes the result
+    back. The session owns one Pose(static_image_mode=False) so MediaPipe can
+    track landmarks between frames instead of re-detecting the person.
+    """
+
+    def __init__(self, ws, analyze_frame, model_complexity=1,
+                 min_detection_confidence=0.5, min_tracking_confidence=0.5):
+        self.ws = ws
+        self.analyze_frame = analyze_frame
+        self.pose_options = {
+            'static_image_mode': False,
+            'model_complexity': model_complexity,
+            'enable_segmentation': False,
+            'min_detection_confidence': min_detection_confidence,
+            'min_tracking_confidence': min_tracking_confidence,
+        }
+        self.slot = LatestFrameSlot()
+        self.processed = 0
+
+    def _receive_loop(self):
+        sequence = 0
+        try:
+            while True:
+                message = self.ws.receive()
+                if message is None:
+                    break
+                sequence += 1
+                self.slot.put((sequence, message, time.perf_counter()))
+        except Exception as e:
+            logger.info(f"Live session closed by client: {e}")
+        finally:
+            self.slot.close()
+
+    def run(self):
+        if not _session_slots.acquire(blocking=False):
+            self.ws.send(json.dumps({
+                'success': False,
+                'error': 'Too many live sessions, try again later'
+            }))
+            return
+
+        try:
+            import mediapipe as mp  # Already loaded by the pose pool in a running server
+            with mp.solutions.pose.Pose(**self.pose_options) as pose:
+                receiver = threading.Thread(target=self._receive_loop, daemon=True)
+                receiver.start()
+                self._process_frames(pose)
+        finally:
+            _session_slots.release()
+
+    def _process_frames(self, pose):
+        last_frame = time.monotonic()
+        while True:
+            item = self.slot.get(timeout=LIVE_IDLE_TIMEOUT)
+            if item is None:
+                if self.slot.closed or time.monotonic() - last_frame > LIVE_IDLE_TIMEOUT:
+                    break
+                continue
+            last_frame = time.monotonic()
+
+            sequence, message, received_at = item
+            frame_bytes = decode_message(message)
+            if frame_bytes is None:
+                result = {
+                    'success': False,
+                    'error': 'Frames must be binary JPEG or base64 text'
+                }
+            else:
+                try:
+                    result = self.analyze_frame(frame_bytes, pose=pose)
+                except Exception as e:
+                    # One bad frame answers with an error instead of ending the session
+                    logger.error(f"Live frame {sequence} failed: {e}")
+                    result = {
+                        'success': False,
+                        'error': f'Internal server error: {str(e)}'
+                    }
+
+            self.processed += 1
+            result['frame'] = sequence
+            result['frames_processed'] = self.processed
+            result['frames_dropped'] = self.slot.dropped
+            result['latency_ms'] = round((time.perf_counter() - received_at) * 1000, 1)
+
+            try:
+                self.ws.send(json.dumps(result))
+            except Exception as e:
+                logger.info(f"Live session send failed: {e}")
+                break
@@ -0,0 +1,262 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Pre-forked workers each have their own registry. With a shared directory
+# every process writes a snapshot of its samples there every
+# METRICS_SYNC_INTERVAL seconds, and a scrape of any worker adds them up
+# (see Registry.share). '' keeps the metrics per process.
+METRICS_DIR = os.environ.get('POSTURE_METRICS_DIR', '')
+METRICS_SYNC_INTERVAL = float(os.environ.get('METRICS_SYNC_INTERVAL', 1))
+# Seconds; spans fast paths (cache hits, landmark-only requests) up to slow
+# full-resolution inference
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            yield self.name + _format_labels(self.labelnames, labelvalues), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), sum, count
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._series.items())
+        for labelvalues, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, labelvalues, ('le', _format_value(bound)))
+                yield f'{self.name}_bucket{labels}', cumulative
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f'{self.name}_sum{labels}', total
+            yield f'{self.name}_count{labels}', count
+
+
+class Gauge:
+    """Value read from a callback at scrape time.
+
+    Also used to expose counters that another component already maintains
+    (type_name='counter'), e.g. the result cache's hit count.
+    """
+
+    def __init__(self, name, documentation, callback, type_name='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.type_name = type_name
+
+    def samples(self):
+        yield self.name, self.callback()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self.directory = None
+        self._path = None
+        self._stop = None
+        self._thread = None
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, callback, type_name='gauge'):
+        return self.register(Gauge(name, documentation, callback, type_name))
+
+    def share(self, directory, interval=METRICS_SYNC_INTERVAL):
+        """Aggregate this process's metrics with the other processes writing to `directory`.
+
+        A background thread writes this process's samples to <pid>.json every
+        `interval` seconds; render() adds the newest snapshot of every other
+        process to its own live values. Counters and histograms of exited
+        processes stay in the sum so that they never go backwards; their
+        gauges are dropped.
+        """
+        self.close()
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._path = os.path.join(directory, f'{os.getpid()}.json')
+        self._stop = threading.Event()
+        self.write_snapshot()
+        self._thread = threading.Thread(target=self._sync, args=(interval,), name='posture-metrics', daemon=True)
+        self._thread.start()
+        return self
+
+    def _sync(self, interval):
+        while not self._stop.wait(interval):
+            self.write_snapshot()
+
+    def write_snapshot(self, exited=False):
+        snapshot = {
+            'pid': os.getpid(),
+            'exited': exited,
+            'metrics': {metric.name: list(metric.samples()) for metric in self._metrics},
+        }
+        try:
+            with open(self._path + '.tmp', 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(self._path + '.tmp', self._path)
+        except OSError as e:
+            logger.warning(f"Cannot write metrics snapshot {self._path}: {e}")
+
+    def _other_snapshots(self):
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            if path == self._path:
+                continue
+            try:
+                with open(path) as f:
+                    yield json.load(f)
+            except (OSError, ValueError) as e:
+                logger.debug(f"Skipping metrics snapshot {path}: {e}")
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        values = {metric.name: dict(metric.samples()) for metric in self._metrics}
+        if self.directory is not None:
+            for snapshot in self._other_snapshots():
+                live = not snapshot['exited'] and _alive(snapshot['pid'])
+                for metric in self._metrics:
+                    if metric.type_name == 'gauge' and not live:
+                        continue
+                    samples = values[metric.name]
+                    for sample_name, value in snapshot['metrics'].get(metric.name, ()):
+                        samples[sample_name] = samples.get(sample_name, 0) + value
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            for sample_name, value in values[metric.name].items():
+                lines.append(f'{sample_name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        """Stop sharing; the final snapshot keeps this process's counters in the other processes' sums"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.write_snapshot(exited=True)
+        self.directory = None
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class StageTimer:
+    """Times the stages of one request into a labelled histogram"""
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.durations = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+        self.histogram.observe(seconds, name)
+
+
+class NullTimer:
+    """Stand-in for StageTimer when the caller isn't collecting metrics"""
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def record(self, name, seconds):
+        pass
+
+
+NULL_TIMER = NullTimer()
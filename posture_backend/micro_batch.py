@@ -0,0 +1,130 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+MICROBATCH_MAX_SIZE = int(os.environ.get('MICROBATCH_MAX_SIZE', 32))
+# How long the first request of a batch may wait for company; 0 only
+# batches requests that are already queued
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get('MICROBATCH_MAX_WAIT_MS', 5))
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-item calls into one batch_fn call.
+
+    batch_fn(items) must return one result per item, in order. A single
+    scheduler thread collects requests until max_batch_size are waiting or
+    the oldest has waited max_wait_ms, runs the batch and resolves each
+    caller's future. While a batch runs, the next one queues up, so batch
+    size grows with load and the per-call overhead is shared.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=MICROBATCH_MAX_SIZE, max_wait_ms=MICROBATCH_MAX_WAIT_MS,
+                 name='micro-batcher'):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.failed_batches = 0
+        self._busy_seconds = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        return self
+
+    def submit(self, item):
+        """Queue one item; returns a Future for its result"""
+        self.start()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout)
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                # Take whatever is already queued without waiting
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if entry is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [(item, future) for item, future in self._collect(first)
+                     if future.set_running_or_notify_cancel()]
+            if batch:
+                self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        start = time.perf_counter()
+        try:
+            results = self.batch_fn([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f'batch_fn returned {len(results)} results for {len(batch)} items')
+        except Exception as e:
+            logger.error(f"{self.name}: batch of {len(batch)} failed: {e}")
+            self.failed_batches += 1
+            for _, future in batch:
+                future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+        finally:
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self._busy_seconds += time.perf_counter() - start
+
+    def stats(self):
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'queued': self._queue.qsize(),
+            'batches': self.batches,
+            'items': self.items,
+            'failed_batches': self.failed_batches,
+            'mean_batch_size': round(self.items / self.batches, 2) if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+            'mean_batch_ms': round(self._busy_seconds / self.batches * 1000, 2) if self.batches else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(_STOP)
+                self._thread.join()
+                self._thread = None
@@ -0,0 +1,157 @@
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Pool configuration (can be overridden per deployment through the environment)
+POSE_POOL_SIZE = int(os.environ.get('POSE_POOL_SIZE', os.cpu_count() or 1))
+POSE_POOL_MAX_USES = int(os.environ.get('POSE_POOL_MAX_USES', 500))
+POSE_POOL_TIMEOUT = float(os.environ.get('POSE_POOL_TIMEOUT', 30))
+
+
+class PooledPose:
+    """A long-lived MediaPipe Pose instance plus its usage counter"""
+
+    def __init__(self, pose_options):
+        # MediaPipe is imported with the first instance (or warm-up), not
+        # with the module: loading it costs seconds and hundreds of MB
+        import mediapipe as mp
+        self.pose = mp.solutions.pose.Pose(**pose_options)
+        self.uses = 0
+
+    def process(self, image):
+        self.uses += 1
+        return self.pose.process(image)
+
+    def close(self):
+        try:
+            self.pose.close()
+        except Exception as e:
+            logger.warning(f"Error closing pose instance: {e}")
+
+
+class PosePool:
+    """Fixed-size pool of pre-built MediaPipe Pose graphs.
+
+    Each instance is checked out by exactly one thread at a time, so the
+    calculator graph and TFLite model are built once per slot instead of once
+    per request. Instances are rebuilt after ``max_uses`` inferences or when
+    an inference raises.
+    """
+
+    def __init__(self, size=POSE_POOL_SIZE, max_uses=POSE_POOL_MAX_USES,
+                 timeout=POSE_POOL_TIMEOUT, **pose_options):
+        self.size = max(1, int(size))
+        self.max_uses = max_uses
+        self.timeout = timeout
+        self.pose_options = {
+            'static_image_mode': True,
+            'model_complexity': 1,
+            'enable_segmentation': False,
+            'min_detection_confidence': 0.5,
+        }
+        self.pose_options.update(pose_options)
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self.recycled = 0
+
+    def _new_instance(self, warm_up=False):
+        instance = PooledPose(self.pose_options)
+        if warm_up:
+            # Run one inference so the first real request doesn't pay for
+            # delegate/allocator initialisation inside the graph
+            instance.pose.process(np.zeros((256, 256, 3), dtype=np.uint8))
+        return instance
+
+    def warm_up(self):
+        """Build every slot up front and run a warm-up inference on each"""
+        with self._lock:
+            missing = self.size - self._created
+            self._created += max(0, missing)
+        for built in range(max(0, missing)):
+            try:
+                self._idle.put(self._new_instance(warm_up=True))
+            except Exception:
+                with self._lock:
+                    self._created -= missing - built
+                raise
+        logger.info(f"Pose pool ready with {self.size} instances "
+                    f"(model_complexity={self.pose_options['model_complexity']})")
+        return self
+
+    def _get(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        # Lazily grow up to the configured size if warm_up() was not called
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self._new_instance()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError('Timed out waiting for a free pose instance')
+
+    def _put(self, instance, failed=False):
+        if failed or (self.max_uses and instance.uses >= self.max_uses):
+            instance.close()
+            with self._lock:
+                self.recycled += 1
+            try:
+                # Warmed before it goes back, so the next request doesn't pay for graph initialisation
+                instance = self._new_instance(warm_up=True)
+            except Exception as e:
+                logger.error(f"Could not rebuild pose instance: {e}")
+                with self._lock:
+                    self._created -= 1
+                return
+        self._idle.put(instance)
+
+    @contextmanager
+    def acquire(self):
+        """Check out a pose instance for the duration of the ``with`` block"""
+        instance = self._get()
+        failed = False
+        try:
+            yield instance
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._put(instance, failed=failed)
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'created': self._created,
+            'idle': self._idle.qsize(),
+            'recycled': self.recycled,
+            'max_uses': self.max_uses,
+        }
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
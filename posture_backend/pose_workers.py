@@ -0,0 +1,273 @@
+"""Pose inference in worker processes, fed through a shared-memory frame ring.
+
+The server process creates one SharedMemory block cut into fixed-size slots.
+A request thread takes a free slot and decodes the upload straight into it
+(decode_image's `out` hook). It then sends only the slot index and frame
+shape to a worker. Each worker maps the block once at start-up and wraps
+the slot as a NumPy array without copying. The (33, 4) landmark array comes
+back through the executor's result pipe, so a frame never crosses the
+process boundary.
+
+A slot goes back to the ring only when its worker result has arrived, so
+the slot count bounds the frames in flight. When every slot is taken,
+acquire() waits up to FRAME_RING_TIMEOUT and then raises RingFull. The
+endpoint can answer that with Retry-After instead of queueing without limit.
+"""
+import atexit
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from image_decode import DECODE_MAX_SIDE
+
+logger = logging.getLogger(__name__)
+
+# 0 keeps pose inference on the request threads (PosePool)
+POSE_WORKERS = int(os.environ.get('POSE_WORKERS', 0))
+# Frames in flight across all workers; 0 means two per worker, so each
+# worker has its next frame decoded while it runs the current one
+FRAME_RING_SLOTS = int(os.environ.get('FRAME_RING_SLOTS', 0))
+# How long a request waits for a free slot before it is turned away
+FRAME_RING_TIMEOUT = float(os.environ.get('FRAME_RING_TIMEOUT', 2))
+
+
+def frame_slot_bytes(max_side=DECODE_MAX_SIDE):
+    """Slot size that fits any RGB frame decode_image returns for max_side"""
+    return max_side * max_side * 3
+
+
+class RingFull(Exception):
+    """Raised when no frame slot frees up within the timeout"""
+
+    def __init__(self, retry_after):
+        super().__init__('All frame slots are in use')
+        self.retry_after = retry_after
+
+
+class FrameSlot:
+    """One acquired slot of a FrameRing; release() hands it back"""
+
+    def __init__(self, ring, index):
+        self.ring = ring
+        self.index = index
+        self.shape = None
+
+    def array(self, shape):
+        """Writable uint8 view of the slot with the given shape (decode_image's out hook)"""
+        self.shape = tuple(shape)
+        return self.ring.view(self.index, self.shape)
+
+    def release(self):
+        if self.index is not None:
+            self.ring.release(self.index)
+            self.index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class FrameRing:
+    """Preallocated shared-memory frame slots, allocated by the server process only"""
+
+    def __init__(self, slots, slot_bytes=None, timeout=FRAME_RING_TIMEOUT):
+        self.slots = max(1, int(slots))
+        self.slot_bytes = slot_bytes or frame_slot_bytes()
+        self.timeout = timeout
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_bytes)
+        # LIFO, so the most recently used (cache-warm) slot is reused first
+        self._free = queue.LifoQueue()
+        for index in range(self.slots):
+            self._free.put(index)
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.exhausted = 0
+        self._wait_seconds = 0.0
+        self._closed = False
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def acquire(self, timeout=None):
+        """Take a free slot, waiting up to `timeout` seconds; raises RingFull"""
+        start = time.perf_counter()
+        try:
+            index = self._free.get(timeout=self.timeout if timeout is None else timeout)
+        except queue.Empty:
+            with self._lock:
+                self.exhausted += 1
+            raise RingFull(max(1, math.ceil(self.timeout)))
+        with self._lock:
+            self.acquired += 1
+            self._wait_seconds += time.perf_counter() - start
+        return FrameSlot(self, index)
+
+    def release(self, index):
+        self._free.put(index)
+
+    def view(self, index, shape):
+        if int(np.prod(shape)) > self.slot_bytes:
+            raise ValueError(f'Frame of shape {tuple(shape)} does not fit a {self.slot_bytes}-byte slot')
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=index * self.slot_bytes)
+
+    def stats(self):
+        return {
+            'slots': self.slots,
+            'slot_bytes': self.slot_bytes,
+            'free': self._free.qsize(),
+            'acquired': self.acquired,
+            'exhausted': self.exhausted,
+            'mean_wait_ms': round(self._wait_seconds / self.acquired * 1000, 3) if self.acquired else 0.0,
+        }
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.shm.close()
+            self.shm.unlink()
+
+
+# Worker-process state, set up by init_worker
+_worker_shm = None
+_worker_slot_bytes = 0
+_worker_pool_options = {}
+_worker_pose_pools = {}
+
+
+def init_worker(ring_name, slot_bytes, pool_options=None):
+    """ProcessPoolExecutor initializer: map the ring's shared memory once per worker"""
+    global _worker_shm, _worker_slot_bytes, _worker_pool_options
+    _worker_shm = shared_memory.SharedMemory(name=ring_name)
+    _worker_slot_bytes = slot_bytes
+    _worker_pool_options = pool_options or {}
+
+
+def worker_frame(index, shape):
+    """In a worker: the frame in slot `index` as a read-only array, without copying"""
+    frame = np.ndarray(shape, dtype=np.uint8, buffer=_worker_shm.buf, offset=index * _worker_slot_bytes)
+    frame.flags.writeable = False
+    return frame
+
+
+def _pose_pool(pose_options=None):
+    """The worker's single-slot pool for these pose options (one per quality tier)"""
+    key = tuple(sorted((pose_options or {}).items()))
+    pool = _worker_pose_pools.get(key)
+    if pool is None:
+        from pose_pool import PosePool
+        pool = _worker_pose_pools[key] = PosePool(size=1, **dict(_worker_pool_options, **dict(key))).warm_up()
+    return pool
+
+
+def frame_landmarks(frame, pose_options=None):
+    """In a worker: (33, 4) float32 landmarks of an RGB frame, or None"""
+    from landmark_io import landmarks_to_array
+
+    with _pose_pool(pose_options).acquire() as pose:
+        results = pose.process(frame)
+    if not results.pose_landmarks:
+        return None
+    return landmarks_to_array(results.pose_landmarks.landmark)
+
+
+def detect_landmarks(index, shape, pose_options=None):
+    """In a worker: landmarks of the frame in slot `index`, read in place"""
+    return frame_landmarks(worker_frame(index, shape), pose_options)
+
+
+def warm_worker(delay, extra_pose_options=()):
+    """In a worker: build the pose graphs; the delay keeps this task from all landing on one worker"""
+    _pose_pool()
+    for pose_options in extra_pose_options:
+        _pose_pool(pose_options)
+    time.sleep(delay)
+    return os.getpid()
+
+
+class PoseWorkers:
+    """Process pool running MediaPipe Pose on frames handed over through a FrameRing.
+
+    Workers use the 'spawn' start method, like BatchExecutor, so they never
+    inherit the server's MediaPipe graphs or threads. pool_options are
+    PosePool arguments for each worker's single-slot pool.
+    """
+
+    def __init__(self, workers=POSE_WORKERS, slots=FRAME_RING_SLOTS, slot_bytes=None,
+                 timeout=FRAME_RING_TIMEOUT, **pool_options):
+        self.workers = max(1, int(workers))
+        self.ring = FrameRing(slots or 2 * self.workers, slot_bytes, timeout)
+        self.pool_options = pool_options
+        self.failed = 0
+        self._executor = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=init_worker,
+                    initargs=(self.ring.name, self.ring.slot_bytes, self.pool_options)
+                )
+            return self._executor
+
+    def warm_up(self, extra_pose_options=()):
+        """Start every worker and build its pose graphs before traffic arrives.
+
+        extra_pose_options lists the options of graphs to build besides the
+        default one (other quality tiers).
+        """
+        executor = self._get_executor()
+        extra_pose_options = list(extra_pose_options)
+        pids = {future.result() for future in [executor.submit(warm_worker, 0.2, extra_pose_options)
+                                               for _ in range(self.workers)]}
+        logger.info(f"{len(pids)} pose worker processes ready, {self.ring.slots} frame slots")
+        return self
+
+    def acquire(self, timeout=None):
+        """A free FrameSlot to decode into; raises RingFull when all are in flight"""
+        return self.ring.acquire(timeout)
+
+    def landmarks(self, slot, pose_options=None):
+        """Run pose inference on a decoded slot in a worker; (33, 4) landmarks or None.
+
+        pose_options (e.g. a quality tier's model_complexity) override the
+        pool options; each worker builds one pose graph per distinct set.
+        """
+        executor = self._get_executor()
+        try:
+            return executor.submit(detect_landmarks, slot.index, slot.shape, pose_options).result()
+        except BrokenProcessPool:
+            self.failed += 1
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    def stats(self):
+        stats = self.ring.stats()
+        stats['workers'] = self.workers
+        stats['failed'] = self.failed
+        return stats
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self.ring.close()
@@ -0,0 +1,181 @@
+"""Preprocessed training images as memory-mapped uint8 shards.
+
+Layout of a dataset directory:
+
+    index.json         shapes, shard list, sample count and the source CSV
+    images-00000.npy   uint8 (n, 64, 64, 3), one file per DATASET_SHARD_SIZE images
+    labels.npy         uint8 (N,) binary labels, in sample order
+    urls.txt           source URL of each sample, one per line
+    split.npz          train / val sample indices (a split is an index, not a copy)
+
+Images stay uint8 on disk and are normalised to float32 one batch at a time,
+so training memory depends on the batch size, not on the dataset size.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+DATASET_DIR = os.environ.get('DATASET_DIR', 'posture_dataset')
+DATASET_SHARD_SIZE = int(os.environ.get('DATASET_SHARD_SIZE', 4096))
+
+INDEX_FILE = 'index.json'
+LABELS_FILE = 'labels.npy'
+URLS_FILE = 'urls.txt'
+SPLIT_FILE = 'split.npz'
+FORMAT_VERSION = 1
+
+
+def source_signature(path):
+    """Identifies a source CSV version, so a changed CSV triggers a rebuild"""
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def _save_atomic(path, array):
+    tmp_path = path + '.part'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class ShardWriter:
+    """Appends uint8 images to fixed-size shards through one preallocated buffer"""
+
+    def __init__(self, directory, image_shape=(64, 64, 3), shard_size=DATASET_SHARD_SIZE):
+        self.directory = directory
+        self.image_shape = tuple(image_shape)
+        self.shard_size = shard_size
+        self.shards = []
+        self.labels = []
+        self.urls = []
+        self._buffer = np.empty((shard_size,) + self.image_shape, dtype=np.uint8)
+        self._filled = 0
+        os.makedirs(directory, exist_ok=True)
+        # Drop the index first so a half-rebuilt directory is never opened,
+        # then any shards and split left over from the previous build
+        for name in sorted(os.listdir(directory), key=lambda name: name != INDEX_FILE):
+            if name in (INDEX_FILE, LABELS_FILE, URLS_FILE, SPLIT_FILE) or (
+                    name.startswith('images-') and name.endswith('.npy')):
+                os.remove(os.path.join(directory, name))
+
+    def add(self, image, label, url=''):
+        self._buffer[self._filled] = image
+        self._filled += 1
+        self.labels.append(label)
+        self.urls.append(url)
+        if self._filled == self.shard_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._filled:
+            return
+        name = f'images-{len(self.shards):05d}.npy'
+        _save_atomic(os.path.join(self.directory, name), self._buffer[:self._filled])
+        self.shards.append({'file': name, 'count': self._filled})
+        self._filled = 0
+
+    def close(self, source=None, extra=None):
+        """Write the remaining images, labels and index; returns the index dict"""
+        self._flush()
+        _save_atomic(os.path.join(self.directory, LABELS_FILE), np.asarray(self.labels, dtype=np.uint8))
+        with open(os.path.join(self.directory, URLS_FILE), 'w') as f:
+            f.writelines(f'{url}\n' for url in self.urls)
+
+        index = {
+            'version': FORMAT_VERSION,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'image_shape': list(self.image_shape),
+            'dtype': 'uint8',
+            'count': len(self.labels),
+            'shards': self.shards,
+            'source': source,
+        }
+        if extra:
+            index.update(extra)
+        # The index goes last: a directory without one is an interrupted build
+        tmp_path = os.path.join(self.directory, INDEX_FILE + '.part')
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.directory, INDEX_FILE))
+        return index
+
+
+def stratified_split(labels, validation_split=0.2, seed=42):
+    """Per-class shuffled split of sample indices into (train, val)"""
+    rng = np.random.default_rng(seed)
+    train, val = [], []
+    for value in np.unique(labels):
+        members = np.flatnonzero(labels == value)
+        rng.shuffle(members)
+        n_val = int(round(len(members) * validation_split))
+        val.append(members[:n_val])
+        train.append(members[n_val:])
+    train = np.sort(np.concatenate(train)) if train else np.empty(0, dtype=np.int64)
+    val = np.sort(np.concatenate(val)) if val else np.empty(0, dtype=np.int64)
+    return train, val
+
+
+class PostureDataset:
+    """Read-only view of a dataset directory through memory maps"""
+
+    def __init__(self, directory=DATASET_DIR):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        if self.index.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported dataset format version: {self.index.get('version')}")
+
+        self.image_shape = tuple(self.index['image_shape'])
+        self.shards = [np.load(os.path.join(directory, shard['file']), mmap_mode='r')
+                       for shard in self.index['shards']]
+        # offsets[i] is the global index of shard i's first image
+        self.offsets = np.cumsum([0] + [shard['count'] for shard in self.index['shards']])
+        self.labels = np.load(os.path.join(directory, LABELS_FILE))
+
+    @staticmethod
+    def exists(directory=DATASET_DIR):
+        return os.path.exists(os.path.join(directory, INDEX_FILE))
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def matches_source(self, csv_path):
+        return self.index.get('source') == source_signature(csv_path)
+
+    def split(self, validation_split=0.2, seed=42):
+        """Stored (train, val) indices, recomputed only when the parameters change"""
+        path = os.path.join(self.directory, SPLIT_FILE)
+        if os.path.exists(path):
+            with np.load(path) as stored:
+                if float(stored['validation_split']) == validation_split and int(stored['seed']) == seed:
+                    return stored['train'], stored['val']
+
+        train, val = stratified_split(self.labels, validation_split, seed)
+        tmp_path = path + '.part.npz'
+        np.savez(tmp_path, train=train, val=val, validation_split=validation_split, seed=seed)
+        os.replace(tmp_path, path)
+        return train, val
+
+    def gather(self, indices, out=None):
+        """Copy the uint8 images at the given global indices into `out` (allocated if None)"""
+        indices = np.asarray(indices)
+        if out is None:
+            out = np.empty((len(indices),) + self.image_shape, dtype=np.uint8)
+        shard_ids = np.searchsorted(self.offsets, indices, side='right') - 1
+        for shard_id in np.unique(shard_ids):
+            positions = np.flatnonzero(shard_ids == shard_id)
+            # Sorted local indices read each memory-mapped shard front to back
+            local = indices[positions] - self.offsets[shard_id]
+            order = np.argsort(local, kind='stable')
+            out[positions[order]] = self.shards[shard_id][local[order]]
+        return out
+
+    def batch(self, indices, out=None):
+        """Images normalised to float32 in [0, 1] and their labels for one batch"""
+        images = self.gather(indices)
+        if out is None:
+            out = np.empty(images.shape, dtype=np.float32)
+        np.divide(images, np.float32(255), out=out)
+        return out, self.labels[indices]
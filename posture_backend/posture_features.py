@@ -0,0 +1,89 @@
+import numpy as np
+
+# MediaPipe PoseLandmark indices used by the posture measurements
+NOSE = 0
+LEFT_EAR = 7
+RIGHT_EAR = 8
+LEFT_SHOULDER = 11
+RIGHT_SHOULDER = 12
+LEFT_HIP = 23
+RIGHT_HIP = 24
+
+FEATURE_NAMES = (
+    'forward_head_distance',
+    'shoulder_imbalance',
+    'head_tilt',
+    'slouch_distance',
+    'total_misalignment',
+    'neck_angle',
+)
+
+FEATURE_DTYPE = np.dtype([(name, np.float32) for name in FEATURE_NAMES])
+
+# Gather order for the key joints: one fancy-index copy per batch
+_KEY_JOINTS = np.array([LEFT_EAR, RIGHT_EAR, LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_HIP, RIGHT_HIP])
+
+
+def compute_features(landmarks, absolute=False, out=None):
+    """Compute posture measurements for a batch of poses in vectorised passes.
+
+    landmarks: array of shape (N, 33, 4) (or (33, 4) for a single pose) with
+    normalised (x, y, z, visibility) rows, as produced by MediaPipe Pose.
+    absolute: report forward-head and slouch distances as magnitudes rather
+    than signed offsets (working_posture_app.py uses magnitudes, app.py
+    signed values).
+    out: optional preallocated structured array of FEATURE_DTYPE and length N.
+
+    Returns a structured array of FEATURE_DTYPE with one record per pose.
+    """
+    points = np.asarray(landmarks, dtype=np.float32)
+    if points.ndim == 2:
+        points = points[np.newaxis]
+    if points.ndim != 3 or points.shape[1] != 33 or points.shape[2] < 2:
+        raise ValueError(f'Expected landmarks of shape (N, 33, 4), got {points.shape}')
+
+    n = points.shape[0]
+    if out is None:
+        out = np.empty(n, dtype=FEATURE_DTYPE)
+    elif out.dtype != FEATURE_DTYPE or out.shape != (n,):
+        raise ValueError('out must be a FEATURE_DTYPE array with one record per pose')
+
+    # (N, 6, 2) x/y of ears, shoulders and hips
+    joints = points[:, _KEY_JOINTS, :2]
+    left_ear, right_ear = joints[:, 0], joints[:, 1]
+    left_shoulder, right_shoulder = joints[:, 2], joints[:, 3]
+    left_hip, right_hip = joints[:, 4], joints[:, 5]
+
+    # Midpoints
+    mid_ear = (left_ear + right_ear) * 0.5
+    mid_shoulder = (left_shoulder + right_shoulder) * 0.5
+    mid_hip = (left_hip + right_hip) * 0.5
+
+    head_offset = mid_ear[:, 0] - mid_shoulder[:, 0]
+    torso_offset = mid_shoulder[:, 0] - mid_hip[:, 0]
+    abs_head_offset = np.abs(head_offset)
+    abs_torso_offset = np.abs(torso_offset)
+
+    out['forward_head_distance'] = abs_head_offset if absolute else head_offset
+    out['shoulder_imbalance'] = np.abs(left_shoulder[:, 1] - right_shoulder[:, 1])
+    ear_delta = right_ear - left_ear
+    out['head_tilt'] = np.abs(np.arctan2(ear_delta[:, 1], ear_delta[:, 0]))
+    out['slouch_distance'] = abs_torso_offset if absolute else torso_offset
+    out['total_misalignment'] = abs_head_offset + abs_torso_offset
+
+    # Angle between the neck (shoulders -> ears) and torso (hips -> shoulders)
+    neck = mid_ear - mid_shoulder
+    torso = mid_shoulder - mid_hip
+    # atan2(|cross|, dot) equals acos(dot / norms) but stays accurate in float32
+    # for nearly parallel vectors, where acos loses most of its precision
+    dot = neck[:, 0] * torso[:, 0] + neck[:, 1] * torso[:, 1]
+    cross = neck[:, 0] * torso[:, 1] - neck[:, 1] * torso[:, 0]
+    degenerate = ((neck[:, 0] == 0) & (neck[:, 1] == 0)) | ((torso[:, 0] == 0) & (torso[:, 1] == 0))
+    out['neck_angle'] = np.where(degenerate, 90.0, np.degrees(np.arctan2(np.abs(cross), dot)))
+
+    return out
+
+
+def features_to_dict(record):
+    """Convert one FEATURE_DTYPE record to a dict of Python floats"""
+    return {name: float(record[name]) for name in FEATURE_NAMES}
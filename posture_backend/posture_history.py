@@ -0,0 +1,339 @@
+"""Per-user posture history with hourly, daily and all-time rollups.
+
+Analyses sent with a user id (X-User-Id header or `user_id` field) are
+appended to a SQLite database in WAL mode: one row per analysis with its
+measurements, score and issue codes. The same write transaction updates
+the user's rollups: the analysis count, score sum and lowest score for each
+hour and day bucket, plus the count of each issue code per bucket.
+
+Requests never wait for the disk. record() puts the row on a bounded queue
+and a writer thread commits whatever has queued up, up to
+HISTORY_BATCH_SIZE rows, in one transaction. Rollup deltas are summed per
+bucket before the upserts, so a burst of auto-mode frames from one user
+touches each bucket once. When the queue is full, rows are dropped and
+counted rather than blocking analysis.
+
+GET /users/<id>/trends reads only the buckets in the requested window
+through the rollup primary keys, so its cost depends on the window size, not
+on how much history the user has. Buckets are aligned to UTC. Client
+timestamps more than HISTORY_MAX_FUTURE_S ahead of the server clock are
+recorded at the server's time, and windows end at the current bucket, so a
+skewed or forged timestamp cannot park rows in future buckets.
+"""
+import logging
+import math
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from posture_features import FEATURE_NAMES
+
+logger = logging.getLogger(__name__)
+
+HISTORY_PATH = os.environ.get('POSTURE_HISTORY_PATH', 'posture_history.sqlite3')  # '' disables
+HISTORY_BATCH_SIZE = int(os.environ.get('HISTORY_BATCH_SIZE', 500))
+HISTORY_QUEUE_SIZE = int(os.environ.get('HISTORY_QUEUE_SIZE', 10000))
+# Clock skew allowed for client timestamps before they are replaced by the server's time
+HISTORY_MAX_FUTURE_S = float(os.environ.get('HISTORY_MAX_FUTURE_S', 300))
+# Default and largest trend windows
+TREND_HOURS = int(os.environ.get('TREND_HOURS', 48))
+TREND_DAYS = int(os.environ.get('TREND_DAYS', 30))
+TREND_MAX_HOURS = 24 * 14
+TREND_MAX_DAYS = 366
+
+# Rollup period -> bucket width in seconds; 'all' has a single bucket
+ROLLUP_PERIODS = {'hour': 3600, 'day': 86400, 'all': None}
+USER_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.@-]{1,128}$')
+
+SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS analyses (
+        user_id TEXT NOT NULL,
+        ts REAL NOT NULL,
+        tenant TEXT,
+        score REAL NOT NULL,
+        issue_codes TEXT NOT NULL,
+        {', '.join(f'{name} REAL' for name in FEATURE_NAMES)}
+    );
+    CREATE INDEX IF NOT EXISTS analyses_user_ts ON analyses (user_id, ts);
+    CREATE TABLE IF NOT EXISTS rollups (
+        user_id TEXT NOT NULL,
+        period TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        score_sum REAL NOT NULL,
+        score_min REAL NOT NULL,
+        PRIMARY KEY (user_id, period, bucket)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS rollup_issues (
+        user_id TEXT NOT NULL,
+        period TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        code TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, period, bucket, code)
+    ) WITHOUT ROWID;
+'''
+
+INSERT_ANALYSIS = (f'INSERT INTO analyses (user_id, ts, tenant, score, issue_codes, {", ".join(FEATURE_NAMES)}) '
+                   f'VALUES ({", ".join("?" * (5 + len(FEATURE_NAMES)))})')
+UPSERT_ROLLUP = '''
+    INSERT INTO rollups (user_id, period, bucket, count, score_sum, score_min) VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, period, bucket) DO UPDATE SET
+        count = count + excluded.count,
+        score_sum = score_sum + excluded.score_sum,
+        score_min = min(score_min, excluded.score_min)
+'''
+UPSERT_ROLLUP_ISSUE = '''
+    INSERT INTO rollup_issues (user_id, period, bucket, code, count) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, period, bucket, code) DO UPDATE SET count = count + excluded.count
+'''
+
+
+class HistoryError(ValueError):
+    """An invalid user id or trend window"""
+
+
+def parse_user_id(value):
+    """Validated user id from a header or field; None when absent"""
+    if not value:
+        return None
+    if not USER_ID_PATTERN.match(value):
+        raise HistoryError(f'Invalid user id {value!r}')
+    return value
+
+
+def parse_timestamp(value, default=None):
+    """Epoch seconds from an ISO 8601 string or epoch seconds/milliseconds.
+
+    Missing or unparseable timestamps fall back to `default` (now).
+    """
+    fallback = time.time() if default is None else default
+    if isinstance(value, bool) or value is None:
+        return fallback
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+        if not math.isfinite(seconds):
+            return fallback
+        # JavaScript clients send Date.now() in milliseconds
+        return seconds / 1000 if seconds > 1e11 else seconds
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        return fallback
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def bucket_start(ts, width):
+    return 0 if width is None else int(ts // width) * width
+
+
+def isoformat(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def history_row(user_id, timestamp, analysis, now=None):
+    """Row for the analyses table from the 'analysis' section of a response"""
+    now = time.time() if now is None else now
+    ts = parse_timestamp(timestamp, default=now)
+    if ts > now + HISTORY_MAX_FUTURE_S:
+        ts = now
+    measurements = analysis.get('technical_measurements', {})
+    return (user_id, ts, analysis.get('rules', {}).get('tenant'),
+            float(analysis['posture_score']), ','.join(analysis.get('issue_codes', ())),
+            *(measurements.get(name) for name in FEATURE_NAMES))
+
+
+class HistoryStore:
+    """Append-only analysis history and its rollups, written by one background thread"""
+
+    def __init__(self, path=HISTORY_PATH, batch_size=HISTORY_BATCH_SIZE, max_queue=HISTORY_QUEUE_SIZE):
+        self.path = path
+        self.batch_size = max(1, int(batch_size))
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._schema_ready = False
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_batch_size = 0
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if not self._schema_ready:
+                conn.executescript(SCHEMA)
+                self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._writer, name='posture-history', daemon=True)
+                self._thread.start()
+        return self
+
+    def record(self, user_id, timestamp, analysis):
+        """Queue one analysis for the user; never blocks"""
+        self.record_many([(user_id, timestamp, analysis)])
+
+    def record_many(self, entries):
+        """Queue (user_id, timestamp, analysis) entries, e.g. a batch upload's results"""
+        self.start()
+        for user_id, timestamp, analysis in entries:
+            try:
+                self._queue.put_nowait(history_row(user_id, timestamp, analysis))
+            except queue.Full:
+                self.dropped += 1
+                logger.debug("History queue is full; dropping an analysis")
+            except (KeyError, TypeError, ValueError) as e:
+                self.failed += 1
+                logger.warning(f"Cannot record analysis history: {e}")
+
+    def _writer(self):
+        while True:
+            batch = [self._queue.get()]
+            # Group commit: take whatever queued up while the last batch was written
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [row for row in batch if row is not None]
+            try:
+                if rows:
+                    self.write(rows)
+            except sqlite3.Error as e:
+                self.failed += len(rows)
+                logger.error(f"Failed to write {len(rows)} history rows: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if len(rows) < len(batch):
+                return
+
+    def write(self, rows):
+        """Insert analysis rows and fold them into the rollups in one transaction"""
+        rollups = defaultdict(lambda: [0, 0.0, math.inf])
+        issues = defaultdict(int)
+        for row in rows:
+            user_id, ts, score, codes = row[0], row[1], row[3], row[4]
+            for period, width in ROLLUP_PERIODS.items():
+                key = (user_id, period, bucket_start(ts, width))
+                rollup = rollups[key]
+                rollup[0] += 1
+                rollup[1] += score
+                rollup[2] = min(rollup[2], score)
+                for code in codes.split(',') if codes else ():
+                    issues[key + (code,)] += 1
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(INSERT_ANALYSIS, rows)
+            conn.executemany(UPSERT_ROLLUP, [key + tuple(value) for key, value in rollups.items()])
+            conn.executemany(UPSERT_ROLLUP_ISSUE, [key + (count,) for key, count in issues.items()])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self.written += len(rows)
+        self.batches += 1
+        self.last_batch_size = len(rows)
+
+    def flush(self):
+        """Block until every queued row has been written"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _period(self, user_id, period, start, end):
+        """Buckets of one rollup period from `start` to `end` inclusive, oldest first"""
+        conn = self._connect()
+        buckets = {}
+        for bucket, count, score_sum, score_min in conn.execute(
+                'SELECT bucket, count, score_sum, score_min FROM rollups '
+                'WHERE user_id = ? AND period = ? AND bucket >= ? AND bucket <= ? ORDER BY bucket',
+                (user_id, period, start, end)):
+            buckets[bucket] = {
+                'count': count,
+                'mean_score': round(score_sum / count, 1),
+                'min_score': round(score_min, 1),
+                'issues': {},
+            }
+        for bucket, code, count in conn.execute(
+                'SELECT bucket, code, count FROM rollup_issues '
+                'WHERE user_id = ? AND period = ? AND bucket >= ? AND bucket <= ?',
+                (user_id, period, start, end)):
+            if bucket in buckets:
+                buckets[bucket]['issues'][code] = count
+        return buckets
+
+    def _summary(self, buckets):
+        count = sum(bucket['count'] for bucket in buckets.values())
+        issues = defaultdict(int)
+        for bucket in buckets.values():
+            for code, issue_count in bucket['issues'].items():
+                issues[code] += issue_count
+        worst = min(buckets, key=lambda start: buckets[start]['mean_score'], default=None)
+        return {
+            'count': count,
+            'mean_score': round(sum(bucket['mean_score'] * bucket['count'] for bucket in buckets.values())
+                                / count, 1) if count else None,
+            'issue_frequencies': {code: round(issue_count / count, 4)
+                                  for code, issue_count in sorted(issues.items())},
+            'worst_period': dict(start=isoformat(worst), **{key: buckets[worst][key] for key in
+                                                            ('count', 'mean_score', 'min_score')})
+            if worst is not None else None,
+        }
+
+    def trends(self, user_id, hours=TREND_HOURS, days=TREND_DAYS, now=None):
+        """Score and issue trends over the last `hours` hourly and `days` daily buckets"""
+        if not 0 < hours <= TREND_MAX_HOURS or not 0 < days <= TREND_MAX_DAYS:
+            raise HistoryError(f'Trend windows are limited to {TREND_MAX_HOURS} hours and {TREND_MAX_DAYS} days')
+        now = time.time() if now is None else now
+        result = {'user_id': user_id}
+        for name, period, window in (('hourly', 'hour', hours), ('daily', 'day', days)):
+            width = ROLLUP_PERIODS[period]
+            end = bucket_start(now, width)
+            buckets = self._period(user_id, period, end - (window - 1) * width, end)
+            result[name] = dict(self._summary(buckets), window=window, buckets=[
+                dict(start=isoformat(start), **bucket) for start, bucket in buckets.items()
+            ])
+        all_time = self._period(user_id, 'all', 0, 0)
+        result['all_time'] = dict(self._summary(all_time),
+                                  min_score=all_time[0]['min_score'] if all_time else None)
+        del result['all_time']['worst_period']
+        return result
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'batches': self.batches,
+            'last_batch_size': self.last_batch_size,
+        }
+
+    def close(self):
+        """Write what is queued and stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
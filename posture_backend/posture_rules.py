@@ -0,0 +1,349 @@
+"""Data-driven posture rules: issue thresholds, scoring and recommendations.
+
+A rule table is a JSON-compatible dict (DEFAULT_RULES is the built-in one):
+
+    {
+      "version": "2024-06-01",
+      "score": {"base": 100, "min": 0},
+      "quality_bands": [{"min_score": 80, "label": "Good", "binary_prediction": 1}, ...],
+      "rules": {
+        "forward_head": {"feature": "forward_head_distance", "magnitude": true,
+                         "threshold": 0.08, "weight": 16.67},
+        ...
+      }
+    }
+
+A rule flags its issue when its feature value (minus `center`, and made
+absolute when `magnitude` is set) is above `threshold`, or below it for
+"op": "<". Each flagged rule takes `weight` off the score. The issue line,
+title and tips default to the issue_catalogue entry for the rule's code.
+
+RuleTable compiles a table once into NumPy vectors, so evaluate() scores
+any number of feature vectors with a handful of array comparisons. The
+issues, recommendations, score and quality of a result depend only on
+which rules fired. They are built once per combination as immutable
+Findings and shared between requests.
+
+Tenants can override the default table with a POSTURE_RULES_DIR/<tenant>.json
+file holding only the fields that change. Its rules are merged per code,
+and "enabled": false drops a rule. RuleRegistry compiles each tenant's
+table on first use and recompiles it when its file changes.
+"""
+import copy
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from issue_catalogue import ISSUE_CATALOGUE
+from posture_features import FEATURE_NAMES
+
+logger = logging.getLogger(__name__)
+
+# Directory of per-tenant rule tables (<tenant>.json)
+POSTURE_RULES_DIR = os.environ.get('POSTURE_RULES_DIR', 'rules')
+# How often (seconds) a tenant's file is checked for changes
+RULES_RELOAD_INTERVAL = float(os.environ.get('RULES_RELOAD_INTERVAL', 5))
+
+DEFAULT_TENANT = 'default'
+TENANT_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# Forward head and slouch distances count in both directions (working_posture_app
+# always did this with abs(); app.py compared the signed offsets)
+DEFAULT_RULES = {
+    'version': '1',
+    'score': {'base': 100.0, 'min': 0.0},
+    'quality_bands': [
+        {'min_score': 80, 'label': 'Good', 'binary_prediction': 1},
+        {'min_score': 60, 'label': 'Fair', 'binary_prediction': 0},
+        {'min_score': None, 'label': 'Poor', 'binary_prediction': 0},
+    ],
+    'rules': {
+        'forward_head': {'feature': 'forward_head_distance', 'magnitude': True, 'threshold': 0.08},
+        'shoulder_imbalance': {'feature': 'shoulder_imbalance', 'threshold': 0.05},
+        'head_tilt': {'feature': 'head_tilt', 'threshold': 0.2},
+        'slouching': {'feature': 'slouch_distance', 'magnitude': True, 'threshold': 0.05},
+        'alignment': {'feature': 'total_misalignment', 'threshold': 0.12},
+        'neck_angle': {'feature': 'neck_angle', 'center': 90.0, 'magnitude': True, 'threshold': 25.0},
+    },
+}
+# Score penalty of a rule without its own weight: six issues take the score to ~0
+DEFAULT_WEIGHT = 16.67
+
+
+class RuleError(ValueError):
+    """Raised for a rule table that cannot be compiled or an invalid tenant name"""
+
+
+class Recommendation(dict):
+    """A read-only {'issue': title, 'tips': [...]} payload, built once per rule"""
+
+    def __init__(self, code, title, tips):
+        super().__init__(issue=title, tips=tuple(tips))
+        self.__dict__['code'] = code
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('Recommendation objects are shared between requests and cannot be changed')
+
+    __setitem__ = __delitem__ = __setattr__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return Recommendation, (self.code, self['issue'], self['tips'])
+
+
+class Findings:
+    """Everything an analysis reports for one combination of flagged rules"""
+
+    __slots__ = ('mask', 'codes', 'issues', 'recommendations', 'count', 'score', 'quality',
+                 'binary_prediction')
+
+    def __init__(self, mask, codes, issues, recommendations, score, quality, binary_prediction):
+        self.mask = mask
+        self.codes = codes
+        self.issues = issues
+        self.recommendations = recommendations
+        self.count = len(codes)
+        self.score = score
+        self.quality = quality
+        self.binary_prediction = binary_prediction
+
+
+class RuleEvaluation:
+    """Result of RuleTable.evaluate for N feature vectors"""
+
+    def __init__(self, table, flags, masks, scores, bands):
+        self.table = table
+        self.flags = flags          # (N, R) bool, one column per rule
+        self.masks = masks          # (N,) uint64 bitmask of the flagged rules
+        self.issue_counts = flags.sum(axis=1)
+        self.scores = scores        # (N,) float64
+        self.bands = bands          # (N,) index into table.bands
+
+    def __len__(self):
+        return len(self.masks)
+
+    def findings(self, index):
+        return self.table.findings(int(self.masks[index]))
+
+
+def _content_hash(value):
+    encoded = json.dumps(value, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def merge_rules(base, override):
+    """A table spec with `override` (e.g. a tenant file) applied on top of `base`"""
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if key == 'rules':
+            for code, rule in value.items():
+                merged['rules'][code] = dict(merged['rules'].get(code, {}), **rule)
+        elif key == 'score':
+            merged['score'] = dict(merged['score'], **value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+class RuleTable:
+    """A compiled rule table"""
+
+    def __init__(self, spec=DEFAULT_RULES, tenant=DEFAULT_TENANT):
+        self.spec = spec
+        self.tenant = tenant
+        self.version = str(spec.get('version', '1'))
+        rules = [(code, rule) for code, rule in spec.get('rules', {}).items() if rule.get('enabled', True)]
+        if not rules:
+            raise RuleError(f'Rule table for {tenant!r} has no rules')
+        if len(rules) > 63:
+            raise RuleError('A rule table holds at most 63 rules')
+
+        self.codes = tuple(code for code, _ in rules)
+        self.indicators = tuple(f'{code}_binary' for code in self.codes)
+        try:
+            columns = [FEATURE_NAMES.index(rule['feature']) for _, rule in rules]
+            thresholds = [float(rule['threshold']) for _, rule in rules]
+        except (KeyError, ValueError, TypeError) as e:
+            raise RuleError(f'Invalid rule in table {tenant!r}: {e}') from e
+        if any(rule.get('op', '>') not in ('>', '<') for _, rule in rules):
+            raise RuleError(f"Rule op must be '>' or '<' in table {tenant!r}")
+
+        self.features = tuple(rules[i][1]['feature'] for i in range(len(rules)))
+        self._columns = np.array(columns, dtype=np.intp)
+        self._centers = np.array([float(rule.get('center', 0.0)) for _, rule in rules])
+        self._magnitude = np.array([bool(rule.get('magnitude', False)) for _, rule in rules])
+        # '<' rules are compared as -value > -threshold
+        self._signs = np.array([-1.0 if rule.get('op', '>') == '<' else 1.0 for _, rule in rules])
+        # Compared in float64, like the Python floats the rules replaced
+        self._thresholds = np.array(thresholds) * self._signs
+        self._weights = np.array([float(rule.get('weight', DEFAULT_WEIGHT)) for _, rule in rules])
+        self._bits = np.left_shift(np.uint64(1), np.arange(len(rules), dtype=np.uint64))
+
+        score = spec.get('score', {})
+        self.base_score = float(score.get('base', 100.0))
+        self.min_score = float(score.get('min', 0.0))
+        bands = sorted(spec.get('quality_bands', DEFAULT_RULES['quality_bands']),
+                       key=lambda band: -np.inf if band.get('min_score') is None else band['min_score'])
+        self.bands = tuple((band['label'], int(band.get('binary_prediction', 0))) for band in bands)
+        self._band_edges = np.array([-np.inf if band.get('min_score') is None else float(band['min_score'])
+                                     for band in bands])
+
+        # One immutable recommendation per rule, shared by every Findings
+        self._text = {}
+        for code, rule in rules:
+            entry = ISSUE_CATALOGUE.get(code, {})
+            issue, title, tips = (rule.get(key, entry.get(key)) for key in ('issue', 'title', 'tips'))
+            if issue is None or title is None or tips is None:
+                raise RuleError(f'Rule {code!r} has no catalogue entry; give it issue, title and tips')
+            self._text[code] = (issue, Recommendation(code, title, tips))
+
+        self.catalogue_version = _content_hash({code: (issue, dict(recommendation))
+                                                for code, (issue, recommendation) in self._text.items()})
+        # Everything that changes an analysis result (part of the result cache key)
+        self.fingerprint = _content_hash({'tenant': tenant, 'spec': spec})
+        self._findings = {}
+
+    def _values(self, features):
+        """(N, R) float64 rule inputs from a FEATURE_DTYPE array, an (N, F) array or one feature dict"""
+        if isinstance(features, dict):
+            return np.array([[features[name] for name in self.features]], dtype=np.float64)
+        features = np.asarray(features)
+        if features.dtype.names:
+            features = features.reshape(-1)
+            values = np.empty((len(features), len(self.features)), dtype=np.float64)
+            for index, name in enumerate(self.features):
+                values[:, index] = features[name]
+            return values
+        if features.ndim == 1:
+            features = features[np.newaxis]
+        if features.ndim != 2 or features.shape[1] != len(FEATURE_NAMES):
+            raise ValueError(f'Expected feature vectors of shape (N, {len(FEATURE_NAMES)}), got {features.shape}')
+        return features[:, self._columns].astype(np.float64, copy=False)
+
+    def evaluate(self, features):
+        """Flags, bitmasks, scores and quality bands for a batch of feature vectors"""
+        deltas = self._values(features) - self._centers
+        deltas = np.where(self._magnitude, np.abs(deltas), deltas)
+        flags = deltas * self._signs > self._thresholds
+        masks = (flags * self._bits).sum(axis=1, dtype=np.uint64)
+        scores = np.maximum(self.min_score, self.base_score - flags @ self._weights)
+        bands = np.searchsorted(self._band_edges, scores, side='right') - 1
+        return RuleEvaluation(self, flags, masks, scores, bands)
+
+    def indicators_for(self, flags):
+        """{'<code>_binary': 0/1} for one row of RuleEvaluation.flags"""
+        return {indicator: int(flag) for indicator, flag in zip(self.indicators, flags)}
+
+    def mask_of(self, analysis):
+        """Bitmask of the flagged rules from an analysis dict's binary indicators"""
+        mask = 0
+        for bit, indicator in enumerate(self.indicators):
+            if analysis.get(indicator):
+                mask |= 1 << bit
+        return mask
+
+    def findings(self, mask):
+        """The shared Findings for a bitmask of flagged rules"""
+        found = self._findings.get(mask)
+        if found is None:
+            selected = [index for index in range(len(self.codes)) if mask >> index & 1]
+            codes = tuple(self.codes[index] for index in selected)
+            score = max(self.min_score, self.base_score - float(sum(self._weights[selected])))
+            label, binary_prediction = self.bands[
+                int(np.searchsorted(self._band_edges, score, side='right')) - 1]
+            found = Findings(mask, codes,
+                             tuple(self._text[code][0] for code in codes),
+                             tuple(self._text[code][1] for code in codes),
+                             score, label, binary_prediction)
+            # Racing threads build equal objects; either one can win
+            found = self._findings.setdefault(mask, found)
+        return found
+
+    def catalogue(self):
+        """Issue text and tips by code, as served at /recommendations/catalogue"""
+        return {
+            'tenant': self.tenant,
+            'version': self.catalogue_version,
+            'issues': {
+                code: {'issue': issue, 'title': recommendation['issue'], 'tips': recommendation['tips']}
+                for code, (issue, recommendation) in self._text.items()
+            }
+        }
+
+    def describe(self):
+        return {'tenant': self.tenant, 'version': self.version, 'fingerprint': self.fingerprint}
+
+
+class RuleRegistry:
+    """Compiled rule tables per tenant, recompiled when a tenant's file changes"""
+
+    def __init__(self, directory=POSTURE_RULES_DIR, reload_interval=RULES_RELOAD_INTERVAL):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.default = self._load_default()
+        # tenant -> (table, file mtime, time of last check)
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def _load_default(self):
+        # A default.json in the directory overrides the built-in table for everyone
+        path = os.path.join(self.directory, f'{DEFAULT_TENANT}.json') if self.directory else None
+        if path and os.path.exists(path):
+            return RuleTable(merge_rules(DEFAULT_RULES, self._read(path)))
+        return RuleTable(DEFAULT_RULES)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise RuleError(f'Cannot read rule table {path}: {e}') from e
+
+    def get(self, tenant=None):
+        """The tenant's table; the default table for no tenant or one without a file"""
+        if not tenant or tenant == DEFAULT_TENANT or not self.directory:
+            return self.default
+        if not TENANT_PATTERN.match(tenant):
+            raise RuleError(f'Invalid tenant id {tenant!r}')
+
+        now = time.monotonic()
+        cached = self._tables.get(tenant)
+        if cached is not None and now - cached[2] < self.reload_interval:
+            return cached[0]
+
+        path = os.path.join(self.directory, f'{tenant}.json')
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime is None:
+            # Not cached, so arbitrary tenant ids cannot grow the registry
+            self._tables.pop(tenant, None)
+            return self.default
+        with self._lock:
+            cached = self._tables.get(tenant)
+            if cached is not None and cached[1] == mtime:
+                table = cached[0]
+            else:
+                try:
+                    table = RuleTable(merge_rules(self.default.spec, self._read(path)), tenant=tenant)
+                    logger.info(f"Compiled rule table for tenant {tenant!r} (version {table.version})")
+                except RuleError as e:
+                    if cached is None:
+                        raise
+                    # Keep serving the last good table rather than failing every request
+                    logger.error(f"Keeping the previous rule table for {tenant!r}: {e}")
+                    table = cached[0]
+            self._tables[tenant] = (table, mtime, now)
+        return table
+
+    def stats(self):
+        tables = {tenant: entry[0].describe() for tenant, entry in list(self._tables.items())}
+        tables[DEFAULT_TENANT] = self.default.describe()
+        return {'directory': self.directory, 'tables': tables}
@@ -0,0 +1,311 @@
+"""Training and export for the posture CNN.
+
+PostureTrainer adds dataset building, training and TFLite export to
+PostureModel. Importing this module loads pandas and TensorFlow, so serving
+code imports posture_model instead.
+"""
+import pandas as pd
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+from io import BytesIO
+from tensorflow.keras.models import Model
+from tensorflow.keras.layers import Input, Conv2D, MaxPooling2D, Flatten, Dense, Dropout, BatchNormalization
+from tensorflow.keras.preprocessing.image import img_to_array
+from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
+from tensorflow.keras.optimizers import Adam
+from tensorflow.keras.utils import Sequence
+import math
+import tempfile
+from image_fetcher import FETCH_CACHE_DIR, FETCH_WORKERS, FetchError, ImageFetcher
+from posture_dataset import DATASET_DIR, PostureDataset, ShardWriter, source_signature
+from posture_model import PostureModel
+from tflite_model import TFLITE_THREADS, TFLiteModel
+
+class DatasetSequence(Sequence):
+    """Batches streamed from memory-mapped dataset shards, normalised one batch at a time"""
+    
+    def __init__(self, dataset, indices, batch_size=32, shuffle=True, seed=42):
+        super().__init__()
+        self.dataset = dataset
+        self.indices = np.asarray(indices)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        self.on_epoch_end()
+    
+    def __len__(self):
+        return math.ceil(len(self.indices) / self.batch_size)
+    
+    def __getitem__(self, i):
+        return self.dataset.batch(self.order[i * self.batch_size:(i + 1) * self.batch_size])
+    
+    def on_epoch_end(self):
+        self.order = self.rng.permutation(self.indices) if self.shuffle else self.indices
+
+class PostureTrainer(PostureModel):
+    """PostureModel plus dataset building, training and TFLite export"""
+    
+    def __init__(self, model_path='posture_model.h5', cache_dir=FETCH_CACHE_DIR, fetch_workers=FETCH_WORKERS,
+                 num_threads=TFLITE_THREADS):
+        super().__init__(model_path, num_threads=num_threads)
+        # Downloads are cached on disk by URL, so a restarted load_data
+        # only fetches the images it doesn't have yet
+        self.fetcher = ImageFetcher(cache_dir=cache_dir, workers=fetch_workers,
+                                    progress=self.report_fetch_progress)
+        
+    def decode_and_resize(self, data, size=(64, 64)):
+        """Decode downloaded image bytes and preprocess for the model"""
+        img = Image.open(BytesIO(data)).convert('RGB')
+        img = img.resize(size)
+        return img_to_array(img) / 255.0
+    
+    def decode_to_uint8(self, data, size=(64, 64)):
+        """Decode and resize downloaded image bytes, keeping 8-bit pixels for storage"""
+        img = Image.open(BytesIO(data)).convert('RGB')
+        return np.asarray(img.resize(size), dtype=np.uint8)
+    
+    def download_and_resize(self, url, size=(64, 64)):
+        """Download and preprocess image from URL"""
+        try:
+            return self.decode_and_resize(self.fetcher.fetch(url), size)
+        except (FetchError, OSError) as e:
+            print(f"Image error for {url}: {e}")
+            return None
+    
+    def report_fetch_progress(self, stats):
+        print(f"Processed {stats['done']}/{stats['total']} images "
+              f"({stats['cached']} cached, {stats['failed']} failed, {stats['retries']} retries) - "
+              f"{stats['images_per_sec']} img/s, {stats['mb_per_sec']} MB/s")
+    
+    def read_labelled_rows(self, csv_path):
+        """Return (urls, labels) for the CSV rows that have a label"""
+        df = pd.read_csv(csv_path)
+        
+        # Get label - first non-empty value among the known column names
+        label_column = pd.Series(None, index=df.index, dtype=object)
+        for col in ['overall_posture', 'overall posture', 'posture_score']:
+            if col in df.columns:
+                label_column = label_column.where(label_column.notna(), df[col])
+        
+        # Rows without a label are never downloaded
+        labelled = df[label_column.notna()]
+        # Convert label to binary (0 for bad posture, 1 for good posture)
+        labels = [int(float(label)) for label in label_column[labelled.index]]
+        print(f"{len(labelled)} labelled samples of {len(df)}")
+        return labelled['file_url'].tolist(), labels
+    
+    def load_data(self, csv_path):
+        """Load and preprocess data from CSV"""
+        urls, row_labels = self.read_labelled_rows(csv_path)
+        
+        images, labels = [], []
+        
+        print(f"Loading {len(urls)} samples...")
+        
+        # Download and preprocess images concurrently, in CSV order
+        results = self.fetcher.fetch_all(urls, transform=self.decode_and_resize)
+        for i, url, img, error in results:
+            if img is not None:
+                images.append(img)
+                labels.append(row_labels[i])
+        
+        print(f"Successfully loaded {len(images)} images")
+        return np.array(images), np.array(labels)
+    
+    def build_dataset(self, csv_path, dataset_dir=DATASET_DIR, size=(64, 64)):
+        """Download and resize the labelled images into uint8 dataset shards for training"""
+        urls, row_labels = self.read_labelled_rows(csv_path)
+        
+        print(f"Building dataset in {dataset_dir}...")
+        writer = ShardWriter(dataset_dir, image_shape=(size[1], size[0], 3))
+        results = self.fetcher.fetch_all(urls, transform=lambda data: self.decode_to_uint8(data, size))
+        for i, url, img, error in results:
+            if img is not None:
+                writer.add(img, row_labels[i], url)
+        
+        index = writer.close(source=source_signature(csv_path),
+                             extra={'failed': self.fetcher.stats.failed})
+        print(f"Stored {index['count']} images in {len(index['shards'])} shards")
+        return PostureDataset(dataset_dir)
+    
+    def open_dataset(self, csv_path=None, dataset_dir=DATASET_DIR, rebuild=False):
+        """Open the preprocessed dataset, building it first if missing or built from an older CSV"""
+        if not rebuild and PostureDataset.exists(dataset_dir):
+            dataset = PostureDataset(dataset_dir)
+            if csv_path is None or dataset.matches_source(csv_path):
+                print(f"Using preprocessed dataset in {dataset_dir} ({len(dataset)} images)")
+                return dataset
+            print("CSV changed since the dataset was built, rebuilding")
+        if csv_path is None:
+            raise FileNotFoundError(f"No dataset in {dataset_dir} and no CSV to build it from")
+        return self.build_dataset(csv_path, dataset_dir)
+    
+    def build_model(self):
+        """Build CNN model for posture classification"""
+        image_input = Input(shape=self.input_shape)
+        
+        # First Conv Block
+        x = Conv2D(32, (3, 3), activation='relu', padding='same')(image_input)
+        x = BatchNormalization()(x)
+        x = MaxPooling2D((2, 2))(x)
+        x = Dropout(0.25)(x)
+        
+        # Second Conv Block
+        x = Conv2D(64, (3, 3), activation='relu', padding='same')(x)
+        x = BatchNormalization()(x)
+        x = MaxPooling2D((2, 2))(x)
+        x = Dropout(0.25)(x)
+        
+        # Third Conv Block
+        x = Conv2D(128, (3, 3), activation='relu', padding='same')(x)
+        x = BatchNormalization()(x)
+        x = MaxPooling2D((2, 2))(x)
+        x = Dropout(0.25)(x)
+        
+        # Dense layers
+        x = Flatten()(x)
+        x = Dense(128, activation='relu')(x)
+        x = Dropout(0.5)(x)
+        x = Dense(64, activation='relu')(x)
+        x = Dropout(0.5)(x)
+        
+        # Output layer
+        output = Dense(1, activation='sigmoid')(x)
+        
+        model = Model(inputs=image_input, outputs=output)
+        
+        # Compile model
+        model.compile(
+            optimizer=Adam(learning_rate=0.001),
+            loss='binary_crossentropy',
+            metrics=['accuracy']
+        )
+        
+        return model
+    
+    def train(self, csv_path, validation_split=0.2, epochs=50, batch_size=32,
+              dataset_dir=DATASET_DIR, rebuild=False):
+        """Train the posture classification model.
+
+        Images come from the uint8 dataset shards in dataset_dir, built from
+        csv_path on first use, so retraining skips download and preprocessing.
+        """
+        # Load data
+        dataset = self.open_dataset(csv_path, dataset_dir, rebuild=rebuild)
+        
+        if len(dataset) == 0:
+            raise ValueError("No valid images loaded from CSV")
+        
+        # Split data: stored sample indices, not copies of the images
+        train_idx, val_idx = dataset.split(validation_split, seed=42)
+        y_train = dataset.labels[train_idx]
+        
+        print(f"Training samples: {len(train_idx)}")
+        print(f"Validation samples: {len(val_idx)}")
+        print(f"Good posture samples: {np.sum(y_train)}")
+        print(f"Bad posture samples: {len(y_train) - np.sum(y_train)}")
+        
+        # Build model
+        self.model = self.build_model()
+        self.model.summary()
+        
+        # Callbacks
+        callbacks = [
+            EarlyStopping(patience=10, restore_best_weights=True),
+            ModelCheckpoint(self.model_path, save_best_only=True, monitor='val_accuracy')
+        ]
+        
+        # Train model
+        history = self.model.fit(
+            DatasetSequence(dataset, train_idx, batch_size=batch_size, shuffle=True),
+            validation_data=DatasetSequence(dataset, val_idx, batch_size=batch_size, shuffle=False),
+            epochs=epochs,
+            callbacks=callbacks,
+            verbose=1
+        )
+        
+        # Save model
+        self.model.save(self.model_path)
+        print(f"Model saved to {self.model_path}")
+        
+        return history
+    
+    def representative_images(self, dataset_dir=DATASET_DIR, count=200, seed=42):
+        """A random sample of training-split images, float32 in [0, 1], for int8 calibration"""
+        dataset = PostureDataset(dataset_dir)
+        train_idx, _ = dataset.split(seed=seed)
+        rng = np.random.default_rng(seed)
+        chosen = np.sort(rng.choice(train_idx, size=min(count, len(train_idx)), replace=False))
+        images, _ = dataset.batch(chosen)
+        return images
+    
+    def export_tflite(self, output_path, quantization='float16', representative_images=None,
+                      dataset_dir=DATASET_DIR):
+        """Convert the trained Keras model to a TFLite file.
+
+        quantization is None (float32), 'float16' (weights stored as float16,
+        half the size, computed in float32) or 'int8' (full-integer
+        post-training quantisation with int8 input and output tensors). int8
+        calibrates activation ranges on representative_images, float32 images
+        in [0, 1], by default a sample of the training split in dataset_dir.
+        """
+        if quantization not in (None, 'float16', 'int8'):
+            raise ValueError(f"Unknown quantization {quantization!r}; use None, 'float16' or 'int8'")
+        if self.model is None:
+            self.load_model()
+        if isinstance(self.model, TFLiteModel):
+            raise ValueError(f"{self.model_path} is already a TFLite export; load the Keras model to export it")
+        
+        with tempfile.TemporaryDirectory() as saved_model_dir:
+            # Going through a SavedModel (inference graph, dynamic batch
+            # dimension) works for both Keras 2 and Keras 3 models, unlike
+            # TFLiteConverter.from_keras_model
+            self.model.export(saved_model_dir)
+            converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+            data = self._convert(converter, quantization, representative_images, dataset_dir)
+        
+        with open(output_path, 'wb') as f:
+            f.write(data)
+        print(f"Exported {quantization or 'float32'} TFLite model to {output_path} ({len(data) / 1024:.0f} KiB)")
+        return output_path
+    
+    def _convert(self, converter, quantization, representative_images, dataset_dir):
+        """Apply the quantization settings to the converter and run it"""
+        if quantization == 'float16':
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.target_spec.supported_types = [tf.float16]
+        elif quantization == 'int8':
+            if representative_images is None:
+                representative_images = self.representative_images(dataset_dir)
+            
+            def representative_dataset():
+                for image in representative_images:
+                    yield [image[np.newaxis].astype(np.float32)]
+            
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = representative_dataset
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+            converter.inference_input_type = tf.int8
+            converter.inference_output_type = tf.int8
+        
+        return converter.convert()
+
+# Usage example
+if __name__ == "__main__":
+    # Initialize model
+    posture_model = PostureTrainer()
+    
+    # Train model (uncomment to train)
+    # history = posture_model.train('your_posture_data.csv')
+    
+    # Load pre-trained model for inference
+    # posture_model.load_model()
+    
+    # Make prediction on new image
+    # result = posture_model.predict(your_image_array)
+    # print(result)
+    
+    # Export for the TFLite runtime, then serve with PostureModel('posture_model_int8.tflite')
+    # posture_model.export_tflite('posture_model_fp16.tflite', quantization='float16')
+    # posture_model.export_tflite('posture_model_int8.tflite', quantization='int8')
\ No newline at end of file
@@ -0,0 +1,237 @@
+"""Quality tiers: a per-request trade-off between pose accuracy and latency.
+
+A tier fixes the MediaPipe Pose model complexity (0 lite, 1 full, 2 heavy),
+the detection confidence, and the longest side the upload is decoded to.
+Each tier has its own PosePool, so switching tiers never rebuilds a graph.
+
+A request names its tier (X-Quality-Tier header or `quality` form field),
+or sends a latency budget (X-Latency-Budget-Ms header or `latency_budget_ms`
+field) and gets the most accurate tier whose recent server-side latency
+fits the budget. The estimates start from TIER_LATENCY_PRIORS_MS and follow
+the measured decode and inference time of each tier's requests (an
+exponentially weighted moving average). Upload I/O is left out, since a slow
+client says nothing about the model. An estimate with no new measurements
+decays back toward its prior (half-life TIER_LATENCY_DECAY_S). A tier that
+one cold or unlucky request priced out of every budget is then tried again.
+
+MediaPipe downloads the lite and heavy models on first use. A tier whose
+model cannot be loaded is marked unavailable, and its requests are served by
+the nearest available tier instead.
+"""
+import logging
+import os
+import threading
+import time
+
+from image_decode import DECODE_MAX_SIDE
+from pose_pool import POSE_POOL_MAX_USES, POSE_POOL_SIZE, PosePool
+
+logger = logging.getLogger(__name__)
+
+# Ordered from fastest to most accurate
+QUALITY_TIERS = {
+    'fast': {'model_complexity': 0, 'min_detection_confidence': 0.5, 'max_side': 384},
+    'balanced': {'model_complexity': 1, 'min_detection_confidence': 0.5, 'max_side': DECODE_MAX_SIDE},
+    'accurate': {'model_complexity': 2, 'min_detection_confidence': 0.5, 'max_side': 1024},
+}
+DEFAULT_QUALITY_TIER = os.environ.get('QUALITY_TIER', 'balanced')
+
+# Starting latency estimates per tier, in ms, until requests are measured
+TIER_LATENCY_PRIORS_MS = {'fast': 30.0, 'balanced': 60.0, 'accurate': 180.0}
+# Weight of each new measurement in a tier's latency estimate
+TIER_LATENCY_SMOOTHING = float(os.environ.get('TIER_LATENCY_SMOOTHING', 0.2))
+# Half-life, in seconds, of an estimate's distance from the prior while no requests are measured
+TIER_LATENCY_DECAY_S = float(os.environ.get('TIER_LATENCY_DECAY_S', 60))
+
+
+class TierError(ValueError):
+    """An unknown tier name or an invalid latency budget"""
+
+
+def parse_budget(value):
+    """Latency budget in ms from a header or form value; None when absent"""
+    if value is None or value == '':
+        return None
+    try:
+        budget = float(value)
+    except ValueError:
+        raise TierError(f'Latency budget must be a number of milliseconds, got {value!r}')
+    if not budget > 0:
+        raise TierError('Latency budget must be positive')
+    return budget
+
+
+class QualityTiers:
+    """The configured tiers, one lazily built PosePool each, and their latency estimates.
+
+    A tier spec may set `pool_size` to size its pool separately from
+    POSE_POOL_SIZE, e.g. a single heavy instance for occasional reports.
+    """
+
+    def __init__(self, tiers=QUALITY_TIERS, default=DEFAULT_QUALITY_TIER, pool_size=POSE_POOL_SIZE,
+                 max_uses=POSE_POOL_MAX_USES, priors_ms=TIER_LATENCY_PRIORS_MS,
+                 smoothing=TIER_LATENCY_SMOOTHING, decay_s=TIER_LATENCY_DECAY_S):
+        if default not in tiers:
+            raise TierError(f'Default quality tier {default!r} is not one of {", ".join(tiers)}')
+        self.tiers = {name: dict(spec) for name, spec in tiers.items()}
+        self.default = default
+        self.smoothing = smoothing
+        self.decay_s = decay_s
+        self.pools = {
+            name: PosePool(size=spec.get('pool_size', pool_size), max_uses=max_uses,
+                           model_complexity=spec['model_complexity'],
+                           min_detection_confidence=spec['min_detection_confidence'])
+            for name, spec in self.tiers.items()
+        }
+        self.unavailable = {}
+        self._checked = set()
+        self._priors_ms = {name: float(priors_ms.get(name, 0.0)) for name in self.tiers}
+        self._latency_ms = dict(self._priors_ms)
+        self._updated_at = dict.fromkeys(self.tiers, time.monotonic())
+        self._measured = dict.fromkeys(self.tiers, 0)
+        self.selected = dict.fromkeys(self.tiers, 0)
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+        # Separate, as a first use can take seconds (a model download)
+        self._check_lock = threading.Lock()
+
+    @property
+    def names(self):
+        return list(self.tiers)
+
+    def spec(self, name):
+        return self.tiers[name]
+
+    def pool(self, name):
+        return self.pools[name]
+
+    def _check(self, name):
+        """Build one pose instance of the tier on first use; False if its model cannot load"""
+        if name in self._checked:
+            return name not in self.unavailable
+        with self._check_lock:
+            if name not in self._checked:
+                try:
+                    with self.pools[name].acquire():
+                        pass
+                except Exception as e:
+                    logger.warning(f"Quality tier {name!r} is unavailable: {e}")
+                    self.unavailable[name] = str(e)
+                self._checked.add(name)
+        return name not in self.unavailable
+
+    def available(self, name):
+        return self._check(name)
+
+    def _nearest_available(self, name):
+        """`name` if it can run, else the closest tier in order, preferring faster ones"""
+        names = self.names
+        index = names.index(name)
+        for candidate in sorted(names, key=lambda other: (abs(names.index(other) - index),
+                                                          names.index(other))):
+            if self._check(candidate):
+                return candidate
+        raise TierError('No quality tier can load its pose model')
+
+    def for_budget(self, budget_ms):
+        """The most accurate available tier whose latency estimate fits the budget.
+
+        When none fits, the fastest available tier is the best effort.
+        """
+        candidates = [name for name in self.names if self._check(name)]
+        if not candidates:
+            raise TierError('No quality tier can load its pose model')
+        for name in reversed(candidates):
+            if self._current_ms(name) <= budget_ms:
+                return name
+        return candidates[0]
+
+    def resolve(self, requested=None, budget_ms=None):
+        """(tier, how it was selected) for a request's tier name and latency budget.
+
+        A named tier wins over a budget. Raises TierError for unknown names.
+        """
+        if requested:
+            if requested not in self.tiers:
+                raise TierError(f'Unknown quality tier {requested!r}; use one of {", ".join(self.tiers)}')
+            tier, selected_by = requested, 'request'
+        elif budget_ms is not None:
+            tier, selected_by = self.for_budget(budget_ms), 'budget'
+        else:
+            tier, selected_by = self.default, 'default'
+
+        served = self._nearest_available(tier)
+        with self._lock:
+            self.selected[served] += 1
+            if served != tier:
+                self.fallbacks += 1
+        return served, selected_by
+
+    def _current_ms(self, name, now=None):
+        """The tier's estimate, decayed toward its prior for the time since it was last measured"""
+        prior = self._priors_ms[name]
+        idle = (now if now is not None else time.monotonic()) - self._updated_at[name]
+        if self.decay_s <= 0 or idle <= 0:
+            return self._latency_ms[name]
+        return prior + (self._latency_ms[name] - prior) * 0.5 ** (idle / self.decay_s)
+
+    def observe(self, name, seconds):
+        """Fold one measured decode + inference time into the tier's estimate"""
+        with self._lock:
+            now = time.monotonic()
+            estimate = self._current_ms(name, now)
+            # Blended like every other sample, so one cold start cannot replace the prior
+            self._latency_ms[name] = estimate + self.smoothing * (seconds * 1000 - estimate)
+            self._updated_at[name] = now
+            self._measured[name] += 1
+
+    def estimate_ms(self, name):
+        return round(self._current_ms(name), 2)
+
+    def analysis_params(self, name):
+        """Tier settings that change the analysis result (part of the result cache key)"""
+        spec = self.tiers[name]
+        return {
+            'model_complexity': spec['model_complexity'],
+            'min_detection_confidence': spec['min_detection_confidence'],
+            'decode_max_side': spec['max_side'],
+        }
+
+    def pose_options(self, name):
+        """The tier's PosePool arguments, e.g. for a pose worker process"""
+        spec = self.tiers[name]
+        return {
+            'model_complexity': spec['model_complexity'],
+            'min_detection_confidence': spec['min_detection_confidence'],
+        }
+
+    def warm_up(self):
+        """Build and warm every tier's pool; tiers whose model cannot load are marked unavailable"""
+        for name, pool in self.pools.items():
+            try:
+                pool.warm_up()
+            except Exception as e:
+                logger.warning(f"Quality tier {name!r} is unavailable: {e}")
+                self.unavailable[name] = str(e)
+            self._checked.add(name)
+        if self.default in self.unavailable:
+            raise TierError(f'Default quality tier {self.default!r} cannot load its pose model: '
+                            f'{self.unavailable[self.default]}')
+        return self
+
+    def stats(self):
+        return {
+            'default': self.default,
+            'fallbacks': self.fallbacks,
+            'tiers': {
+                name: dict(spec, available=name not in self.unavailable if name in self._checked else None,
+                           error=self.unavailable.get(name), selected=self.selected[name],
+                           measured=self._measured[name], latency_estimate_ms=self.estimate_ms(name),
+                           pool=self.pools[name].stats())
+                for name, spec in self.tiers.items()
+            },
+        }
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
@@ -0,0 +1,108 @@
+"""Compact API responses: MessagePack negotiation, field projection and gzip.
+
+A client that sends `Accept: application/msgpack` gets MessagePack (when
+the msgpack package is installed) instead of JSON. A `fields` parameter,
+given as comma-separated dotted paths such as
+`fields=analysis.posture_score,analysis.issue_codes`, keeps only those parts
+of the body. `success` and `error` are always kept. `fields=compact` is
+shorthand for COMPACT_FIELDS: the scores and codes that change between
+frames, without the tip text, debug data or echoed metadata.
+
+Responses of at least GZIP_MIN_BYTES are gzipped for clients that accept
+it, but only if the compressed body is actually smaller.
+"""
+import gzip
+import os
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+# Older names clients send for MessagePack; answered as MSGPACK_MIMETYPE
+MSGPACK_ALIASES = ('application/x-msgpack', 'application/vnd.msgpack')
+
+# Smaller bodies fit one packet anyway and only pay the compression cost
+GZIP_MIN_BYTES = int(os.environ.get('GZIP_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+COMPRESSIBLE_MIMETYPES = (JSON_MIMETYPE, MSGPACK_MIMETYPE, 'text/plain')
+
+COMPACT_FIELDS = (
+    'analysis.posture_score',
+    'analysis.ml_prediction',
+    'analysis.cnn_prediction',
+    'analysis.issue_codes',
+    'analysis.technical_measurements',
+    'analysis.binary_indicators',
+    'timestamp',
+    'reused',
+    'quality.tier',
+    'quality.latency_ms',
+)
+ALWAYS_KEPT = ('success', 'error')
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def offered_mimetypes():
+    """Response types this server can produce, JSON first (the default for */*)"""
+    if msgpack is None:
+        return [JSON_MIMETYPE]
+    return [JSON_MIMETYPE, MSGPACK_MIMETYPE] + list(MSGPACK_ALIASES)
+
+
+def negotiate(accept_mimetypes):
+    """JSON_MIMETYPE or MSGPACK_MIMETYPE for a request's parsed Accept header"""
+    best = accept_mimetypes.best_match(offered_mimetypes(), default=JSON_MIMETYPE)
+    return MSGPACK_MIMETYPE if best in MSGPACK_ALIASES else best
+
+
+def parse_fields(value):
+    """Dotted field paths from a `fields` parameter; None keeps the whole body"""
+    if not value:
+        return None
+    if value.strip() == 'compact':
+        return COMPACT_FIELDS
+    return tuple(path.strip() for path in value.split(',') if path.strip())
+
+
+def project(body, fields):
+    """A copy of `body` holding only the dotted paths in `fields` that exist"""
+    if fields is None:
+        return body
+    projected = {key: body[key] for key in ALWAYS_KEPT if key in body}
+    for path in fields:
+        source, target = body, projected
+        *parents, leaf = path.split('.')
+        for key in parents:
+            if not isinstance(source, dict) or not isinstance(source.get(key), dict):
+                break
+            source = source[key]
+            target = target.setdefault(key, {})
+        else:
+            if isinstance(source, dict) and leaf in source:
+                target[leaf] = source[leaf]
+    return projected
+
+
+def pack(body):
+    """MessagePack encoding of a JSON-compatible body"""
+    return msgpack.packb(body, use_bin_type=True)
+
+
+def gzip_response(response, accept_encodings):
+    """Gzip a Flask response in place when the client accepts it and it shrinks the body"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code in (204, 304) or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or not accept_encodings['gzip']):
+        return response
+    data = response.get_data()
+    if len(data) < GZIP_MIN_BYTES:
+        return response
+    compressed = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if len(compressed) < len(data):
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_BACKEND = os.environ.get('RESULT_CACHE_BACKEND', 'memory')  # memory | sqlite | none
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 1024))
+RESULT_CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', 3600))
+RESULT_CACHE_PATH = os.environ.get('RESULT_CACHE_PATH', 'posture_cache.sqlite3')
+
+
+def make_cache_key(data, params):
+    """Hash the uploaded bytes together with every parameter that affects the result"""
+    digest = hashlib.sha256(data)
+    digest.update(b'\0')
+    digest.update(json.dumps(params, sort_keys=True, separators=(',', ':')).encode())
+    return digest.hexdigest()
+
+
+class MemoryBackend:
+    """In-process LRU with a per-entry TTL"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """On-disk LRU shared by every worker process that opens the same file"""
+
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute('SELECT value, expires FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            conn.execute('DELETE FROM results WHERE key = ?', (key,))
+            self.evictions += 1
+            return None
+        conn.execute('UPDATE results SET accessed = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            'INSERT OR REPLACE INTO results (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+            (key, json.dumps(value), now + self.ttl, now)
+        )
+        # Trim expired rows first, then least recently used ones over the limit
+        deleted = conn.execute('DELETE FROM results WHERE expires < ?', (now,)).rowcount
+        deleted += conn.execute('''
+            DELETE FROM results WHERE key IN (
+                SELECT key FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_entries,)).rowcount
+        self.evictions += max(0, deleted)
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+
+class ResultCache:
+    """Content-addressed cache of posture analysis results with hit/miss counters"""
+
+    def __init__(self, backend=RESULT_CACHE_BACKEND, max_entries=RESULT_CACHE_SIZE,
+                 ttl=RESULT_CACHE_TTL, path=RESULT_CACHE_PATH):
+        self.backend_name = backend
+        if backend == 'sqlite':
+            self.backend = SQLiteBackend(path, max_entries, ttl)
+        elif backend == 'memory':
+            self.backend = MemoryBackend(max_entries, ttl)
+        elif backend in ('none', '', None):
+            self.backend = None
+        else:
+            raise ValueError(f'Unknown result cache backend: {backend}')
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def get(self, key):
+        if self.backend is None:
+            return None
+        try:
+            value = self.backend.get(key)
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache lookup failed: {e}")
+            value = None
+        with self._counter_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.backend is None:
+            return
+        try:
+            self.backend.put(key, value)
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache store failed: {e}")
+
+    def status(self, hit):
+        """Value for the X-Cache response header"""
+        if self.backend is None:
+            return 'BYPASS'
+        return 'HIT' if hit else 'MISS'
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.backend_name,
+            'entries': len(self.backend) if self.backend is not None else 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.backend.evictions if self.backend is not None else 0,
+        }
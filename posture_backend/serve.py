@@ -0,0 +1,328 @@
+"""Production entry point: pre-forked worker processes for the posture API.
+
+Usage:
+    python serve.py --workers 4 --threads 8 --port 5001
+
+The parent process imports the heavy modules and runs the fork-safe part of
+the warm-up (working_posture_app.preload) once, then binds the listening
+socket and forks the workers, which share those pages copy-on-write. Each
+worker builds and warms its own pose pool, then reports ready and starts
+accepting connections on the shared socket. A worker that is still warming
+up never calls accept(), so it takes no traffic. Connections that arrive
+before any worker is ready wait in the listen backlog.
+
+Each worker queues at most --max-pending connections for its thread pool,
+counting those being served. Beyond that a connection is answered 503 with
+Retry-After straight from the accept loop, as the ASGI front end does. On
+SIGTERM a worker stops accepting, closes its idle keep-alive connections
+and gives in-flight requests up to --graceful-timeout seconds to finish. It
+then closes the app's resources (working_posture_app.close_resources), so
+queued jobs and history rows are finished, and exits.
+
+Every worker writes its metrics to a directory shared with the other
+workers (--metrics-dir, a fresh temporary one by default). A scrape of
+/metrics on any worker reports the sum over all of them, so it doesn't
+matter which worker the scrape lands on (see metrics.Registry.share).
+
+Every option can also be set through the environment (POSTURE_WORKERS,
+POSTURE_THREADS, POSTURE_HOST, POSTURE_PORT, POSTURE_MAX_PENDING,
+POSTURE_GRACEFUL_TIMEOUT, POSTURE_METRICS_DIR), so each deployment can size
+itself without code changes.
+"""
+import argparse
+import glob
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+logger = logging.getLogger('posture.serve')
+
+KEEPALIVE_TIMEOUT = float(os.environ.get('POSTURE_KEEPALIVE_TIMEOUT', 15))
+RETRY_AFTER = 1
+BUSY_BODY = b'{"error": "Server is busy, retry later", "success": false}'
+BUSY_RESPONSE = (b'HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\n'
+                 b'Retry-After: %d\r\nContent-Length: %d\r\nConnection: close\r\n\r\n%s'
+                 % (RETRY_AFTER, len(BUSY_BODY), BUSY_BODY))
+
+
+class RequestHandler(WSGIRequestHandler):
+    # Idle keep-alive connections would otherwise pin a pool thread forever
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
+
+    def handle_one_request(self):
+        # Waiting for the next request line, the connection is idle and a stop may close it
+        if not self.server.connection_idle(self.connection):
+            self.close_connection = True
+            return
+        try:
+            super().handle_one_request()
+        finally:
+            self.server.connection_busy(self.connection)
+        if self.server.stopping:
+            self.close_connection = True
+
+    def parse_request(self):
+        self.server.connection_busy(self.connection)
+        return super().parse_request()
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug server that handles connections on a fixed-size thread pool.
+
+    At most `max_pending` connections are queued or served at once; more
+    are answered 503 without reaching the pool.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd=None, max_pending=None):
+        # BaseWSGIServer calls server_close() on its placeholder socket when
+        # given an fd, so the executor must only exist after __init__
+        self._executor = None
+        super().__init__(host, port, app, handler=RequestHandler, fd=fd)
+        self.max_pending = max(threads, max_pending or 0)
+        self.pending = 0
+        self.rejected = 0
+        self.stopping = False
+        self._idle = set()
+        self._lock = threading.Lock()
+        self._drained = threading.Condition(self._lock)
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='posture-http')
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            busy = self.pending >= self.max_pending
+            if not busy:
+                self.pending += 1
+        if busy:
+            self._reject(request)
+            return
+        self._executor.submit(self._handle, request, client_address)
+
+    def _reject(self, request):
+        self.rejected += 1
+        logger.debug("%d connections already pending, answering 503", self.pending)
+        try:
+            request.settimeout(1)
+            request.sendall(BUSY_RESPONSE)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._lock:
+                self._idle.discard(request)
+                self.pending -= 1
+                if self.pending == 0:
+                    self._drained.notify_all()
+
+    def connection_idle(self, connection):
+        """Mark a keep-alive connection as waiting for its next request; False once stopping"""
+        with self._lock:
+            if self.stopping:
+                return False
+            self._idle.add(connection)
+            return True
+
+    def connection_busy(self, connection):
+        with self._lock:
+            self._idle.discard(connection)
+
+    def stop(self):
+        """Stop accepting and close idle keep-alive connections; safe to call from a signal handler"""
+        with self._lock:
+            self.stopping = True
+            for connection in self._idle:
+                try:
+                    # The handler's pending read returns EOF and the connection is closed
+                    connection.shutdown(socket.SHUT_RD)
+                except OSError:
+                    pass
+        # shutdown() waits for serve_forever(), which runs in the thread being signalled
+        threading.Thread(target=self.shutdown, name='posture-stop', daemon=True).start()
+
+    def drain(self, timeout):
+        """Wait up to `timeout` seconds for in-flight requests; True if none are left"""
+        with self._lock:
+            return self._drained.wait_for(lambda: self.pending == 0, timeout)
+
+    def server_close(self):
+        super().server_close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the posture API with pre-forked workers')
+    parser.add_argument('--host', default=os.environ.get('POSTURE_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('POSTURE_PORT', 5001)))
+    parser.add_argument('--workers', type=int,
+                        default=int(os.environ.get('POSTURE_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('POSTURE_THREADS', 8)))
+    parser.add_argument('--backlog', type=int, default=int(os.environ.get('POSTURE_BACKLOG', 1024)))
+    parser.add_argument('--max-pending', type=int, default=int(os.environ.get('POSTURE_MAX_PENDING', 64)),
+                        help='connections queued or being served per worker before new ones get 503')
+    parser.add_argument('--graceful-timeout', type=float,
+                        default=float(os.environ.get('POSTURE_GRACEFUL_TIMEOUT', 30)),
+                        help='seconds a stopping worker waits for in-flight requests')
+    parser.add_argument('--metrics-dir', default=os.environ.get('POSTURE_METRICS_DIR', ''),
+                        help='directory the workers share their metrics through (temporary by default)')
+    return parser.parse_args(argv)
+
+
+def bind_socket(host, port, backlog):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(worker_id, listen_sock, args, ready_fd):
+    """Body of a forked worker process; never returns"""
+    server = None
+
+    def stop(signum, frame):
+        if server is None:
+            # Still warming up: nothing is in flight
+            raise SystemExit(0)
+        server.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    exit_code = 0
+    try:
+        import working_posture_app
+
+        # Per-worker warm-up: builds this worker's MediaPipe graphs
+        app = working_posture_app.create_app({'WARM_UP': True})
+        working_posture_app.metrics_registry.share(args.metrics_dir)
+        server = PooledWSGIServer(args.host, args.port, app, threads=args.threads,
+                                  fd=listen_sock.fileno(), max_pending=args.max_pending)
+        os.write(ready_fd, f'{worker_id}\n'.encode())
+        os.close(ready_fd)
+        server.serve_forever()
+        if not server.drain(args.graceful_timeout):
+            logger.warning(f"Worker {worker_id} stopping with {server.pending} requests unfinished")
+    except SystemExit:
+        pass
+    except Exception as e:
+        logger.error(f"Worker {worker_id} crashed: {e}")
+        exit_code = 1
+    finally:
+        # os._exit() skips interpreter shutdown, so queued jobs and history rows are finished here
+        if 'working_posture_app' in sys.modules:
+            sys.modules['working_posture_app'].close_resources()
+            sys.modules['working_posture_app'].metrics_registry.close()
+        os._exit(exit_code)
+
+
+class Arbiter:
+    """Forks the workers, waits for them to report ready and replaces any that die"""
+
+    def __init__(self, args):
+        self.args = args
+        self.workers = {}
+        self.stopping = False
+
+    def spawn(self, worker_id):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            run_worker(worker_id, self.listen_sock, self.args, write_fd)
+        os.close(write_fd)
+        self.workers[pid] = worker_id
+        return read_fd
+
+    def wait_ready(self, read_fd, worker_id):
+        with os.fdopen(read_fd, 'rb') as pipe:
+            if pipe.readline().strip():
+                logger.info(f"Worker {worker_id} ready")
+                return True
+        logger.error(f"Worker {worker_id} exited before becoming ready")
+        return False
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        import working_posture_app
+
+        start = time.perf_counter()
+        working_posture_app.preload()
+        logger.info(f"Pre-fork warm-up finished in {time.perf_counter() - start:.2f}s")
+
+        temporary_metrics_dir = not self.args.metrics_dir
+        if temporary_metrics_dir:
+            self.args.metrics_dir = tempfile.mkdtemp(prefix='posture-metrics-')
+        else:
+            # Counters start from zero with every server
+            os.makedirs(self.args.metrics_dir, exist_ok=True)
+            for path in glob.glob(os.path.join(self.args.metrics_dir, '*.json')):
+                os.remove(path)
+
+        self.listen_sock = bind_socket(self.args.host, self.args.port, self.args.backlog)
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        pending = [(self.spawn(i), i) for i in range(self.args.workers)]
+        ready = sum(self.wait_ready(fd, i) for fd, i in pending)
+        logger.info(f"{ready}/{self.args.workers} workers ready on "
+                    f"http://{self.args.host}:{self.args.port} "
+                    f"({self.args.threads} threads each)")
+
+        while self.workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            worker_id = self.workers.pop(pid, None)
+            if worker_id is None or self.stopping:
+                continue
+            logger.warning(f"Worker {worker_id} (pid {pid}) exited with status {status}, restarting")
+            time.sleep(1)
+            self.wait_ready(self.spawn(worker_id), worker_id)
+
+        self.listen_sock.close()
+        if temporary_metrics_dir:
+            shutil.rmtree(self.args.metrics_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(message)s')
+    args = parse_args(argv)
+    if args.workers < 1 or args.threads < 1:
+        sys.exit('--workers and --threads must be at least 1')
+    if args.max_pending < args.threads:
+        sys.exit('--max-pending must be at least --threads')
+    Arbiter(args).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Production entry point for the ASGI front end (asgi_app) under uvicorn.
+
+Usage:
+    python serve_asgi.py [--host 0.0.0.0] [--port 5001] [--workers N] [--threads M]
+
+Each uvicorn worker process holds its open connections on one event loop
+and runs request handling on --threads executor threads (the core count by
+default), so with many slow clients one worker per box is usually enough.
+--limit-concurrency caps the open connections per worker (503 beyond it).
+With several workers, their metrics are summed through a shared directory
+(POSTURE_METRICS_DIR, temporary by default) as under serve.py. The live
+WebSocket is only served by serve.py.
+"""
+import argparse
+import glob
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+from asgi_app import ASGI_EXECUTOR_THREADS, ASGI_MAX_PENDING
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the posture API over ASGI with uvicorn')
+    parser.add_argument('--host', default=os.environ.get('POSTURE_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('POSTURE_PORT', 5001)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('POSTURE_WORKERS', 1)))
+    parser.add_argument('--threads', type=int, default=ASGI_EXECUTOR_THREADS)
+    parser.add_argument('--max-pending', type=int, default=ASGI_MAX_PENDING)
+    parser.add_argument('--limit-concurrency', type=int, default=None)
+    parser.add_argument('--backlog', type=int, default=int(os.environ.get('POSTURE_BACKLOG', 2048)))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    import uvicorn
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(message)s')
+    args = parse_args(argv)
+    if args.workers < 1 or args.threads < 1:
+        sys.exit('--workers and --threads must be at least 1')
+    # The workers build the app from the factory and read these back
+    os.environ['ASGI_EXECUTOR_THREADS'] = str(args.threads)
+    os.environ['ASGI_MAX_PENDING'] = str(args.max_pending)
+    temporary_metrics_dir = args.workers > 1 and not os.environ.get('POSTURE_METRICS_DIR')
+    if temporary_metrics_dir:
+        os.environ['POSTURE_METRICS_DIR'] = tempfile.mkdtemp(prefix='posture-metrics-')
+    elif os.environ.get('POSTURE_METRICS_DIR'):
+        # Counters start from zero with every server
+        for path in glob.glob(os.path.join(os.environ['POSTURE_METRICS_DIR'], '*.json')):
+            os.remove(path)
+    try:
+        uvicorn.run('asgi_app:create_asgi_app', factory=True, host=args.host, port=args.port,
+                    workers=args.workers, limit_concurrency=args.limit_concurrency,
+                    backlog=args.backlog, log_level='warning')
+    finally:
+        if temporary_metrics_dir:
+            shutil.rmtree(os.environ['POSTURE_METRICS_DIR'], ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
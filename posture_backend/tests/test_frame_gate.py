@@ -0,0 +1,64 @@
+"""Frame gate signatures: still scenes match, local head/shoulder movement does not"""
+import cv2
+import numpy as np
+import pytest
+
+from frame_gate import FRAME_GATE_DISTANCE, FrameGate, frame_signature, signature_distance
+
+
+def person(width=1080, height=1440, contrast=1.0):
+    """Drawn figure on a gradient background"""
+    img = np.tile(np.linspace(90, 150, width, dtype=np.float32), (height, 1))
+    img = np.dstack([img] * 3)
+    cx = width // 2
+    cv2.circle(img, (cx, height // 6), width // 12, (40, 40, 40), -1)
+    cv2.line(img, (cx - width // 5, height // 3), (cx + width // 5, height // 3), (30, 30, 30), width // 30)
+    cv2.rectangle(img, (cx - width // 8, height // 3), (cx + width // 8, 2 * height // 3), (60, 60, 60), -1)
+    img = 128 + (img - 128) * contrast
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def shift_top(img, dx):
+    """Head and shoulders (top third) moved sideways; the rest of the frame unchanged"""
+    out = img.copy()
+    top = img.shape[0] // 3
+    out[:top] = np.roll(img[:top], dx, axis=1)
+    return out
+
+
+def encode(img, quality=90):
+    return cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+@pytest.mark.parametrize('contrast', [1.0, 0.25])
+def test_noise_and_exposure_stay_under_threshold(contrast):
+    img = person(contrast=contrast)
+    base = frame_signature(encode(img))
+    noisy = np.clip(img + np.random.default_rng(0).normal(0, 6, img.shape), 0, 255).astype(np.uint8)
+    for variant in (encode(img, 70), encode(noisy), encode(cv2.convertScaleAbs(img, alpha=1.1, beta=10))):
+        assert signature_distance(base, frame_signature(variant)) <= FRAME_GATE_DISTANCE
+
+
+@pytest.mark.parametrize('contrast', [1.0, 0.25])
+@pytest.mark.parametrize('dx', [15, 30, 60])
+def test_local_shift_is_a_change(contrast, dx):
+    img = person(contrast=contrast)
+    distance = signature_distance(frame_signature(encode(img)), frame_signature(encode(shift_top(img, dx))))
+    assert distance > FRAME_GATE_DISTANCE
+
+
+def test_gate_reuses_only_unchanged_frames():
+    img = person()
+    gate = FrameGate(max_age=30)
+    gate.store('phone', frame_signature(encode(img)), ('balanced',), {'posture_score': 80}, cost=0.05)
+
+    analysis, info = gate.lookup('phone', frame_signature(encode(img, 80)), ('balanced',))
+    assert info['outcome'] == 'reused' and analysis == {'posture_score': 80}
+    analysis, info = gate.lookup('phone', frame_signature(encode(shift_top(img, 30))), ('balanced',))
+    assert info['outcome'] == 'changed' and analysis is None
+    _, info = gate.lookup('phone', frame_signature(encode(img)), ('accurate',))
+    assert info['outcome'] == 'new'
+
+
+def test_undecodable_bytes_have_no_signature():
+    assert frame_signature(b'not an image') is None
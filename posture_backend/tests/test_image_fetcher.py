@@ -0,0 +1,161 @@
+"""ImageFetcher against a local HTTP stand-in server"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import image_fetcher
+from image_fetcher import FetchError, ImageFetcher
+
+IMAGE = b'\xff\xd8' + bytes(range(256)) * 64
+
+
+class StandIn:
+    """HTTP server answering each path with a scripted list of responses.
+
+    A response is (status, headers, body) or 'truncated' (a 200 whose
+    Content-Length promises more than is sent). The last one repeats.
+    """
+
+    def __init__(self):
+        self.scripts = {}
+        self.hits = {}
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                hits = stand_in.hits.get(self.path, 0)
+                stand_in.hits[self.path] = hits + 1
+                script = stand_in.scripts[self.path]
+                step = script[min(hits, len(script) - 1)]
+                if step == 'truncated':
+                    self.send_response(200)
+                    self.send_header('Content-Length', str(len(IMAGE)))
+                    self.end_headers()
+                    self.wfile.write(IMAGE[:len(IMAGE) // 2])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                status, headers, body = step
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path, *script):
+        self.scripts[path] = script
+        return f'http://127.0.0.1:{self.server.server_port}{path}'
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def server():
+    stand_in = StandIn()
+    yield stand_in
+    stand_in.close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record retry sleeps instead of sleeping"""
+    delays = []
+    monkeypatch.setattr(image_fetcher.time, 'sleep', delays.append)
+    return delays
+
+
+def make_fetcher(tmp_path, **kwargs):
+    kwargs.setdefault('retries', 3)
+    kwargs.setdefault('timeout', 5)
+    return ImageFetcher(cache_dir=str(tmp_path / 'cache'), progress=None, **kwargs)
+
+
+def test_retries_5xx_then_succeeds(server, sleeps, tmp_path):
+    url = server.url('/flaky.jpg', (503, {}, b'busy'), (500, {}, b'oops'), (200, {}, IMAGE))
+    fetcher = make_fetcher(tmp_path)
+    assert fetcher.fetch(url) == IMAGE
+    assert server.hits['/flaky.jpg'] == 3
+    assert fetcher.stats.retries == 2
+    assert len(sleeps) == 2
+
+
+def test_gives_up_after_retries(server, sleeps, tmp_path):
+    url = server.url('/down.jpg', (503, {}, b'busy'))
+    fetcher = make_fetcher(tmp_path, retries=2)
+    with pytest.raises(FetchError, match='HTTP 503'):
+        fetcher.fetch(url)
+    assert server.hits['/down.jpg'] == 3
+
+
+def test_client_error_is_not_retried(server, sleeps, tmp_path):
+    url = server.url('/missing.jpg', (404, {}, b'no'))
+    with pytest.raises(FetchError):
+        make_fetcher(tmp_path).fetch(url)
+    assert server.hits['/missing.jpg'] == 1
+    assert sleeps == []
+
+
+def test_truncated_body_is_retried(server, sleeps, tmp_path):
+    url = server.url('/cut.jpg', 'truncated', (200, {}, IMAGE))
+    fetcher = make_fetcher(tmp_path)
+    assert fetcher.fetch(url) == IMAGE
+    assert server.hits['/cut.jpg'] == 2
+    assert fetcher.stats.retries == 1
+
+
+def test_gzip_body_is_not_mistaken_for_truncated(server, sleeps, tmp_path):
+    import gzip
+    url = server.url('/gz.jpg', (200, {'Content-Encoding': 'gzip'}, gzip.compress(IMAGE)))
+    assert make_fetcher(tmp_path).fetch(url) == IMAGE
+    assert server.hits['/gz.jpg'] == 1
+
+
+def test_429_honours_retry_after(server, sleeps, tmp_path):
+    url = server.url('/limited.jpg', (429, {'Retry-After': '2'}, b''), (200, {}, IMAGE))
+    fetcher = make_fetcher(tmp_path)
+    assert fetcher.fetch(url) == IMAGE
+    assert sleeps == [2.0]
+
+
+def test_retry_after_is_capped(server, sleeps, tmp_path):
+    url = server.url('/slow.jpg', (429, {'Retry-After': '86400'}, b''), (200, {}, IMAGE))
+    fetcher = make_fetcher(tmp_path, max_retry_after=5)
+    assert fetcher.fetch(url) == IMAGE
+    assert sleeps == [5]
+
+
+def test_cache_hit_skips_download(server, tmp_path):
+    url = server.url('/cached.jpg', (200, {}, IMAGE))
+    fetcher = make_fetcher(tmp_path)
+    assert fetcher.fetch(url) == IMAGE
+    assert fetcher.fetch(url) == IMAGE
+    # A restarted job finds the same bytes on disk
+    assert make_fetcher(tmp_path).fetch(url) == IMAGE
+    assert server.hits['/cached.jpg'] == 1
+    assert fetcher.stats.downloaded == 1
+    assert fetcher.stats.cached == 1
+
+
+def test_fetch_all_keeps_input_order(server, tmp_path):
+    urls = [server.url(f'/{i}.jpg', (200, {}, IMAGE + bytes([i]))) for i in range(20)]
+    urls.append(server.url('/gone.jpg', (404, {}, b'')))
+    fetcher = make_fetcher(tmp_path, workers=4)
+    results = list(fetcher.fetch_all(urls))
+    assert [index for index, _, _, _ in results] == list(range(21))
+    assert all(data == IMAGE + bytes([i]) for i, (_, _, data, _) in enumerate(results[:20]))
+    assert results[-1][2] is None and isinstance(results[-1][3], FetchError)
+    assert fetcher.stats.failed == 1
+    fetcher.close()
@@ -0,0 +1,26 @@
+import threading
+import time
+
+from jobs import JobQueue
+
+
+def test_close_runs_queued_jobs_and_stops_workers():
+    queue = JobQueue(lambda payload: (time.sleep(0.01) or {'n': payload}, 200), workers=2, max_queue=16)
+    jobs = [queue.submit(n) for n in range(10)]
+
+    queue.close()
+
+    assert all(job.status == 'done' for job in jobs)
+    assert [job.result['n'] for job in jobs] == list(range(10))
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith('posture-job-')]
+
+
+def test_submit_after_close_starts_new_workers():
+    queue = JobQueue(lambda payload: ({}, 200), workers=1)
+    queue.submit(None)
+    queue.close()
+
+    job = queue.submit(None)
+
+    assert job.done.wait(5)
+    queue.close()
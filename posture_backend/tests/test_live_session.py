@@ -0,0 +1,54 @@
+import json
+
+from live_session import LiveSession
+
+
+class ScriptedSocket:
+    """Hands the session its next frame each time a result is sent, then hangs up"""
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.sent = []
+        self.slot = None
+
+    def feed(self):
+        if self.messages:
+            self.slot.put((len(self.sent) + 1, self.messages.pop(0), 0.0))
+        else:
+            self.slot.close()
+
+    def send(self, message):
+        self.sent.append(json.loads(message))
+        self.feed()
+
+
+def analyze_frame(frame_bytes, pose=None):
+    if frame_bytes == b'boom':
+        raise RuntimeError('inference failed')
+    return {'success': True, 'analysis': frame_bytes.decode()}
+
+
+def run_frames(*messages):
+    ws = ScriptedSocket(messages)
+    session = LiveSession(ws, analyze_frame)
+    ws.slot = session.slot
+    ws.feed()
+    session._process_frames(pose=None)
+    return session, ws.sent
+
+
+def test_failing_frame_gets_an_error_and_the_session_continues():
+    session, sent = run_frames(b'one', b'boom', b'three')
+
+    assert [result['success'] for result in sent] == [True, False, True]
+    assert sent[1]['error'] == 'Internal server error: inference failed'
+    assert sent[1]['frame'] == 2
+    assert sent[2]['analysis'] == 'three'
+    assert session.processed == 3
+
+
+def test_undecodable_text_frame_gets_an_error():
+    _, sent = run_frames('not base64!')
+
+    assert sent[0]['success'] is False
+    assert sent[0]['error'] == 'Frames must be binary JPEG or base64 text'
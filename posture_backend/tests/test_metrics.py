@@ -0,0 +1,76 @@
+import json
+import os
+
+import pytest
+
+from metrics import Registry
+
+
+def build():
+    registry = Registry()
+    requests = registry.counter('requests_total', 'Requests', ['outcome'])
+    seconds = registry.histogram('request_seconds', 'Latency', buckets=(0.1, 1.0))
+    registry.gauge('queue_depth', 'Queued', lambda: 3)
+    return registry, requests, seconds
+
+
+def samples(text):
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if not line.startswith('#'))
+
+
+def other_process(directory, pid, exited=False):
+    registry, requests, seconds = build()
+    requests.inc('ok', amount=5)
+    requests.inc('error')
+    seconds.observe(0.5)
+    with open(os.path.join(directory, f'{pid}.json'), 'w') as f:
+        json.dump({'pid': pid, 'exited': exited,
+                   'metrics': {metric.name: list(metric.samples()) for metric in registry._metrics}}, f)
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry, requests, seconds = build()
+    requests.inc('ok', amount=2)
+    seconds.observe(0.05)
+    registry.share(str(tmp_path), interval=60)
+    yield registry
+    registry.close()
+
+
+def test_unshared_registry_reports_own_values():
+    registry, requests, _ = build()
+    requests.inc('ok')
+    assert samples(registry.render())['requests_total{outcome="ok"}'] == '1'
+
+
+def test_shared_registry_sums_other_processes(registry, tmp_path):
+    other_process(str(tmp_path), os.getppid())
+
+    values = samples(registry.render())
+
+    assert values['requests_total{outcome="ok"}'] == '7'
+    assert values['requests_total{outcome="error"}'] == '1'
+    assert values['request_seconds_bucket{le="0.1"}'] == '1'
+    assert values['request_seconds_bucket{le="1.0"}'] == '2'
+    assert values['request_seconds_count'] == '2'
+    assert values['request_seconds_sum'] == '0.55'
+    assert values['queue_depth'] == '6'
+
+
+def test_exited_process_keeps_counters_but_not_gauges(registry, tmp_path):
+    other_process(str(tmp_path), os.getppid(), exited=True)
+
+    values = samples(registry.render())
+
+    assert values['requests_total{outcome="ok"}'] == '7'
+    assert values['queue_depth'] == '3'
+
+
+def test_close_writes_final_snapshot(registry, tmp_path):
+    registry.close()
+
+    with open(tmp_path / f'{os.getpid()}.json') as f:
+        snapshot = json.load(f)
+    assert snapshot['exited']
+    assert ['requests_total{outcome="ok"}', 2] in snapshot['metrics']['requests_total']
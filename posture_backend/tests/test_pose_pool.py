@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+import pose_pool
+from pose_pool import PosePool
+
+
+class FakePose:
+    def __init__(self):
+        self.calls = 0
+        self.closed = False
+
+    def process(self, image):
+        self.calls += 1
+
+    def close(self):
+        self.closed = True
+
+
+class FakePooledPose(pose_pool.PooledPose):
+    def __init__(self, pose_options):
+        self.pose = FakePose()
+        self.uses = 0
+
+
+@pytest.fixture(autouse=True)
+def fake_mediapipe(monkeypatch):
+    monkeypatch.setattr(pose_pool, 'PooledPose', FakePooledPose)
+
+
+def test_recycled_instance_is_warmed_before_reuse():
+    pool = PosePool(size=1, max_uses=2)
+    for _ in range(2):
+        with pool.acquire() as instance:
+            instance.process(None)
+    first = instance
+
+    with pool.acquire() as replacement:
+        assert replacement is not first
+        assert first.pose.closed
+        # One warm-up inference, before any request used it
+        assert replacement.pose.calls == 1
+        assert replacement.uses == 0
+    assert pool.recycled == 1
+
+
+def test_failed_instance_is_replaced():
+    pool = PosePool(size=1)
+    with pytest.raises(RuntimeError):
+        with pool.acquire():
+            raise RuntimeError('inference failed')
+
+    assert pool.stats()['recycled'] == 1
+    assert pool.stats()['idle'] == 1
+
+
+def test_recycled_count_is_exact_under_concurrency():
+    pool = PosePool(size=4, max_uses=1)
+
+    def worker():
+        for _ in range(200):
+            with pool.acquire() as instance:
+                instance.process(None)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert pool.recycled == 1600
@@ -0,0 +1,58 @@
+import pytest
+
+import posture_history
+from posture_history import HistoryStore, history_row
+
+NOW = 1_750_000_000.0
+HOUR = 3600
+DAY = 86400
+
+
+def analysis(score, *codes):
+    return {'posture_score': score, 'issue_codes': list(codes), 'technical_measurements': {}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.sqlite3'))
+    yield store
+    store.close()
+
+
+def test_history_row_keeps_small_clock_skew():
+    ts = NOW + posture_history.HISTORY_MAX_FUTURE_S / 2
+    assert history_row('u', ts, analysis(80), now=NOW)[1] == ts
+
+
+def test_history_row_replaces_far_future_timestamp_with_server_time():
+    assert history_row('u', NOW + 3 * DAY, analysis(80), now=NOW)[1] == NOW
+    assert history_row('u', (NOW + 3 * DAY) * 1000, analysis(80), now=NOW)[1] == NOW
+
+
+def test_history_row_keeps_past_timestamp():
+    assert history_row('u', NOW - 3 * DAY, analysis(80), now=NOW)[1] == NOW - 3 * DAY
+
+
+def test_trend_windows_end_at_the_current_bucket(store):
+    # Rows written directly, as they would be by an older server without the clamp
+    store.write([history_row('u', NOW - HOUR, analysis(90), now=NOW),
+                 history_row('u', NOW, analysis(70, 'head_forward'), now=NOW),
+                 history_row('u', NOW + 3 * DAY, analysis(10, 'slouching'), now=NOW + 3 * DAY)])
+
+    trends = store.trends('u', hours=24, days=7, now=NOW)
+
+    assert trends['hourly']['count'] == 2
+    assert trends['hourly']['mean_score'] == 80.0
+    assert trends['hourly']['issue_frequencies'] == {'head_forward': 0.5}
+    assert trends['daily']['count'] == 2
+    assert trends['all_time']['count'] == 3
+
+
+def test_recorded_future_rows_land_in_the_current_bucket(store):
+    store.record('u', 4_102_444_800, analysis(60))
+    store.flush()
+
+    trends = store.trends('u', hours=2, days=2)
+
+    assert trends['hourly']['count'] == 1
+    assert trends['daily']['count'] == 1
@@ -0,0 +1,51 @@
+"""Latency estimates behind X-Latency-Budget-Ms tier selection"""
+import pytest
+
+import quality_tiers
+from quality_tiers import QualityTiers
+
+PRIORS = {'fast': 30.0, 'balanced': 60.0, 'accurate': 180.0}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(quality_tiers.time, 'monotonic', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def tiers(clock):
+    tiers = QualityTiers(priors_ms=PRIORS, smoothing=0.2, decay_s=60)
+    # Pose pools are built lazily; mark every tier as loadable without building one
+    tiers._checked.update(tiers.names)
+    yield tiers
+    tiers.close()
+
+
+def test_first_measurement_is_blended_with_the_prior(tiers):
+    tiers.observe('balanced', 3.5)
+    assert tiers.estimate_ms('balanced') == pytest.approx(60 + 0.2 * (3500 - 60))
+
+
+def test_estimates_follow_measurements(tiers):
+    for _ in range(50):
+        tiers.observe('balanced', 0.040)
+    assert tiers.estimate_ms('balanced') == pytest.approx(40, abs=0.5)
+
+
+def test_slow_outlier_does_not_lock_a_tier_out(tiers, clock):
+    tiers.observe('balanced', 3.5)
+    assert tiers.for_budget(100) == 'fast'
+    # Without new measurements the estimate decays back toward the prior
+    clock[0] += 60
+    assert tiers.estimate_ms('balanced') == pytest.approx(60 + 0.5 * 688, abs=0.01)
+    clock[0] += 6 * 60
+    assert tiers.estimate_ms('balanced') < 100
+    assert tiers.for_budget(100) == 'balanced'
+
+
+def test_budget_picks_most_accurate_tier_that_fits(tiers):
+    assert tiers.for_budget(200) == 'accurate'
+    assert tiers.for_budget(100) == 'balanced'
+    assert tiers.for_budget(10) == 'fast'
@@ -0,0 +1,73 @@
+import io
+import struct
+import zlib
+
+import pytest
+from werkzeug.formparser import parse_form_data
+from werkzeug.test import EnvironBuilder
+
+from upload_ingest import CheckedPart, PartRejected, UploadError, read_upload
+
+
+def png(width, height):
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + struct.pack('>I', len(header)) + b'IHDR' + header
+            + struct.pack('>I', zlib.crc32(b'IHDR' + header)))
+
+
+def parse_photo(photo, max_bytes=1 << 20, max_pixels=1_000_000):
+    environ = EnvironBuilder(method='POST', data={'photo': (io.BytesIO(photo), 'p.png')}).get_environ()
+    body = io.BytesIO(environ['wsgi.input'].read())
+    environ['wsgi.input'] = body
+    try:
+        _, _, files = parse_form_data(environ, stream_factory=lambda *args, **kwargs: CheckedPart(max_bytes, max_pixels))
+        return files, body
+    except PartRejected as e:
+        return e.error, body
+
+
+def test_good_part_is_parsed_and_read_with_the_same_limits():
+    photo = png(640, 480) + b'\0' * 10_000
+    files, _ = parse_photo(photo)
+
+    stream = files['photo'].stream
+    view, info = read_upload(stream, max_bytes=1 << 20, max_pixels=1_000_000)
+    assert bytes(view) == photo
+    assert info == {'format': 'png', 'size': [640, 480], 'bytes': len(photo)}
+
+
+def test_too_many_pixels_stops_the_parse_early():
+    error, body = parse_photo(png(5000, 5000) + b'\0' * 2_000_000, max_bytes=4 << 20)
+
+    assert isinstance(error, UploadError)
+    assert error.status == 413
+    assert body.tell() < 200_000
+
+
+def test_unknown_signature_stops_the_parse_early():
+    error, body = parse_photo(b'GIF89a' + b'\0' * 2_000_000, max_bytes=4 << 20)
+
+    assert error.status == 415
+    assert body.tell() < 200_000
+
+
+def test_oversized_part_stops_at_the_limit():
+    error, body = parse_photo(png(640, 480) + b'\0' * 3_000_000)
+
+    assert error.status == 413
+    assert str(error) == 'Upload is larger than the 1048576-byte limit'
+    assert body.tell() < 1_300_000
+
+
+def test_checked_part_spools_large_parts_to_disk():
+    part = CheckedPart(max_bytes=4 << 20)
+    part.write(png(10, 10) + b'\0' * (1 << 20))
+    assert part._rolled
+
+
+@pytest.mark.parametrize('chunks', [[b'\xff\xd8'], [b'\xff', b'\xd8\xff\xe0']])
+def test_short_jpeg_prefix_waits_for_more_bytes(chunks):
+    part = CheckedPart()
+    for chunk in chunks:
+        part.write(chunk)
+    assert part.probe.format is None
@@ -0,0 +1,428 @@
+"""TensorFlow-free inference for the posture CNN exported as a TF.js layers model.
+
+TFJSModel.load('model.json') reads the Keras topology and the binary weight
+shards named in the manifest, then compiles the layer stack into a short
+list of NumPy ops:
+
+- Conv2D runs as one im2col matmul per layer (float32 BLAS).
+- BatchNormalization is folded away. A linear conv/dense absorbs it
+  completely. After a ReLU (as in PostureTrainer.build_model) its positive
+  scale is folded into the conv, since relu(s * z) == s * relu(z) for s > 0.
+  What remains is a per-channel shift, which is moved past max pooling
+  (4x fewer elements) and into the next Dense layer's bias where possible.
+- Dropout is dropped, as at inference time in Keras.
+
+Only single-chain models are supported (Sequential, or a Functional model
+where each layer feeds the next), with InputLayer, Conv2D,
+BatchNormalization, MaxPooling2D, Dropout, Flatten and Dense layers.
+"""
+import json
+import logging
+import os
+
+import numpy as np
+
+from cnn_input import normalise, prediction_to_dict, prepare_batch
+
+logger = logging.getLogger(__name__)
+
+TFJS_MODEL_PATH = os.environ.get(
+    'TFJS_MODEL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model.json'))
+# Images per forward pass; bounds the im2col buffers (~40 MB at 32)
+TFJS_CHUNK_SIZE = int(os.environ.get('TFJS_CHUNK_SIZE', 32))
+
+WEIGHT_DTYPES = {'float32': np.float32, 'int32': np.int32}
+QUANTIZED_DTYPES = {'uint8': np.uint8, 'uint16': np.uint16, 'float16': np.float16}
+
+
+class ModelLoadError(Exception):
+    """Raised when model.json or its weight shards are missing, truncated or unsupported"""
+
+
+def read_weights(manifest, base_dir):
+    """Decode every weight in a TF.js weightsManifest into float32 arrays keyed by name"""
+    weights = {}
+    for group in manifest:
+        missing = [path for path in group['paths'] if not os.path.exists(os.path.join(base_dir, path))]
+        if missing:
+            raise ModelLoadError(f"Missing weight shard(s) {', '.join(missing)} in {base_dir}")
+
+        # A weight may span shards, so the group is read as one buffer
+        buffer = bytearray()
+        for path in group['paths']:
+            with open(os.path.join(base_dir, path), 'rb') as f:
+                buffer += f.read()
+
+        offset = 0
+        for spec in group['weights']:
+            quantization = spec.get('quantization')
+            if quantization:
+                dtype = np.dtype(QUANTIZED_DTYPES[quantization['dtype']]).newbyteorder('<')
+            elif spec['dtype'] in WEIGHT_DTYPES:
+                dtype = np.dtype(WEIGHT_DTYPES[spec['dtype']]).newbyteorder('<')
+            else:
+                raise ModelLoadError(f"Unsupported weight dtype {spec['dtype']} for {spec['name']}")
+
+            count = int(np.prod(spec['shape'], dtype=np.int64))
+            if offset + count * dtype.itemsize > len(buffer):
+                raise ModelLoadError(f"Weight shards end before {spec['name']}; expected more data")
+            values = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+            offset += count * dtype.itemsize
+
+            if quantization and quantization['dtype'] != 'float16':
+                values = values * np.float32(quantization['scale']) + np.float32(quantization['min'])
+            weights[spec['name'].split(':')[0]] = values.astype(np.float32).reshape(spec['shape'])
+
+        if offset != len(buffer):
+            raise ModelLoadError(f'Weight shards hold {len(buffer) - offset} bytes more than the manifest describes')
+    return weights
+
+
+def _inbound_layer_names(layer):
+    names = []
+    for node in layer.get('inbound_nodes') or []:
+        if isinstance(node, dict):
+            # Keras 3: {"args": [{"config": {"keras_history": [name, node, tensor]}}], ...}
+            for arg in node.get('args', []):
+                if isinstance(arg, dict) and 'keras_history' in arg.get('config', {}):
+                    names.append(arg['config']['keras_history'][0])
+        else:
+            # Keras 2: [[name, node_index, tensor_index, kwargs], ...]
+            names.extend(inbound[0] for inbound in node)
+    return names
+
+
+def _activation(name):
+    if name in (None, 'linear'):
+        return None
+    if name not in ('relu', 'sigmoid', 'tanh', 'softmax'):
+        raise ModelLoadError(f'Unsupported activation: {name}')
+    return name
+
+
+def _apply_activation(x, activation):
+    if activation == 'relu':
+        np.maximum(x, 0, out=x)
+    elif activation == 'sigmoid':
+        # exp(-log(1 + exp(-x))) doesn't overflow for large |x|
+        x = np.exp(-np.logaddexp(0, -x)).astype(np.float32, copy=False)
+    elif activation == 'tanh':
+        np.tanh(x, out=x)
+    elif activation == 'softmax':
+        x = np.exp(x - x.max(axis=-1, keepdims=True))
+        x /= x.sum(axis=-1, keepdims=True)
+    return x
+
+
+def _pair(value):
+    return tuple(value) if isinstance(value, (list, tuple)) else (value, value)
+
+
+def _conv_output_size(size, kernel, stride, padding):
+    if padding == 'same':
+        return -(-size // stride)
+    return (size - kernel) // stride + 1
+
+
+class Conv2DOp:
+    def __init__(self, kernel, bias, strides, padding, activation):
+        self.kernel = kernel
+        self.bias = bias
+        self.strides = strides
+        self.padding = padding
+        self.activation = activation
+
+    def output_shape(self, shape):
+        kh, kw = self.kernel.shape[:2]
+        return (_conv_output_size(shape[0], kh, self.strides[0], self.padding),
+                _conv_output_size(shape[1], kw, self.strides[1], self.padding),
+                self.kernel.shape[3])
+
+    def __call__(self, x):
+        n, h, w, c = x.shape
+        kh, kw, _, filters = self.kernel.shape
+        sh, sw = self.strides
+        out_h, out_w, _ = self.output_shape((h, w, c))
+        if self.padding == 'same':
+            # TensorFlow puts the odd padding pixel at the bottom/right
+            pad_h = max((out_h - 1) * sh + kh - h, 0)
+            pad_w = max((out_w - 1) * sw + kw - w, 0)
+            x = np.pad(x, ((0, 0), (pad_h // 2, pad_h - pad_h // 2), (pad_w // 2, pad_w - pad_w // 2), (0, 0)))
+
+        # im2col: patch columns ordered (row, col, channel) like the kernel
+        cols = np.empty((n, out_h, out_w, kh * kw * c), dtype=np.float32)
+        for i in range(kh):
+            for j in range(kw):
+                k = (i * kw + j) * c
+                cols[..., k:k + c] = x[:, i:i + sh * (out_h - 1) + 1:sh, j:j + sw * (out_w - 1) + 1:sw, :]
+        out = cols.reshape(-1, kh * kw * c) @ self.kernel.reshape(-1, filters)
+        out += self.bias
+        return _apply_activation(out, self.activation).reshape(n, out_h, out_w, filters)
+
+    def describe(self):
+        kh, kw, c, filters = self.kernel.shape
+        return f'conv {kh}x{kw} {c}->{filters} {self.padding} {self.activation or "linear"}'
+
+
+class DenseOp:
+    def __init__(self, kernel, bias, activation):
+        self.kernel = kernel
+        self.bias = bias
+        self.activation = activation
+
+    def output_shape(self, shape):
+        return (self.kernel.shape[1],)
+
+    def __call__(self, x):
+        out = x @ self.kernel
+        out += self.bias
+        return _apply_activation(out, self.activation)
+
+    def describe(self):
+        return f'dense {self.kernel.shape[0]}->{self.kernel.shape[1]} {self.activation or "linear"}'
+
+
+class MaxPoolOp:
+    def __init__(self, pool_size, strides, padding):
+        self.pool_size = pool_size
+        self.strides = strides
+        self.padding = padding
+
+    def output_shape(self, shape):
+        return (_conv_output_size(shape[0], self.pool_size[0], self.strides[0], self.padding),
+                _conv_output_size(shape[1], self.pool_size[1], self.strides[1], self.padding),
+                shape[2])
+
+    def __call__(self, x):
+        n, h, w, c = x.shape
+        ph, pw = self.pool_size
+        out_h, out_w, _ = self.output_shape((h, w, c))
+        if self.padding == 'valid' and self.pool_size == self.strides:
+            # Non-overlapping windows: a reshape and one reduction
+            return x[:, :out_h * ph, :out_w * pw].reshape(n, out_h, ph, out_w, pw, c).max(axis=(2, 4))
+        if self.padding == 'same':
+            pad_h = max((out_h - 1) * self.strides[0] + ph - h, 0)
+            pad_w = max((out_w - 1) * self.strides[1] + pw - w, 0)
+            x = np.pad(x, ((0, 0), (pad_h // 2, pad_h - pad_h // 2), (pad_w // 2, pad_w - pad_w // 2), (0, 0)),
+                       constant_values=-np.inf)
+        windows = np.lib.stride_tricks.sliding_window_view(x, (ph, pw), axis=(1, 2))
+        return windows[:, ::self.strides[0], ::self.strides[1]][:, :out_h, :out_w].max(axis=(-2, -1))
+
+    def describe(self):
+        return f'maxpool {self.pool_size[0]}x{self.pool_size[1]}'
+
+
+class AffineOp:
+    """Per-channel x * scale + shift: what is left of a BatchNorm after folding"""
+
+    def __init__(self, scale, shift):
+        self.scale = scale  # None when every channel's scale is exactly 1
+        self.shift = shift
+
+    def output_shape(self, shape):
+        return shape
+
+    def __call__(self, x):
+        if self.scale is not None:
+            x = x * self.scale
+        x += self.shift
+        return x
+
+    def monotonic(self):
+        return self.scale is None or bool(np.all(self.scale >= 0))
+
+    def describe(self):
+        return 'shift' if self.scale is None else 'affine'
+
+
+class FlattenOp:
+    def output_shape(self, shape):
+        return (int(np.prod(shape)),)
+
+    def __call__(self, x):
+        return x.reshape(len(x), -1)
+
+    def describe(self):
+        return 'flatten'
+
+
+def _fold_batch_norm(ops, scale, shift):
+    """Fold a BatchNorm's per-channel scale/shift into the op before it, or append an AffineOp"""
+    previous = ops[-1] if ops else None
+    if isinstance(previous, (Conv2DOp, DenseOp)) and previous.activation is None:
+        previous.kernel = previous.kernel * scale
+        previous.bias = previous.bias * scale + shift
+        return
+    if isinstance(previous, (Conv2DOp, DenseOp)) and previous.activation == 'relu':
+        # relu(|s| * z) == |s| * relu(z), so only the sign and shift stay behind
+        magnitude = np.abs(scale)
+        previous.kernel = previous.kernel * magnitude
+        previous.bias = previous.bias * magnitude
+        sign = np.sign(scale).astype(np.float32)
+        ops.append(AffineOp(None if np.all(sign == 1) else sign, shift))
+        return
+    ops.append(AffineOp(scale, shift))
+
+
+def _push_affines_down(ops, input_shape):
+    """Move AffineOps past max pooling and flatten, and fold them into a following Dense"""
+    changed = True
+    while changed:
+        changed = False
+        shape = input_shape
+        for i in range(len(ops) - 1):
+            op, following = ops[i], ops[i + 1]
+            if isinstance(op, AffineOp):
+                if isinstance(following, MaxPoolOp) and op.monotonic():
+                    # max(x + t) == max(x) + t when the scale is non-negative
+                    ops[i], ops[i + 1] = following, op
+                    changed = True
+                    break
+                if isinstance(following, FlattenOp):
+                    tile = lambda values: np.broadcast_to(values, shape).reshape(-1)  # noqa: E731
+                    scale = None if op.scale is None else tile(op.scale)
+                    ops[i], ops[i + 1] = following, AffineOp(scale, tile(op.shift))
+                    changed = True
+                    break
+                if isinstance(following, DenseOp) and len(shape) == 1:
+                    # (s * x + t) @ W + b == x @ (s[:, None] * W) + (t @ W + b)
+                    following.bias = following.bias + op.shift @ following.kernel
+                    if op.scale is not None:
+                        following.kernel = following.kernel * op.scale[:, None]
+                    del ops[i]
+                    changed = True
+                    break
+            shape = op.output_shape(shape)
+    return ops
+
+
+class TFJSModel:
+    """Compiled NumPy forward pass of a TF.js layers model"""
+
+    def __init__(self, ops, input_shape, source=None):
+        self.ops = ops
+        self.input_shape = tuple(input_shape)
+        self.source = source
+
+    @classmethod
+    def load(cls, path=TFJS_MODEL_PATH):
+        try:
+            with open(path) as f:
+                model_json = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ModelLoadError(f'Cannot read {path}: {e}') from e
+
+        weights = read_weights(model_json['weightsManifest'], os.path.dirname(os.path.abspath(path)))
+        topology = model_json['modelTopology']
+        # The Keras 3 converter nests the model config one level deeper
+        model_config = topology.get('model_config', topology)
+        return cls.from_config(model_config['config']['layers'], weights, source=path)
+
+    @classmethod
+    def from_config(cls, layers, weights, source=None):
+        def weight(layer_name, param):
+            key = f'{layer_name}/{param}'
+            if key in weights:
+                return weights[key]
+            # Some converters prefix weight names with the model name
+            matches = [name for name in weights if name.endswith('/' + key)]
+            if len(matches) != 1:
+                raise ModelLoadError(f'Weight {key} not found in the manifest')
+            return weights[matches[0]]
+
+        ops = []
+        input_shape = None
+        previous_name = None
+        for layer in layers:
+            class_name = layer['class_name']
+            config = layer['config']
+            name = config.get('name', layer.get('name'))
+
+            inbound = _inbound_layer_names(layer)
+            if previous_name is not None and inbound and inbound != [previous_name]:
+                raise ModelLoadError(f'Layer {name} does not take the previous layer as its only input')
+            previous_name = name
+
+            batch_shape = config.get('batch_shape') or config.get('batch_input_shape')
+            if batch_shape and input_shape is None:
+                input_shape = tuple(batch_shape[1:])
+
+            if class_name == 'InputLayer' or class_name == 'Dropout':
+                continue
+            if config.get('data_format', 'channels_last') != 'channels_last':
+                raise ModelLoadError(f'Layer {name}: only channels_last is supported')
+
+            if class_name == 'Conv2D':
+                if tuple(_pair(config.get('dilation_rate', 1))) != (1, 1) or config.get('groups', 1) != 1:
+                    raise ModelLoadError(f'Layer {name}: dilated and grouped convolutions are not supported')
+                kernel = weight(name, 'kernel')
+                bias = weight(name, 'bias') if config.get('use_bias', True) else np.zeros(kernel.shape[3], np.float32)
+                ops.append(Conv2DOp(kernel, bias, _pair(config['strides']), config['padding'],
+                                    _activation(config.get('activation'))))
+            elif class_name == 'Dense':
+                kernel = weight(name, 'kernel')
+                bias = weight(name, 'bias') if config.get('use_bias', True) else np.zeros(kernel.shape[1], np.float32)
+                ops.append(DenseOp(kernel, bias, _activation(config.get('activation'))))
+            elif class_name == 'BatchNormalization':
+                axis = config.get('axis', -1)
+                axis = axis[0] if isinstance(axis, list) and len(axis) == 1 else axis
+                if axis not in (-1, 3) and not (ops and isinstance(ops[-1], DenseOp) and axis == 1):
+                    raise ModelLoadError(f'Layer {name}: only last-axis batch normalization is supported')
+                mean = weight(name, 'moving_mean')
+                variance = weight(name, 'moving_variance')
+                gamma = weight(name, 'gamma') if config.get('scale', True) else np.ones_like(mean)
+                beta = weight(name, 'beta') if config.get('center', True) else np.zeros_like(mean)
+                scale = (gamma / np.sqrt(variance + np.float32(config.get('epsilon', 1e-3)))).astype(np.float32)
+                _fold_batch_norm(ops, scale, (beta - mean * scale).astype(np.float32))
+            elif class_name == 'MaxPooling2D':
+                pool_size = _pair(config.get('pool_size', 2))
+                strides = _pair(config.get('strides') or pool_size)
+                ops.append(MaxPoolOp(pool_size, strides, config.get('padding', 'valid')))
+            elif class_name == 'Flatten':
+                ops.append(FlattenOp())
+            else:
+                raise ModelLoadError(f'Unsupported layer type: {class_name}')
+
+        if input_shape is None:
+            raise ModelLoadError('Model has no input shape')
+        for op in ops:
+            for attr in ('kernel', 'bias'):
+                if hasattr(op, attr):
+                    setattr(op, attr, np.ascontiguousarray(getattr(op, attr), dtype=np.float32))
+        return cls(_push_affines_down(ops, input_shape), input_shape, source)
+
+    def describe(self):
+        return [op.describe() for op in self.ops]
+
+    def forward(self, x, chunk_size=TFJS_CHUNK_SIZE):
+        """Raw model outputs for a float32 (N, H, W, C) batch"""
+        x = np.asarray(x, dtype=np.float32)
+        if x.shape[1:] != self.input_shape:
+            raise ValueError(f'Expected input of shape (N, {", ".join(map(str, self.input_shape))}), got {x.shape}')
+        outputs = []
+        for start in range(0, len(x), chunk_size):
+            out = x[start:start + chunk_size]
+            for op in self.ops:
+                out = op(out)
+            outputs.append(out)
+        return np.concatenate(outputs) if outputs else np.empty((0,), dtype=np.float32)
+
+    def predict_batch(self, images):
+        """ml_prediction dicts for RGB images of any size (same contract as PostureModel.predict_batch)"""
+        if len(images) == 0:
+            return []
+        batch = normalise(prepare_batch(images, *self.input_shape[:2]))
+        predictions = self.forward(batch).reshape(len(batch), -1)[:, 0]
+        return [prediction_to_dict(prediction) for prediction in predictions]
+
+
+def load_model_or_none(path=TFJS_MODEL_PATH):
+    """Load the TF.js model, or log why not and return None so callers can fall back"""
+    try:
+        model = TFJSModel.load(path)
+    except ModelLoadError as e:
+        logger.warning(f"CNN model unavailable, ml_prediction falls back to heuristics: {e}")
+        return None
+    logger.info(f"Loaded CNN model from {path}: {', '.join(model.describe())}")
+    return model
+
@@ -0,0 +1,113 @@
+"""Inference for the posture CNN exported to TFLite (PostureTrainer.export_tflite).
+
+The interpreter comes from the first of tflite_runtime, ai_edge_litert or
+tensorflow.lite that is installed, so a serving host only needs the small
+runtime wheel, not TensorFlow. float32, float16 and int8 exports load the
+same way. For an int8 export, the float input is quantised and the output
+dequantised with each tensor's scale and zero point.
+"""
+import os
+import threading
+
+import numpy as np
+
+from cnn_input import normalise, prediction_to_dict, prepare_batch
+from tfjs_model import ModelLoadError
+
+TFLITE_MODEL_PATH = os.environ.get('TFLITE_MODEL_PATH', 'posture_model.tflite')
+# Interpreter threads per model. Requests are already merged into batches
+# by the micro-batcher, so intra-op threads are how inference uses more cores
+TFLITE_THREADS = int(os.environ.get('TFLITE_THREADS', os.cpu_count() or 1))
+
+
+def interpreter_class():
+    """The TFLite Interpreter class of the lightest installed runtime"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        import tensorflow as tf
+        return tf.lite.Interpreter
+    except ImportError:
+        raise ModelLoadError('No TFLite runtime installed (tflite-runtime, ai-edge-litert or tensorflow)')
+
+
+def _quantize(x, details):
+    scale, zero_point = details['quantization']
+    if not scale:
+        return x.astype(details['dtype'])
+    info = np.iinfo(details['dtype'])
+    return np.clip(np.round(x / scale) + zero_point, info.min, info.max).astype(details['dtype'])
+
+
+def _dequantize(x, details):
+    scale, zero_point = details['quantization']
+    if not scale:
+        return x.astype(np.float32)
+    return (x.astype(np.float32) - zero_point) * np.float32(scale)
+
+
+class TFLiteModel:
+    """A .tflite posture model with the Keras-like calls PostureModel needs"""
+
+    def __init__(self, path=TFLITE_MODEL_PATH, num_threads=TFLITE_THREADS):
+        if not os.path.exists(path):
+            raise ModelLoadError(f'TFLite model {path} not found')
+        self.path = path
+        self.num_threads = num_threads
+        try:
+            self.interpreter = interpreter_class()(model_path=path, num_threads=num_threads)
+            self.interpreter.allocate_tensors()
+        except ValueError as e:
+            raise ModelLoadError(f'Cannot load {path}: {e}') from e
+
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self.input_shape = tuple(int(d) for d in self._input['shape'][1:])
+        self.input_dtype = np.dtype(self._input['dtype'])
+        self._batch_size = int(self._input['shape'][0])
+        # One interpreter holds one set of tensors, so calls are serialised
+        self._lock = threading.Lock()
+
+    def describe(self):
+        return {
+            'path': self.path,
+            'input_dtype': self.input_dtype.name,
+            'threads': self.num_threads,
+            'size_bytes': os.path.getsize(self.path),
+        }
+
+    def _resize(self, batch_size):
+        # Exports keep a dynamic batch dimension; reallocating only happens
+        # when the batch size changes
+        if batch_size != self._batch_size:
+            self.interpreter.resize_tensor_input(self._input['index'], (batch_size,) + self.input_shape)
+            self.interpreter.allocate_tensors()
+            self._batch_size = batch_size
+
+    def predict_on_batch(self, batch):
+        """Sigmoid outputs, shape (N, 1), for a float32 batch normalised to [0, 1]"""
+        batch = np.asarray(batch, dtype=np.float32)
+        if self.input_dtype != np.float32:
+            batch = _quantize(batch, self._input)
+        with self._lock:
+            self._resize(len(batch))
+            self.interpreter.set_tensor(self._input['index'], batch)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self._output['index'])
+        return _dequantize(output, self._output)
+
+    def predict_batch(self, images):
+        """ml_prediction dicts for RGB images of any size (same contract as PostureModel.predict_batch)"""
+        if len(images) == 0:
+            return []
+        batch = normalise(prepare_batch(images, *self.input_shape[:2]))
+        predictions = self.predict_on_batch(batch).reshape(len(batch), -1)[:, 0]
+        return [prediction_to_dict(prediction) for prediction in predictions]
@@ -0,0 +1,267 @@
+"""Upload ingestion with early limits: raw image bodies and multipart photo parts.
+
+/analyze-posture accepts either a multipart form with a `photo` part or the
+image itself as the request body (Content-Type: image/jpeg or image/png).
+The options then come from the query string. Either way the bytes are
+checked as they arrive:
+
+- a declared Content-Length above UPLOAD_MAX_BYTES is rejected before
+  anything is read;
+- the first few KB must start with a known image signature, otherwise 415;
+- the image size is read from the JPEG SOF marker or the PNG/BMP header.
+  Anything above UPLOAD_MAX_PIXELS is rejected before the rest of the body
+  is read (SOF usually sits in the first few KB, after EXIF);
+- a body that turns out longer than UPLOAD_MAX_BYTES is cut off at the limit.
+
+For a multipart form the checks run inside Werkzeug's parser: the `photo`
+part is written into a CheckedPart (the request's stream_factory), which
+stops the parse as soon as the part is too long, has an unknown signature or
+declares too many pixels, rather than after the whole form has been spooled.
+read_upload then reads the finished part with the same limits.
+
+The bytes are read straight into one per-thread buffer, reused across
+requests and grown only when a larger upload arrives. The caller gets a
+memoryview of that buffer, which np.frombuffer, hashlib and cv2.imdecode
+take without copying. The view is only valid until the thread's next
+read_upload call, so anything that outlives the request needs bytes(view).
+"""
+import os
+import struct
+import threading
+from tempfile import SpooledTemporaryFile
+
+from image_decode import read_jpeg_size
+
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 20 * 1024 * 1024))
+UPLOAD_MAX_PIXELS = int(os.environ.get('UPLOAD_MAX_PIXELS', 50_000_000))
+# Whole-request limit (Flask MAX_CONTENT_LENGTH); must also fit batch uploads
+MAX_CONTENT_LENGTH = int(os.environ.get('POSTURE_MAX_CONTENT_LENGTH', 256 * 1024 * 1024))
+
+RAW_IMAGE_MIMETYPES = ('image/jpeg', 'image/jpg', 'image/png')
+# Allowance for the boundaries and small form fields around a multipart photo
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Read this much before checking the signature
+SNIFF_BYTES = 4096
+# Then read in steps of PROBE_CHUNK looking for the JPEG SOF marker, up to
+# PROBE_MAX_BYTES; past that the decoder is left to judge the file
+PROBE_CHUNK = 16 * 1024
+PROBE_MAX_BYTES = 256 * 1024
+# Multipart parts stay in memory up to this size, as with Werkzeug's default
+PART_SPOOL_BYTES = 500 * 1024
+
+_buffers = threading.local()
+
+
+class UploadError(ValueError):
+    """An upload rejected before decoding; `status` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def too_large_error(max_bytes=UPLOAD_MAX_BYTES):
+    return UploadError(f'Upload is larger than the {max_bytes}-byte limit', 413)
+
+
+def check_content_length(length, max_bytes=UPLOAD_MAX_BYTES):
+    """Reject a declared Content-Length over the limit without reading the body"""
+    if length is not None and length > max_bytes:
+        raise too_large_error(max_bytes)
+
+
+def sniff_image(prefix):
+    """(format, (width, height) or None) from the first bytes of an upload; format None if unknown"""
+    if prefix[:2] == b'\xff\xd8':
+        return 'jpeg', read_jpeg_size(prefix)
+    if prefix[:8] == b'\x89PNG\r\n\x1a\n':
+        size = struct.unpack('>II', prefix[16:24]) if len(prefix) >= 24 else None
+        return 'png', size
+    if prefix[:2] == b'BM':
+        if len(prefix) < 26:
+            return 'bmp', None
+        width, height = struct.unpack('<ii', prefix[18:26])
+        return 'bmp', (abs(width), abs(height))
+    if prefix[:4] == b'RIFF' and prefix[8:12] == b'WEBP':
+        return 'webp', None
+    return None, None
+
+
+def _upload_buffer(size):
+    """Per-thread upload buffer of at least `size` bytes.
+
+    A larger upload gets a new bytearray rather than a resize, since views of
+    the old one may still be alive.
+    """
+    buffer = getattr(_buffers, 'upload', None)
+    if buffer is None or len(buffer) < size:
+        buffer = bytearray(max(size, 2 * len(buffer) if buffer is not None else 0))
+        _buffers.upload = buffer
+    return buffer
+
+
+def _read_into(stream, view):
+    """Fill `view` from `stream` as far as it goes; returns the number of bytes read"""
+    readinto = getattr(stream, 'readinto', None)
+    filled = 0
+    while filled < len(view):
+        if readinto is not None:
+            count = readinto(view[filled:])
+        else:
+            chunk = stream.read(len(view) - filled)
+            count = len(chunk)
+            view[filled:filled + count] = chunk
+        if not count:
+            break
+        filled += count
+    return filled
+
+
+def stream_length(stream):
+    """Remaining length of a seekable stream (e.g. a parsed multipart part), or None"""
+    try:
+        position = stream.tell()
+        end = stream.seek(0, os.SEEK_END)
+        stream.seek(position)
+    except (AttributeError, OSError, ValueError):
+        return None
+    return end - position
+
+
+class ImageProbe:
+    """The early checks, fed the upload's leading bytes as they arrive.
+
+    feed() takes everything received so far and raises UploadError for an
+    empty body, an unknown signature (415) or too many pixels (413). `done`
+    is set once the size is known or is not going to turn up early.
+    """
+
+    def __init__(self, max_pixels=UPLOAD_MAX_PIXELS):
+        self.max_pixels = max_pixels
+        self.format = None
+        self.size = None
+        self.done = False
+
+    def feed(self, data, complete=False):
+        """Check the first len(data) bytes; `complete` when that is the whole upload"""
+        if self.done:
+            return
+        if self.format is None:
+            if len(data) < SNIFF_BYTES and not complete:
+                return
+            if not len(data):
+                raise UploadError('Empty upload')
+            self.format, self.size = sniff_image(data[:SNIFF_BYTES])
+            if self.format is None:
+                raise UploadError('Upload is not a JPEG, PNG, BMP or WebP image', 415)
+        elif self.format == 'jpeg':
+            # JPEGs put EXIF (and sometimes ICC or thumbnails) before the SOF marker
+            self.size = read_jpeg_size(data)
+
+        if self.size is not None:
+            width, height = self.size
+            if width * height > self.max_pixels:
+                raise UploadError(f'Image is {width}x{height}; the limit is '
+                                  f'{self.max_pixels // 1_000_000} megapixels', 413)
+            self.done = True
+        elif self.format != 'jpeg' or complete or len(data) >= PROBE_MAX_BYTES:
+            self.done = True
+
+    def info(self, count):
+        return {
+            'format': self.format,
+            'size': list(self.size) if self.size else None,
+            'bytes': count,
+        }
+
+
+class PartRejected(Exception):
+    """Carries an UploadError out of Werkzeug's form parser, which swallows ValueErrors"""
+
+    def __init__(self, error):
+        super().__init__(str(error))
+        self.error = error
+
+
+class CheckedPart(SpooledTemporaryFile):
+    """Multipart file part that applies the upload limits as the form parser writes it.
+
+    Raises PartRejected, wrapping the UploadError, from the write that
+    crosses `max_bytes` or lets the ImageProbe decide against the upload.
+    """
+
+    def __init__(self, max_bytes=UPLOAD_MAX_BYTES, max_pixels=UPLOAD_MAX_PIXELS):
+        super().__init__(max_size=PART_SPOOL_BYTES, mode='w+b')
+        self.max_bytes = max_bytes
+        self.probe = ImageProbe(max_pixels)
+        self._head = bytearray()
+
+    def write(self, data):
+        try:
+            if self.tell() + len(data) > self.max_bytes:
+                raise too_large_error(self.max_bytes)
+            if not self.probe.done:
+                self._head += data[:PROBE_MAX_BYTES - len(self._head)]
+                self.probe.feed(self._head)
+        except UploadError as e:
+            raise PartRejected(e) from None
+        return super().write(data)
+
+
+def check_image(data, max_bytes=UPLOAD_MAX_BYTES, max_pixels=UPLOAD_MAX_PIXELS):
+    """The same limits for an image already in memory (e.g. a batch item); returns its info"""
+    if len(data) > max_bytes:
+        raise too_large_error(max_bytes)
+    view = memoryview(data)
+    probe = ImageProbe(max_pixels)
+    probe.feed(view[:SNIFF_BYTES], complete=len(view) <= SNIFF_BYTES)
+    probe.feed(view[:PROBE_MAX_BYTES], complete=True)
+    return probe.info(len(view))
+
+
+def read_upload(stream, length=None, max_bytes=UPLOAD_MAX_BYTES, max_pixels=UPLOAD_MAX_PIXELS):
+    """Read an image upload into the thread's buffer, enforcing the limits as it arrives.
+
+    `length` is the declared size (Content-Length), if known. Returns
+    (memoryview, info) where info has the detected format, image size and
+    byte count. Raises UploadError.
+    """
+    check_content_length(length, max_bytes)
+    # One byte past the limit tells an oversized body of unknown length apart
+    capacity = length if length is not None else max_bytes + 1
+    buffer = _upload_buffer(min(capacity, SNIFF_BYTES) if length is None else capacity)
+    view = memoryview(buffer)
+    probe = ImageProbe(max_pixels)
+
+    def ensure(needed):
+        nonlocal buffer, view
+        if len(buffer) < needed:
+            old = view
+            buffer = _upload_buffer(needed)
+            view = memoryview(buffer)
+            view[:filled] = old[:filled]
+
+    filled = _read_into(stream, view[:min(capacity, SNIFF_BYTES)])
+    complete = filled < min(capacity, SNIFF_BYTES)
+    probe.feed(view[:filled], complete)
+    while not probe.done:
+        step = min(PROBE_CHUNK, capacity - filled)
+        ensure(filled + step)
+        count = _read_into(stream, view[filled:filled + step])
+        filled += count
+        complete = count < step or filled >= capacity
+        probe.feed(view[:filled], complete)
+
+    while not complete:
+        # With an unknown length the buffer grows geometrically up to the limit
+        target = min(capacity, max(len(buffer), 2 * filled, filled + SNIFF_BYTES))
+        ensure(target)
+        step = target - filled
+        count = _read_into(stream, view[filled:filled + step])
+        filled += count
+        complete = count < step or filled >= capacity
+        if filled > max_bytes:
+            raise too_large_error(max_bytes)
+
+    return view[:filled], probe.info(filled)
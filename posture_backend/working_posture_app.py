@@ -1,396 +1,1125 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Request, current_app, request, jsonify
 from flask_cors import CORS
 import cv2
-import mediapipe as mp
 import numpy as np
-import math
-from PIL import Image
 import logging
 import os
+from pose_pool import POSE_POOL_MAX_USES, POSE_POOL_SIZE
+from pose_workers import FRAME_RING_SLOTS, FRAME_RING_TIMEOUT, POSE_WORKERS, PoseWorkers, RingFull, frame_slot_bytes
+from batch_analysis import BatchExecutor, BatchError, collect_batch_items
+from live_session import LiveSession
+from posture_features import compute_features, features_to_dict
+from image_decode import DECODE_MAX_SIDE, decode_image
+from result_cache import (RESULT_CACHE_BACKEND, RESULT_CACHE_PATH, RESULT_CACHE_SIZE, RESULT_CACHE_TTL,
+                          ResultCache, make_cache_key)
+from jobs import JOB_QUEUE_SIZE, JOB_WORKERS, JobQueue, QueueFull
+from landmark_io import LandmarkError, landmarks_to_array, parse_json_landmarks, parse_packed_landmarks
+from metrics import CONTENT_TYPE, NULL_TIMER, Registry, StageTimer
+from micro_batch import MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS, MicroBatcher
+from tfjs_model import TFJS_MODEL_PATH, load_model_or_none
+from tflite_model import TFLITE_THREADS, TFLiteModel
+from quality_tiers import DEFAULT_QUALITY_TIER, QUALITY_TIERS, QualityTiers, TierError, parse_budget
+from issue_catalogue import CATALOGUE_MAX_AGE
+from posture_rules import POSTURE_RULES_DIR, RuleError, RuleRegistry
+from response_encoding import MSGPACK_MIMETYPE, gzip_response, negotiate, pack, parse_fields, project
+from upload_ingest import (MAX_CONTENT_LENGTH, MULTIPART_OVERHEAD, RAW_IMAGE_MIMETYPES, UPLOAD_MAX_BYTES,
+                           UPLOAD_MAX_PIXELS, CheckedPart, PartRejected, UploadError, check_content_length,
+                           read_upload, stream_length)
+from frame_gate import FRAME_GATE_DISTANCE, FRAME_GATE_MAX_AGE, FRAME_GATE_MAX_CLIENTS, FrameGate, frame_signature
+from posture_history import (HISTORY_BATCH_SIZE, HISTORY_PATH, HISTORY_QUEUE_SIZE, TREND_DAYS, TREND_HOURS,
+                             HistoryError, HistoryStore, parse_user_id)
+import glob
 import json
-import traceback
+import time
+from contextlib import nullcontext
+from functools import partial
+from flask_sock import Sock
+from werkzeug.exceptions import RequestEntityTooLarge
 
-print("Starting posture analysis Flask app...")
+api = Blueprint('posture_api', __name__)
+sock = Sock()
 
-app = Flask(__name__)
-CORS(app, origins=['*'])  # Allow all origins for development
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging. Per-request detail is logged at DEBUG, so it costs
+# nothing unless POSTURE_LOG_LEVEL=DEBUG is set.
+logging.basicConfig(level=os.environ.get('POSTURE_LOG_LEVEL', 'WARNING').upper())
 logger = logging.getLogger(__name__)
+logger.info("Starting posture analysis Flask app...")
+
+# Defaults for create_app(); each can be overridden per deployment
+DEFAULT_CONFIG = {
+    'CORS_ORIGINS': ['*'],  # Allow all origins for development
+    # Flask rejects larger request bodies (413) before parsing them; photos
+    # are further limited by UPLOAD_MAX_BYTES and UPLOAD_MAX_PIXELS
+    'MAX_CONTENT_LENGTH': MAX_CONTENT_LENGTH,
+    'UPLOAD_MAX_BYTES': UPLOAD_MAX_BYTES,
+    'UPLOAD_MAX_PIXELS': UPLOAD_MAX_PIXELS,
+    'POSE_POOL_SIZE': POSE_POOL_SIZE,
+    'POSE_POOL_MAX_USES': POSE_POOL_MAX_USES,
+    # Per-request pose model complexity and decode size, chosen with the
+    # X-Quality-Tier / X-Latency-Budget-Ms headers; each tier has its own pool
+    'QUALITY_TIERS': QUALITY_TIERS,
+    'QUALITY_TIER': DEFAULT_QUALITY_TIER,
+    # Issue thresholds, scoring and tip text: built-in defaults, overridden
+    # per tenant (X-Tenant-Id) by <tenant>.json files in this directory
+    'POSTURE_RULES_DIR': POSTURE_RULES_DIR,
+    # With POSE_WORKERS > 0, /analyze-posture runs pose inference in that
+    # many processes, handing frames over through shared memory
+    'POSE_WORKERS': POSE_WORKERS,
+    'FRAME_RING_SLOTS': FRAME_RING_SLOTS,
+    'FRAME_RING_TIMEOUT': FRAME_RING_TIMEOUT,
+    'RESULT_CACHE_BACKEND': RESULT_CACHE_BACKEND,
+    'RESULT_CACHE_SIZE': RESULT_CACHE_SIZE,
+    'RESULT_CACHE_TTL': RESULT_CACHE_TTL,
+    'RESULT_CACHE_PATH': RESULT_CACHE_PATH,
+    # Reuse a client's last analysis for near-identical frames (X-Client-Id or
+    # the user id); FRAME_GATE_MAX_AGE = 0 disables it
+    'FRAME_GATE_DISTANCE': FRAME_GATE_DISTANCE,
+    'FRAME_GATE_MAX_AGE': FRAME_GATE_MAX_AGE,
+    'FRAME_GATE_MAX_CLIENTS': FRAME_GATE_MAX_CLIENTS,
+    'JOB_WORKERS': JOB_WORKERS,
+    'JOB_QUEUE_SIZE': JOB_QUEUE_SIZE,
+    # Per-user history (X-User-Id) and its rollups behind /users/<id>/trends;
+    # an empty path disables it
+    'HISTORY_PATH': HISTORY_PATH,
+    'HISTORY_BATCH_SIZE': HISTORY_BATCH_SIZE,
+    'HISTORY_QUEUE_SIZE': HISTORY_QUEUE_SIZE,
+    # Posture CNN behind ml_prediction: the TF.js export run by the NumPy
+    # engine, or CNN_MODEL_PATH when set - a .tflite export run by the TFLite
+    # interpreter with TFLITE_THREADS threads, or a Keras model (imports TensorFlow)
+    'TFJS_MODEL_PATH': TFJS_MODEL_PATH,
+    'CNN_MODEL_PATH': os.environ.get('POSTURE_CNN_MODEL'),
+    'TFLITE_THREADS': TFLITE_THREADS,
+    'MICROBATCH_MAX_SIZE': MICROBATCH_MAX_SIZE,
+    'MICROBATCH_MAX_WAIT_MS': MICROBATCH_MAX_WAIT_MS,
+    'WARM_UP': True,
+}
+
+# Long-lived MediaPipe Pose instances shared across requests, one pool per
+# quality tier. The module-level instances below are defaults (used as-is by
+# batch worker processes); create_app() rebuilds them from the app's config.
+quality_tiers = QualityTiers()
+pose_pool = quality_tiers.pool(quality_tiers.default)
+
+# Compiled rule tables per tenant
+rule_registry = RuleRegistry()
+
+# Pose worker processes fed through a shared-memory frame ring (POSE_WORKERS > 0)
+pose_workers = None
+
+# Process pool for /analyze-posture/batch (started on first use)
+batch_executor = BatchExecutor()
+
+# Cache of analysis results keyed by upload hash + analysis parameters
+result_cache = ResultCache()
+
+# Last frame signature and analysis per client, for still scenes in auto mode
+frame_gate = FrameGate()
+
+# Bounded queue + fixed worker pool behind the /jobs API
+job_queue = JobQueue(lambda payload: run_analysis_job(payload))
+
+# Per-user analysis history, written in batches by a background thread
+# (created by create_app(), so batch worker processes never open it)
+history_store = None
+
+# Micro-batching front end of the CNN classifier, when one is configured
+cnn_model_path = None
+cnn_batcher = None
+
+# Prometheus metrics, served at /metrics
+metrics_registry = Registry()
+stage_seconds = metrics_registry.histogram(
+    'posture_stage_seconds', 'Time spent in each stage of /analyze-posture', ['stage'])
+request_seconds = metrics_registry.histogram(
+    'posture_request_seconds', 'End-to-end /analyze-posture handler time', ['outcome'])
+requests_total = metrics_registry.counter(
+    'posture_requests_total', '/analyze-posture requests by outcome', ['outcome'])
+tier_seconds = metrics_registry.histogram(
+    'posture_quality_tier_seconds', '/analyze-posture handler time by quality tier', ['tier'])
+metrics_registry.gauge('posture_result_cache_hits_total', 'Result cache hits',
+                       lambda: result_cache.hits, type_name='counter')
+metrics_registry.gauge('posture_result_cache_misses_total', 'Result cache misses',
+                       lambda: result_cache.misses, type_name='counter')
+frame_gate_total = metrics_registry.counter(
+    'posture_frame_gate_total', 'Frames checked by the near-duplicate gate, by outcome', ['outcome'])
+metrics_registry.gauge('posture_frame_gate_saved_seconds_total',
+                       'Decode and inference time skipped by reusing results for near-duplicate frames',
+                       lambda: frame_gate.saved_seconds, type_name='counter')
+metrics_registry.gauge('posture_job_queue_depth', 'Jobs waiting in the /jobs queue',
+                       lambda: job_queue.stats()['queue_depth'])
+metrics_registry.gauge('posture_job_workers_busy', 'Job workers currently running an analysis',
+                       lambda: job_queue.busy)
+metrics_registry.gauge('posture_history_queue_depth', 'Analyses waiting to be written to the history store',
+                       lambda: history_store.stats()['queued'] if history_store is not None else 0)
+metrics_registry.gauge('posture_history_dropped_total', 'Analyses dropped because the history queue was full',
+                       lambda: history_store.dropped if history_store is not None else 0, type_name='counter')
+metrics_registry.gauge('posture_frame_slots_free', 'Free shared-memory frame slots for the pose workers',
+                       lambda: pose_workers.ring.stats()['free'] if pose_workers is not None else 0)
+
+def analysis_params(tier=None, rules=None):
+    """Everything besides the image bytes that changes the analysis result"""
+    params = {'rules': (rules or rule_registry.default).fingerprint}
+    params.update(quality_tiers.analysis_params(tier or quality_tiers.default))
+    params['cnn_model'] = cnn_model_path
+    return params
+
+def select_quality_tier(fields):
+    """(tier, selected_by, requested tier, budget ms) for the current request.
+
+    The X-Quality-Tier and X-Latency-Budget-Ms headers take precedence over
+    the `quality` and `latency_budget_ms` fields. Raises TierError.
+    """
+    requested = request.headers.get('X-Quality-Tier', fields.get('quality'))
+    budget_ms = parse_budget(request.headers.get('X-Latency-Budget-Ms', fields.get('latency_budget_ms')))
+    tier, selected_by = quality_tiers.resolve(requested, budget_ms)
+    return tier, selected_by, requested, budget_ms
+
+def request_rules(fields):
+    """The rule table of the request's tenant (X-Tenant-Id header or `tenant` field); raises RuleError"""
+    return rule_registry.get(request.headers.get('X-Tenant-Id', fields.get('tenant')))
 
-def analyze_posture(image):
-    """Analyze posture using MediaPipe landmarks"""
+def request_user(fields):
+    """The request's user id (X-User-Id header or `user_id` field), or None; raises HistoryError"""
+    return parse_user_id(request.headers.get('X-User-Id', fields.get('user_id')))
+
+def request_client(fields, user_id=None):
+    """Frame gate key: the X-Client-Id header, a `client_id` field or else the user id"""
+    client_id = request.headers.get('X-Client-Id', fields.get('client_id')) or user_id
+    return client_id[:128] if client_id else None
+
+class PostureRequest(Request):
+    """Request whose multipart file parts are checked as they arrive once `upload_limits` is set"""
+
+    upload_limits = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.upload_limits is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return CheckedPart(*self.upload_limits)
+
+def photo_form():
+    """(files, form) of a multipart photo upload; raises UploadError as soon as the photo part fails a limit"""
+    request.upload_limits = (current_app.config['UPLOAD_MAX_BYTES'], current_app.config['UPLOAD_MAX_PIXELS'])
     try:
-        print(f"Analyzing image with shape: {image.shape}")
-        
-        # Initialize MediaPipe pose detection
-        mp_pose = mp.solutions.pose
+        return request.files, request.form
+    except PartRejected as e:
+        raise e.error from None
+
+def read_photo(stream, length):
+    """Read a photo upload with the app's size limits: (memoryview, info); raises UploadError"""
+    return read_upload(stream, length, max_bytes=current_app.config['UPLOAD_MAX_BYTES'],
+                       max_pixels=current_app.config['UPLOAD_MAX_PIXELS'])
+
+def record_history(user_id, metadata, analysis):
+    """Queue a successful analysis for the user's history (no-op without a user id or store)"""
+    if user_id and history_store is not None:
+        history_store.record(user_id, metadata.get('timestamp'), analysis)
+
+def analyze_landmarks(points, rules=None):
+    """Compute posture measurements and binary indicators from a (33, 4) landmark array"""
+    rules = rules or rule_registry.default
+    features = compute_features(points, absolute=True)
+    analysis = features_to_dict(features[0])
+    analysis.update(rules.indicators_for(rules.evaluate(features).flags[0]))
+    return analysis
+
+def analyze_posture(image, pose=None, timer=NULL_TIMER, pool=None, rules=None):
+    """Analyze posture using MediaPipe landmarks.
+
+    Expects an RGB image (as produced by decode_image). Uses a pose instance
+    from `pool` (a quality tier's pool; the default tier's when None) unless
+    the caller passes its own (e.g. a tracking-mode instance owned by a live
+    session). `rules` is the tenant's rule table (the default one when None).
+    Pass a StageTimer to record inference and feature times.
+    """
+    try:
+        logger.debug("Analyzing image with shape: %s", image.shape)
         
-        # Use static_image_mode=True for single images
-        with mp_pose.Pose(
-            static_image_mode=True,
-            model_complexity=1,
-            enable_segmentation=False,
-            min_detection_confidence=0.5
-        ) as pose:
+        # Check out a pre-built pose graph instead of building one per request
+        with ((pool or pose_pool).acquire() if pose is None else nullcontext(pose)) as pose:
             
-            print("Processing image with MediaPipe...")
-            # Convert to RGB if needed
-            if len(image.shape) == 3:
-                rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB) if image.shape[2] == 3 else image
-                results = pose.process(rgb_image)
+            if len(image.shape) == 3 and image.shape[2] == 3:
+                with timer.stage('pose_inference'):
+                    results = pose.process(image)
             else:
-                print("Invalid image format")
+                logger.debug("Invalid image format")
                 return None, None
 
         if not results.pose_landmarks:
-            print("No pose landmarks detected")
+            logger.debug("No pose landmarks detected")
             return None, None
 
-        print("Pose landmarks detected, analyzing...")
-        landmarks = results.pose_landmarks.landmark
+        with timer.stage('features'):
+            analysis = analyze_landmarks(landmarks_to_array(results.pose_landmarks.landmark), rules)
         
-        def get_landmark(landmark_id):
-            lm = landmarks[landmark_id]
-            return np.array([lm.x, lm.y])
-
-        # Get key landmarks
-        try:
-            left_shoulder = get_landmark(mp_pose.PoseLandmark.LEFT_SHOULDER.value)
-            right_shoulder = get_landmark(mp_pose.PoseLandmark.RIGHT_SHOULDER.value)
-            left_ear = get_landmark(mp_pose.PoseLandmark.LEFT_EAR.value)
-            right_ear = get_landmark(mp_pose.PoseLandmark.RIGHT_EAR.value)
-            left_hip = get_landmark(mp_pose.PoseLandmark.LEFT_HIP.value)
-            right_hip = get_landmark(mp_pose.PoseLandmark.RIGHT_HIP.value)
-            nose = get_landmark(mp_pose.PoseLandmark.NOSE.value)
-        except Exception as e:
-            print(f"Error extracting landmarks: {e}")
-            return None, None
-        
-        # Calculate midpoints
-        mid_shoulder = (left_shoulder + right_shoulder) / 2
-        mid_ear = (left_ear + right_ear) / 2
-        mid_hip = (left_hip + right_hip) / 2
-        
-        analysis = {}
-        
-        # Forward head posture
-        forward_head_distance = abs(mid_ear[0] - mid_shoulder[0])
-        analysis['forward_head_distance'] = float(forward_head_distance)
-        analysis['forward_head_binary'] = 1 if forward_head_distance > 0.08 else 0
-        
-        # Shoulder imbalance
-        shoulder_height_diff = abs(left_shoulder[1] - right_shoulder[1])
-        analysis['shoulder_imbalance'] = float(shoulder_height_diff)
-        analysis['shoulder_imbalance_binary'] = 1 if shoulder_height_diff > 0.05 else 0
-        
-        # Head tilt
-        head_tilt_angle = abs(math.atan2(right_ear[1] - left_ear[1], right_ear[0] - left_ear[0]))
-        analysis['head_tilt'] = float(head_tilt_angle)
-        analysis['head_tilt_binary'] = 1 if head_tilt_angle > 0.2 else 0
-        
-        # Slouching
-        slouch_distance = abs(mid_shoulder[0] - mid_hip[0])
-        analysis['slouch_distance'] = float(slouch_distance)
-        analysis['slouching_binary'] = 1 if slouch_distance > 0.05 else 0
-        
-        # Overall alignment
-        head_shoulder_offset = abs(mid_ear[0] - mid_shoulder[0])
-        shoulder_hip_offset = abs(mid_shoulder[0] - mid_hip[0])
-        total_misalignment = head_shoulder_offset + shoulder_hip_offset
-        analysis['total_misalignment'] = float(total_misalignment)
-        analysis['alignment_binary'] = 1 if total_misalignment > 0.12 else 0
-        
-        # Neck angle
-        try:
-            neck_vector = mid_ear - mid_shoulder
-            torso_vector = mid_shoulder - mid_hip
-            
-            dot_product = np.dot(neck_vector, torso_vector)
-            norms = np.linalg.norm(neck_vector) * np.linalg.norm(torso_vector)
-            
-            if norms > 0:
-                neck_angle = math.acos(np.clip(dot_product / norms, -1, 1))
-                neck_angle_degrees = math.degrees(neck_angle)
-                analysis['neck_angle'] = float(neck_angle_degrees)
-                analysis['neck_angle_binary'] = 1 if abs(neck_angle_degrees - 90) > 25 else 0
-            else:
-                analysis['neck_angle'] = 90.0
-                analysis['neck_angle_binary'] = 0
-        except Exception as e:
-            print(f"Error calculating neck angle: {e}")
-            analysis['neck_angle'] = 90.0
-            analysis['neck_angle_binary'] = 0
-        
-        print("Analysis completed successfully")
         return analysis, results
         
     except Exception as e:
-        logger.error(f"Error in pose analysis: {e}")
-        traceback.print_exc()
+        logger.exception(f"Error in pose analysis: {e}")
         return None, None
 
-def get_posture_issues_and_recommendations(analysis):
+def analyze_posture_in_worker(frame_slot, timer=NULL_TIMER, pose_options=None, rules=None):
+    """analyze_posture for a frame decoded into a pose worker's shared-memory slot.
+
+    Only the slot index and shape go to the worker process; the landmarks
+    come back and the features are computed here. pose_options select a
+    non-default quality tier's model. Returns None if no pose was detected.
+    """
+    try:
+        with timer.stage('pose_inference'):
+            points = pose_workers.landmarks(frame_slot, pose_options)
+        if points is None:
+            logger.debug("No pose landmarks detected")
+            return None
+        with timer.stage('features'):
+            return analyze_landmarks(points, rules)
+    except Exception as e:
+        logger.exception(f"Error in pose worker analysis: {e}")
+        return None
+
+def get_posture_issues_and_recommendations(analysis, rules=None):
     """Get human-readable issues and recommendations based on binary classifications"""
-    issues = []
-    recommendations = []
-    
-    if analysis['forward_head_binary'] == 1:
-        issues.append("Forward head posture detected")
-        recommendations.append({
-            'issue': 'Forward Head Posture',
-            'tips': [
-                'Tuck your chin back',
-                'Imagine a string pulling the top of your head up',
-                'Keep your ears aligned over your shoulders'
-            ]
-        })
-    
-    if analysis['shoulder_imbalance_binary'] == 1:
-        issues.append("Uneven shoulders")
-        recommendations.append({
-            'issue': 'Shoulder Imbalance',
-            'tips': [
-                'Check if you\'re carrying weight on one side',
-                'Practice shoulder blade squeezes',
-                'Be aware of which shoulder tends to be higher'
-            ]
-        })
-    
-    if analysis['head_tilt_binary'] == 1:
-        issues.append("Head tilted to one side")
-        recommendations.append({
-            'issue': 'Head Tilt',
-            'tips': [
-                'Practice head alignment exercises',
-                'Check your workspace ergonomics',
-                'Be mindful of phone/computer screen positioning'
-            ]
-        })
+    rules = rules or rule_registry.default
+    findings = rules.findings(rules.mask_of(analysis))
+    return findings.issues, findings.recommendations
+
+def build_analysis_payload(analysis, rules=None):
+    """Build the 'analysis' section of an /analyze-posture response"""
+    rules = rules or rule_registry.default
+    # Issues, recommendations, score and quality are precomputed, immutable
+    # objects shared by every analysis that flags the same rules
+    findings = rules.findings(rules.mask_of(analysis))
+    posture_score = findings.score
     
-    if analysis['slouching_binary'] == 1:
-        issues.append("Slouching/rounded shoulders")
-        recommendations.append({
-            'issue': 'Slouching',
-            'tips': [
-                'Pull your shoulder blades back and down',
-                'Engage your core muscles',
-                'Keep your chest open'
-            ]
-        })
+    # Create ML prediction; without a CNN it is derived from the posture score
+    ml_prediction = analysis.get('cnn_prediction') or {
+        'probability': posture_score / 100.0,
+        'binary_prediction': findings.binary_prediction,
+        'posture_quality': findings.quality,
+        'confidence': max(0.7, posture_score / 100.0)
+    }
     
-    if analysis['alignment_binary'] == 1:
-        issues.append("Poor overall alignment")
-        recommendations.append({
-            'issue': 'Overall Alignment',
-            'tips': [
-                'Practice standing against a wall',
-                'Focus on stacking head over shoulders over hips',
-                'Consider ergonomic adjustments to your workspace'
-            ]
-        })
+    logger.debug("Analysis complete. Issues found: %d, Score: %.1f", findings.count, posture_score)
     
-    if analysis['neck_angle_binary'] == 1:
-        issues.append("Poor neck angle")
-        recommendations.append({
-            'issue': 'Neck Angle',
-            'tips': [
-                'Adjust your screen to eye level',
-                'Practice neck stretches',
-                'Maintain neutral neck position'
-            ]
-        })
-    
-    return issues, recommendations
+    payload = {
+        'posture_score': round(posture_score, 1),
+        'ml_prediction': ml_prediction,
+        'issues': findings.issues,
+        'issue_codes': findings.codes,
+        'recommendations': findings.recommendations,
+        'technical_measurements': {
+            'forward_head_distance': analysis['forward_head_distance'],
+            'shoulder_imbalance': analysis['shoulder_imbalance'],
+            'head_tilt': analysis['head_tilt'],
+            'slouch_distance': analysis['slouch_distance'],
+            'total_misalignment': analysis['total_misalignment'],
+            'neck_angle': analysis.get('neck_angle', 90.0)
+        },
+        'binary_indicators': {code: analysis.get(indicator, 0)
+                              for code, indicator in zip(rules.codes, rules.indicators)},
+        'total_issues_count': findings.count,
+        'rules': {'tenant': rules.tenant, 'version': rules.version}
+    }
+    if 'cnn_prediction' in analysis:
+        payload['cnn_prediction'] = analysis['cnn_prediction']
+    return payload
 
-# Root route for testing
-@app.route('/')
-def home():
-    return jsonify({
-        'message': 'Posture Analysis API is running!',
-        'version': '1.0',
-        'endpoints': {
-            'health': 'GET /health',
-            'test': 'GET /test',
-            'analyze': 'POST /analyze-posture'
+def analyze_image_bytes(file_bytes, pose=None, max_side=DECODE_MAX_SIDE, rules=None):
+    """Decode and analyse one encoded image, returning a per-image response dict.
+
+    Runs inside the batch process pool and live sessions, so it only returns
+    plain, picklable data. `rules` is the tenant's rule table (picklable).
+    """
+    img, decode_info = decode_image(file_bytes, max_side=max_side)
+    if img is None:
+        return {
+            'success': False,
+            'error': 'Invalid image format or corrupted file'
         }
-    })
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    return jsonify({
+    analysis, _ = analyze_posture(img, pose=pose, rules=rules)
+    if analysis is None:
+        return {
+            'success': False,
+            'error': 'No pose detected in image. Make sure the person is clearly visible and facing the camera.'
+        }
+
+    return {
+        'success': True,
+        'analysis': build_analysis_payload(analysis, rules),
+        'debug': {'decode': decode_info}
+    }
+
+def encode_response(body, status=200):
+    """Serialise a response body the way the client asked.
+
+    MessagePack when the Accept header prefers it, JSON otherwise. The
+    `fields` query or form parameter projects the body first.
+    """
+    body = project(body, parse_fields(request.values.get('fields')))
+    if negotiate(request.accept_mimetypes) == MSGPACK_MIMETYPE:
+        response = current_app.response_class(pack(body), status=status, mimetype=MSGPACK_MIMETYPE)
+    else:
+        response = jsonify(body)
+        response.status_code = status
+    response.vary.add('Accept')
+    return response
+
+def analyze_and_record(analyze_frame, user_id, file_bytes, **kwargs):
+    """analyze_frame(file_bytes), adding a successful result to the user's history"""
+    result = analyze_frame(file_bytes, **kwargs)
+    if result['success']:
+        record_history(user_id, {}, result['analysis'])
+    return result
+
+def run_analysis_job(payload):
+    """Job handler for /jobs/analyze-posture: returns (response_dict, status_code)"""
+    result = analyze_image_bytes(payload['file_bytes'], rules=payload.get('rules'))
+    metadata = payload['metadata']
+    result['timestamp'] = metadata.get('timestamp')
+    result['metadata'] = metadata
+    if result['success']:
+        record_history(payload.get('user_id'), metadata, result['analysis'])
+    return result, 200 if result['success'] else 400
+
+API_INFO = {
+    'message': 'Posture Analysis API is running!',
+    'version': '1.0',
+    'endpoints': {
+        'health': 'GET /health',
+        'test': 'GET /test',
+        'analyze': 'POST /analyze-posture',
+        'analyze_batch': 'POST /analyze-posture/batch',
+        'live': 'WS /ws/live-posture',
+        'analyze_landmarks': 'POST /analyze-landmarks',
+        'recommendations_catalogue': 'GET /recommendations/catalogue',
+        'cache_stats': 'GET /cache/stats',
+        'submit_job': 'POST /jobs/analyze-posture',
+        'job_status': 'GET /jobs/<job_id>?wait=<seconds>',
+        'job_stats': 'GET /jobs/stats',
+        'user_trends': 'GET /users/<user_id>/trends?hours=<n>&days=<n>',
+        'metrics': 'GET /metrics'
+    }
+}
+
+def health_status():
+    """Body of /health (also served by the ASGI front end)"""
+    return {
         'status': 'healthy',
         'mediapipe_available': True,
+        'pose_pool': pose_pool.stats(),
+        'quality_tiers': quality_tiers.stats(),
+        'rules': rule_registry.stats(),
+        'result_cache': result_cache.stats(),
+        'frame_gate': frame_gate.stats(),
+        'history': history_store.stats() if history_store is not None else None,
+        'cnn_model': cnn_model_path,
+        'cnn': cnn_batcher.stats() if cnn_batcher is not None else None,
+        'pose_workers': pose_workers.stats() if pose_workers is not None else None,
         'message': 'Posture analysis server running',
         'version': '1.0'
-    })
+    }
+
+def test_status(server='Flask'):
+    """Body of /test"""
+    return {
+        'success': True,
+        'message': f'{server} server is running and reachable!',
+        'timestamp': str(np.datetime64('now'))
+    }
+
+# Root route for testing
+@api.route('/')
+def home():
+    return jsonify(API_INFO)
 
-@app.route('/test', methods=['GET'])
+@api.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint"""
+    return jsonify(health_status())
+
+@api.route('/test', methods=['GET'])
 def test_endpoint():
     """Simple test endpoint to verify server is reachable"""
-    print("Test endpoint hit!")
+    return jsonify(test_status())
+
+@api.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Result cache hit/miss counters"""
+    return jsonify(result_cache.stats())
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint: per-stage latency histograms and counters, summed over workers"""
+    return metrics_registry.render(), 200, {'Content-Type': CONTENT_TYPE}
+
+@api.after_request
+def compress_response(response):
+    """Gzip larger bodies for clients that accept it"""
+    return gzip_response(response, request.accept_encodings)
+
+@api.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    """JSON answer for bodies over MAX_CONTENT_LENGTH.
+
+    Not encode_response(), which reads the form and so the oversized body.
+    """
     return jsonify({
-        'success': True,
-        'message': 'Flask server is running and reachable!',
-        'timestamp': str(np.datetime64('now'))
-    })
+        'success': False,
+        'error': 'Upload is too large'
+    }), 413
 
-@app.route('/analyze-posture', methods=['POST'])
+@api.route('/recommendations/catalogue', methods=['GET'])
+def recommendations_catalogue():
+    """Issue text and tips by issue code for the tenant, revalidated with If-None-Match"""
+    try:
+        rules = request_rules(request.args)
+    except RuleError as e:
+        return encode_response({
+            'success': False,
+            'error': str(e)
+        }, 400)
+    response = encode_response(rules.catalogue())
+    # One ETag per tenant and representation; weak, as gzip may re-encode the bytes
+    response.set_etag(f'{rules.tenant}-{rules.catalogue_version}-{response.mimetype.split("/")[1]}', weak=True)
+    response.cache_control.public = True
+    response.cache_control.max_age = CATALOGUE_MAX_AGE
+    return response.make_conditional(request)
+
+@api.route('/analyze-posture', methods=['POST'])
 def analyze_posture_endpoint():
-    """Main endpoint for posture analysis"""
+    """Main endpoint for posture analysis.
+
+    Takes a multipart form with a 'photo' part, or the image itself as the
+    body (Content-Type: image/jpeg or image/png) with the form fields in the
+    query string.
+    """
+    request_start = time.perf_counter()
+    timer = StageTimer(stage_seconds)
+    outcome = 'error'
+    frame_slot = None
+    tier = None
     try:
-        print("="*50)
-        print("Received posture analysis request")
-        print(f"Request files: {list(request.files.keys())}")
-        print(f"Request form: {list(request.form.keys())}")
-        
-        # Check if photo is provided
-        if 'photo' not in request.files:
-            print("ERROR: No photo in request files")
-            return jsonify({
-                'success': False,
-                'error': 'No photo provided'
-            }), 400
+        if request.mimetype in RAW_IMAGE_MIMETYPES:
+            # Read straight from the socket by read_photo below
+            form = request.args
+            upload_stream, upload_length = request.stream, request.content_length
+            logger.debug("Received raw %s upload: args=%s", request.mimetype, list(form.keys()))
+        else:
+            # Refuse an oversized form before Werkzeug parses (and spools) it
+            check_content_length(request.content_length, current_app.config['UPLOAD_MAX_BYTES'] + MULTIPART_OVERHEAD)
+            # Werkzeug parses the multipart body here, checking the photo part as it arrives
+            with timer.stage('multipart_parse'):
+                files, form = photo_form()
+            logger.debug("Received posture analysis request: files=%s form=%s",
+                         list(files.keys()), list(form.keys()))
+            
+            # Check if photo is provided
+            if 'photo' not in files:
+                outcome = 'bad_request'
+                return encode_response({
+                    'success': False,
+                    'error': 'No photo provided'
+                }, 400)
 
-        file = request.files['photo']
-        if file.filename == '':
-            print("ERROR: Empty filename")
-            return jsonify({
-                'success': False,
-                'error': 'No photo selected'
-            }), 400
+            file = files['photo']
+            if file.filename == '':
+                outcome = 'bad_request'
+                return encode_response({
+                    'success': False,
+                    'error': 'No photo selected'
+                }, 400)
+            upload_stream, upload_length = file.stream, stream_length(file.stream)
 
-        print(f"Processing uploaded file: {file.filename}")
-        print(f"File content type: {file.content_type}")
+        try:
+            tier, selected_by, requested_tier, budget_ms = select_quality_tier(form)
+            rules = request_rules(form)
+            user_id = request_user(form)
+        except (TierError, RuleError, HistoryError) as e:
+            outcome = 'bad_request'
+            return encode_response({
+                'success': False,
+                'error': str(e)
+            }, 400)
+        tier_spec = quality_tiers.spec(tier)
+        client_id = request_client(form, user_id)
+        gate_signature, gate_info, reused_analysis = None, None, None
+        upload_info = None
 
         # Read and process the image
         try:
-            file_bytes = file.read()
-            print(f"File size: {len(file_bytes)} bytes")
+            # Size and format limits are enforced before the whole body is read;
+            # file_bytes is a view of this thread's upload buffer
+            with timer.stage('upload_read'):
+                file_bytes, upload_info = read_photo(upload_stream, upload_length)
+            logger.debug("Processing upload: %s, %d bytes", upload_info['format'], upload_info['bytes'])
             
-            # Convert bytes to numpy array
-            nparr = np.frombuffer(file_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            # Identical uploads (client retries, re-submitted history photos)
+            # skip decode and pose inference entirely
+            with timer.stage('cache_lookup'):
+                params = analysis_params(tier, rules)
+                cache_key = make_cache_key(file_bytes, params)
+                cached_analysis = result_cache.get(cache_key)
+
+            if cached_analysis is None and client_id and frame_gate.enabled:
+                # A still scene gets the client's last result, without decode or pose
+                with timer.stage('frame_gate'):
+                    gate_signature = frame_signature(file_bytes)
+                    if gate_signature is not None:
+                        reused_analysis, gate_info = frame_gate.lookup(client_id, gate_signature, params)
+                if gate_info is not None:
+                    frame_gate_total.inc(gate_info['outcome'])
             
-            if img is None:
-                print("ERROR: Could not decode image")
-                return jsonify({
-                    'success': False,
-                    'error': 'Invalid image format or corrupted file'
-                }), 400
+            if cached_analysis is not None or reused_analysis is not None:
+                img, decode_info = None, None
+            else:
+                if pose_workers is not None:
+                    # The pose worker reads the frame where it is decoded
+                    frame_slot = pose_workers.acquire()
+                analysis_start = time.perf_counter()
+                # Decode at reduced size straight into RGB
+                img, decode_info = decode_image(file_bytes, max_side=tier_spec['max_side'],
+                                                out=frame_slot.array if frame_slot else None)
+                timer.record('decode', decode_info['decode_ms'] / 1000)
+                
+                if img is None:
+                    outcome = 'bad_image'
+                    return encode_response({
+                        'success': False,
+                        'error': 'Invalid image format or corrupted file'
+                    }, 400)
 
-            print(f"Image decoded successfully. Shape: {img.shape}")
+                timer.record('color_conversion', decode_info['convert_ms'] / 1000)
             
+        except UploadError as e:
+            outcome = 'too_large' if e.status == 413 else 'bad_image'
+            return encode_response({
+                'success': False,
+                'error': str(e)
+            }, e.status)
+        except RingFull as e:
+            outcome = 'busy'
+            response = encode_response({
+                'success': False,
+                'error': 'Server is busy, retry later',
+                'retry_after': e.retry_after
+            }, 503)
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
         except Exception as e:
-            print(f"ERROR: Failed to read/decode image: {e}")
-            traceback.print_exc()
-            return jsonify({
+            logger.exception(f"Failed to read/decode image: {e}")
+            outcome = 'bad_image'
+            return encode_response({
                 'success': False,
                 'error': f'Failed to process image: {str(e)}'
-            }), 400
+            }, 400)
 
         # Get metadata if provided
         metadata = {}
-        if 'metadata' in request.form:
+        if 'metadata' in form:
             try:
-                metadata = json.loads(request.form['metadata'])
-                print(f"Metadata: {metadata}")
+                metadata = json.loads(form['metadata'])
             except json.JSONDecodeError as e:
-                print(f"Warning: Invalid metadata JSON: {e}")
+                logger.debug("Invalid metadata JSON: %s", e)
                 metadata = {}
 
-        # Analyze posture
-        print("Starting posture analysis...")
-        analysis, pose_results = analyze_posture(img)
-        
-        if analysis is None:
-            print("ERROR: No pose detected in image")
-            return jsonify({
-                'success': False,
-                'error': 'No pose detected in image. Make sure the person is clearly visible and facing the camera.'
-            }), 400
-
-        print("Posture analysis successful!")
-        
-        # Get issues and recommendations
-        issues, recommendations = get_posture_issues_and_recommendations(analysis)
-        
-        # Calculate overall score
-        total_issues = sum([
-            analysis['forward_head_binary'],
-            analysis['shoulder_imbalance_binary'],
-            analysis['head_tilt_binary'],
-            analysis['slouching_binary'],
-            analysis['alignment_binary'],
-            analysis['neck_angle_binary']
-        ])
-        
-        posture_score = max(0, 100 - (total_issues * 16.67))  # Each issue reduces score by ~16.67%
-        
-        # Determine posture quality based on score
-        if posture_score >= 80:
-            posture_quality = "Good"
-            binary_prediction = 1
-        elif posture_score >= 60:
-            posture_quality = "Fair"
-            binary_prediction = 0
+        if cached_analysis is not None:
+            analysis = cached_analysis
+        elif reused_analysis is not None:
+            analysis = reused_analysis
         else:
-            posture_quality = "Poor"
-            binary_prediction = 0
+            # Analyze posture
+            if frame_slot is not None:
+                # Workers are started with the default tier's options
+                pose_options = None if tier == quality_tiers.default else quality_tiers.pose_options(tier)
+                analysis = analyze_posture_in_worker(frame_slot, timer=timer, pose_options=pose_options,
+                                                     rules=rules)
+            else:
+                analysis, pose_results = analyze_posture(img, timer=timer, pool=quality_tiers.pool(tier),
+                                                         rules=rules)
+            # Decode and inference only: upload I/O depends on the client, not the tier
+            quality_tiers.observe(tier, time.perf_counter() - analysis_start)
+            
+            if analysis is None:
+                outcome = 'no_pose'
+                response = encode_response({
+                    'success': False,
+                    'error': 'No pose detected in image. Make sure the person is clearly visible and facing the camera.'
+                }, 400)
+                response.headers['X-Cache'] = result_cache.status(hit=False)
+                return response
+
+            if cnn_batcher is not None:
+                # Concurrent requests share one CNN forward pass
+                with timer.stage('cnn_inference'):
+                    analysis['cnn_prediction'] = cnn_batcher(img)
+
+            result_cache.put(cache_key, analysis)
+            if gate_signature is not None:
+                frame_gate.store(client_id, gate_signature, params, analysis, time.perf_counter() - analysis_start)
         
-        # Create ML prediction
-        ml_prediction = {
-            'probability': posture_score / 100.0,
-            'binary_prediction': binary_prediction,
-            'posture_quality': posture_quality,
-            'confidence': max(0.7, posture_score / 100.0)
-        }
+        with timer.stage('recommendations'):
+            analysis_payload = build_analysis_payload(analysis, rules)
+        record_history(user_id, metadata, analysis_payload)
         
-        print(f"Analysis complete. Issues found: {total_issues}, Score: {posture_score}")
+        latency_ms = (time.perf_counter() - request_start) * 1000
         
         # Response matching React Native expectations
         response = {
             'success': True,
-            'analysis': {
-                'posture_score': round(posture_score, 1),
-                'ml_prediction': ml_prediction,
-                'issues': issues,
-                'recommendations': recommendations,
-                'technical_measurements': {
-                    'forward_head_distance': analysis['forward_head_distance'],
-                    'shoulder_imbalance': analysis['shoulder_imbalance'],
-                    'head_tilt': analysis['head_tilt'],
-                    'slouch_distance': analysis['slouch_distance'],
-                    'total_misalignment': analysis['total_misalignment'],
-                    'neck_angle': analysis.get('neck_angle', 90.0)
-                },
-                'binary_indicators': {
-                    'forward_head': analysis['forward_head_binary'],
-                    'shoulder_imbalance': analysis['shoulder_imbalance_binary'],
-                    'head_tilt': analysis['head_tilt_binary'],
-                    'slouching': analysis['slouching_binary'],
-                    'alignment': analysis['alignment_binary'],
-                    'neck_angle': analysis['neck_angle_binary']
-                },
-                'total_issues_count': total_issues
-            },
+            'analysis': analysis_payload,
             'timestamp': metadata.get('timestamp'),
-            'metadata': metadata
+            'metadata': metadata,
+            # The previous analysis of this client's near-identical frame
+            'reused': reused_analysis is not None,
+            'quality': {
+                'tier': tier,
+                'requested': requested_tier,
+                'selected_by': selected_by,
+                'model_complexity': tier_spec['model_complexity'],
+                'max_side': tier_spec['max_side'],
+                'latency_budget_ms': budget_ms,
+                'latency_ms': round(latency_ms, 2),
+                'within_budget': latency_ms <= budget_ms if budget_ms is not None else None
+            },
+            'debug': {
+                'upload': upload_info,
+                'decode': decode_info,
+                'cache': 'hit' if cached_analysis is not None else 'miss',
+                'frame_gate': gate_info,
+                'stages_ms': {name: round(seconds * 1000, 2) for name, seconds in timer.durations.items()}
+            }
         }
         
-        print("Sending successful response")
-        return jsonify(response)
+        with timer.stage('json_serialisation'):
+            response = encode_response(response)
+        response.headers['X-Cache'] = result_cache.status(hit=cached_analysis is not None)
+        if gate_info is not None:
+            response.headers['X-Frame-Gate'] = gate_info['outcome']
+        response.headers['X-Quality-Tier'] = tier
+        response.headers['X-Issue-Catalogue-Version'] = rules.catalogue_version
+        outcome = 'success'
+        return response
+
+    except (UploadError, RequestEntityTooLarge) as e:
+        # The body is left (partly) unread, so neither is the form (nor a `fields` parameter in it)
+        status = e.status if isinstance(e, UploadError) else 413
+        outcome = 'too_large' if status == 413 else 'bad_image'
+        return jsonify({
+            'success': False,
+            'error': str(e) if isinstance(e, UploadError) else 'Upload is too large'
+        }), status
+    except Exception as e:
+        logger.exception(f"Unhandled error in posture analysis: {e}")
+        return encode_response({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }, 500)
+    finally:
+        if frame_slot is not None:
+            frame_slot.release()
+        requests_total.inc(outcome)
+        request_seconds.observe(time.perf_counter() - request_start, outcome)
+        if tier is not None:
+            tier_seconds.observe(time.perf_counter() - request_start, tier)
+
+@api.route('/analyze-posture/batch', methods=['POST'])
+def analyze_posture_batch_endpoint():
+    """Analyse many photos (repeated 'photo' parts or one zip 'archive') in parallel"""
+    try:
+        try:
+            rules = request_rules(request.form)
+            user_id = request_user(request.form)
+            items = collect_batch_items(request.files,
+                                        max_bytes=current_app.config['UPLOAD_MAX_BYTES'],
+                                        max_pixels=current_app.config['UPLOAD_MAX_PIXELS'])
+        except (BatchError, RuleError, HistoryError) as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), getattr(e, 'status', 400)
+
+        # Metadata can be one object for the whole batch or a list per photo
+        metadata = {}
+        if 'metadata' in request.form:
+            try:
+                metadata = json.loads(request.form['metadata'])
+            except json.JSONDecodeError as e:
+                logger.debug("Invalid metadata JSON: %s", e)
+                metadata = {}
+
+        logger.debug("Processing batch of %d images", len(items))
+        # Items over the upload limits are answered here and never reach the pool
+        analysed = iter(batch_executor.map_ordered(partial(analyze_image_bytes, rules=rules),
+                                                   [data for _, data, error in items if error is None]))
+        results = [next(analysed) if error is None else {'success': False, 'error': error}
+                   for _, _, error in items]
+
+        for index, ((filename, _, _), result) in enumerate(zip(items, results)):
+            item_metadata = metadata
+            if isinstance(metadata, list):
+                item_metadata = metadata[index] if index < len(metadata) else {}
+            if not isinstance(item_metadata, dict):
+                item_metadata = {}
+            result['index'] = index
+            result['filename'] = filename
+            result['timestamp'] = item_metadata.get('timestamp')
+            result['metadata'] = item_metadata
+
+        if user_id and history_store is not None:
+            # One queue pass for the whole batch; the writer commits it together
+            history_store.record_many([(user_id, result['timestamp'], result['analysis'])
+                                       for result in results if result['success']])
+
+        succeeded = sum(1 for result in results if result['success'])
+        return jsonify({
+            'success': True,
+            'count': len(results),
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'results': results
+        })
+
+    except RequestEntityTooLarge:
+        # Answered by upload_too_large
+        raise
+    except Exception as e:
+        logger.exception(f"Unhandled error: {e}")
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+@api.route('/analyze-landmarks', methods=['POST'])
+def analyze_landmarks_endpoint():
+    """Analyse 33 pre-computed pose landmarks, skipping image upload, decode and inference.
 
+    Body is either JSON ({"landmarks": [...], "metadata": {...}}) or 528 bytes
+    of packed little-endian float32 (x, y, z, visibility) with
+    Content-Type: application/octet-stream.
+    """
+    try:
+        metadata = {}
+        rules = request_rules(request.args)
+        user_id = request_user(request.args)
+        if request.mimetype == 'application/octet-stream':
+            points = parse_packed_landmarks(request.get_data(cache=False))
+        else:
+            body = request.get_json(silent=True)
+            if not isinstance(body, dict) or 'landmarks' not in body:
+                return jsonify({
+                    'success': False,
+                    'error': 'No landmarks provided'
+                }), 400
+            points = parse_json_landmarks(body['landmarks'])
+            if isinstance(body.get('metadata'), dict):
+                metadata = body['metadata']
+
+        analysis_payload = build_analysis_payload(analyze_landmarks(points, rules), rules)
+        record_history(user_id, metadata, analysis_payload)
+
+        response = encode_response({
+            'success': True,
+            'analysis': analysis_payload,
+            'timestamp': metadata.get('timestamp'),
+            'metadata': metadata
+        })
+        response.headers['X-Issue-Catalogue-Version'] = rules.catalogue_version
+        return response
+
+    except (LandmarkError, RuleError, HistoryError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except RequestEntityTooLarge:
+        # Answered by upload_too_large
+        raise
     except Exception as e:
-        print(f"CRITICAL ERROR: {e}")
-        traceback.print_exc()
+        logger.exception(f"Unhandled error: {e}")
         return jsonify({
             'success': False,
             'error': f'Internal server error: {str(e)}'
         }), 500
 
+@api.route('/jobs/analyze-posture', methods=['POST'])
+def submit_analysis_job():
+    """Queue a posture analysis and return a job id right away"""
+    try:
+        check_content_length(request.content_length, current_app.config['UPLOAD_MAX_BYTES'] + MULTIPART_OVERHEAD)
+        files, form = photo_form()
+    except UploadError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status
+
+    if 'photo' not in files:
+        return jsonify({
+            'success': False,
+            'error': 'No photo provided'
+        }), 400
+
+    file = files['photo']
+    if file.filename == '':
+        return jsonify({
+            'success': False,
+            'error': 'No photo selected'
+        }), 400
+
+    metadata = {}
+    if 'metadata' in form:
+        try:
+            metadata = json.loads(form['metadata'])
+        except json.JSONDecodeError as e:
+            logger.debug("Invalid metadata JSON: %s", e)
+            metadata = {}
+
+    try:
+        rules = request_rules(form)
+        user_id = request_user(form)
+    except (RuleError, HistoryError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    try:
+        file_bytes, _ = read_photo(file.stream, stream_length(file.stream))
+    except UploadError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status
+
+    try:
+        # Copied out of the upload buffer, which the next request on this thread reuses
+        job = job_queue.submit({'file_bytes': bytes(file_bytes), 'metadata': metadata, 'rules': rules,
+                                'user_id': user_id})
+    except QueueFull as e:
+        response = jsonify({
+            'success': False,
+            'error': 'Server is busy, retry later',
+            'retry_after': e.retry_after
+        })
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+
+    response = jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/jobs/{job.id}',
+        'queue_depth': job_queue.stats()['queue_depth']
+    })
+    response.headers['Location'] = f'/jobs/{job.id}'
+    return response, 202
+
+@api.route('/jobs/stats', methods=['GET'])
+def job_stats():
+    """Queue depth, worker utilisation and wait times"""
+    return jsonify(job_queue.stats())
+
+@api.route('/jobs/<job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    """Job status; pass ?wait=<seconds> to long-poll until the job finishes"""
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        wait = 0
+
+    job = job_queue.get(job_id, wait=wait)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Unknown or expired job id'
+        }), 404
+
+    body = job.to_dict()
+    body['success'] = True
+    return jsonify(body)
+
+@api.route('/users/<user_id>/trends', methods=['GET'])
+def user_trends(user_id):
+    """Score and issue trends from the user's hourly and daily rollups.
+
+    ?hours=<n>&days=<n> size the windows; the cost does not grow with the
+    amount of history.
+    """
+    if history_store is None:
+        return encode_response({
+            'success': False,
+            'error': 'History is disabled on this server'
+        }, 404)
+    try:
+        hours = int(request.args.get('hours', TREND_HOURS))
+        days = int(request.args.get('days', TREND_DAYS))
+    except ValueError:
+        return encode_response({
+            'success': False,
+            'error': 'hours and days must be whole numbers'
+        }, 400)
+    try:
+        trends = history_store.trends(parse_user_id(user_id), hours=hours, days=days)
+    except HistoryError as e:
+        return encode_response({
+            'success': False,
+            'error': str(e)
+        }, 400)
+    trends['success'] = True
+    return encode_response(trends)
+
+@sock.route('/ws/live-posture', bp=api)
+def live_posture_socket(ws):
+    """Live monitoring: client streams JPEG frames, server pushes one analysis per processed frame.
+
+    ?quality=<tier> or ?latency_budget_ms=<ms> picks the session's quality tier,
+    ?tenant=<id> its rule table; with ?user_id=<id> every analysed frame is
+    added to the user's history.
+    """
+    try:
+        tier, _, _, _ = select_quality_tier(request.args)
+        rules = request_rules(request.args)
+        user_id = request_user(request.args)
+    except (TierError, RuleError, HistoryError) as e:
+        ws.send(json.dumps({
+            'success': False,
+            'error': str(e)
+        }))
+        return
+    tier_spec = quality_tiers.spec(tier)
+    logger.debug("Live posture session opened (quality tier %s)", tier)
+    analyze_frame = partial(analyze_image_bytes, max_side=tier_spec['max_side'], rules=rules)
+    if user_id:
+        analyze_frame = partial(analyze_and_record, analyze_frame, user_id)
+    session = LiveSession(ws, analyze_frame,
+                          model_complexity=tier_spec['model_complexity'],
+                          min_detection_confidence=tier_spec['min_detection_confidence'])
+    session.run()
+    logger.debug("Live posture session closed after %d frames (%d dropped)",
+                 session.processed, session.slot.dropped)
+
+def preload():
+    """Pre-fork warm-up of everything that can be shared copy-on-write between workers.
+
+    MediaPipe graphs own native threads and must not cross a fork, so the
+    pose instances themselves are built per worker by create_app().
+    """
+    # Load MediaPipe in the parent so workers share it instead of each
+    # importing it again, and pull the pose model files into the page cache
+    import mediapipe as mp
+    model_dir = os.path.join(os.path.dirname(mp.__file__), 'modules')
+    for path in glob.glob(os.path.join(model_dir, 'pose_*', '*.tflite')):
+        with open(path, 'rb') as f:
+            f.read()
+
+    # Exercise the codec and the feature engine once so their lazy
+    # initialisation happens before the fork
+    ok, encoded = cv2.imencode('.jpg', np.zeros((64, 64, 3), dtype=np.uint8))
+    decode_image(encoded.tobytes(), reuse_buffer=False)
+    analyze_landmarks(np.zeros((33, 4), dtype=np.float32))
+
+def close_resources():
+    """Stop the threads and processes behind the module-level analysis resources.
+
+    Queued jobs run to completion first, and queued history rows are written
+    last, since jobs record history too. create_app() calls this before it
+    builds new resources; the servers call it on shutdown.
+    """
+    global pose_workers, history_store, cnn_batcher
+
+    job_queue.close()
+    if cnn_batcher is not None:
+        cnn_batcher.close()
+    cnn_batcher = None
+    if pose_workers is not None:
+        pose_workers.close()
+    pose_workers = None
+    quality_tiers.close()
+    if history_store is not None:
+        history_store.close()
+    history_store = None
+
+
+def create_app(config=None):
+    """Application factory for the posture analysis API.
+
+    Builds the Flask app and the shared analysis resources (quality tier pose
+    pools, result cache, job queue) from DEFAULT_CONFIG updated with `config`.
+    With WARM_UP set, every pose instance runs a warm-up inference before this
+    returns, so the app is ready for traffic as soon as it is served.
+    """
+    global quality_tiers, pose_pool, pose_workers, rule_registry, result_cache, frame_gate, job_queue, history_store
+    global cnn_model_path, cnn_batcher
+
+    app = Flask(__name__)
+    app.request_class = PostureRequest
+    app.config.update(DEFAULT_CONFIG)
+    if config:
+        app.config.update(config)
+
+    CORS(app, origins=app.config['CORS_ORIGINS'])
+    sock.init_app(app)
+    app.register_blueprint(api)
+
+    close_resources()
+    quality_tiers = QualityTiers(tiers=app.config['QUALITY_TIERS'],
+                                 default=app.config['QUALITY_TIER'],
+                                 pool_size=app.config['POSE_POOL_SIZE'],
+                                 max_uses=app.config['POSE_POOL_MAX_USES'])
+    pose_pool = quality_tiers.pool(quality_tiers.default)
+    rule_registry = RuleRegistry(app.config['POSTURE_RULES_DIR'])
+    if app.config['POSE_WORKERS'] > 0:
+        # Slots fit the largest frame any tier decodes
+        max_side = max(spec['max_side'] for spec in app.config['QUALITY_TIERS'].values())
+        pose_workers = PoseWorkers(workers=app.config['POSE_WORKERS'],
+                                   slots=app.config['FRAME_RING_SLOTS'],
+                                   slot_bytes=frame_slot_bytes(max_side),
+                                   timeout=app.config['FRAME_RING_TIMEOUT'],
+                                   max_uses=app.config['POSE_POOL_MAX_USES'],
+                                   **quality_tiers.pose_options(quality_tiers.default))
+    result_cache = ResultCache(backend=app.config['RESULT_CACHE_BACKEND'],
+                               max_entries=app.config['RESULT_CACHE_SIZE'],
+                               ttl=app.config['RESULT_CACHE_TTL'],
+                               path=app.config['RESULT_CACHE_PATH'])
+    frame_gate = FrameGate(max_distance=app.config['FRAME_GATE_DISTANCE'],
+                           max_age=app.config['FRAME_GATE_MAX_AGE'],
+                           max_clients=app.config['FRAME_GATE_MAX_CLIENTS'])
+    job_queue = JobQueue(run_analysis_job,
+                         workers=app.config['JOB_WORKERS'],
+                         max_queue=app.config['JOB_QUEUE_SIZE'])
+    if app.config['HISTORY_PATH']:
+        history_store = HistoryStore(app.config['HISTORY_PATH'],
+                                     batch_size=app.config['HISTORY_BATCH_SIZE'],
+                                     max_queue=app.config['HISTORY_QUEUE_SIZE'])
+
+    cnn_model = None
+    cnn_model_path = app.config['CNN_MODEL_PATH'] or app.config['TFJS_MODEL_PATH']
+    if cnn_model_path and cnn_model_path.endswith('.tflite'):
+        cnn_model = TFLiteModel(cnn_model_path, num_threads=app.config['TFLITE_THREADS'])
+    elif app.config['CNN_MODEL_PATH']:
+        # TensorFlow is only imported when a Keras model is configured
+        from posture_model import PostureModel
+        cnn_model = PostureModel(cnn_model_path)
+        cnn_model.load_model()
+    elif cnn_model_path:
+        cnn_model = load_model_or_none(cnn_model_path)
+    if cnn_model is None:
+        cnn_model_path = None
+    if cnn_model is not None:
+        cnn_batcher = MicroBatcher(cnn_model.predict_batch,
+                                   max_batch_size=app.config['MICROBATCH_MAX_SIZE'],
+                                   max_wait_ms=app.config['MICROBATCH_MAX_WAIT_MS'],
+                                   name='posture-cnn')
+
+    if app.config['WARM_UP']:
+        quality_tiers.warm_up()
+        if pose_workers is not None:
+            pose_workers.warm_up([quality_tiers.pose_options(name) for name in quality_tiers.names
+                                  if name != quality_tiers.default and quality_tiers.available(name)])
+
+    return app
+
 if __name__ == '__main__':
     print("="*60)
     print("🚀 POSTURE ANALYSIS FLASK SERVER")
@@ -400,6 +1129,13 @@ if __name__ == '__main__':
     print("  GET  /health - Health check") 
     print("  GET  /test - Simple connectivity test")
     print("  POST /analyze-posture - Main analysis endpoint")
+    print("  POST /analyze-posture/batch - Analyse many photos in one request")
+    print("  WS   /ws/live-posture - Stream frames for live monitoring")
+    print("  POST /analyze-landmarks - Analyse on-device landmarks (no image)")
+    print("  GET  /recommendations/catalogue - Issue text and tips by issue code")
+    print("  POST /jobs/analyze-posture - Queue an analysis, poll GET /jobs/<id>")
+    print("  GET  /users/<id>/trends - Posture trends for a user (send X-User-Id when analysing)")
+    print("  GET  /metrics - Prometheus metrics (per-stage latency)")
     print("")
     print("📋 SETUP CHECKLIST:")
     print("1. ✅ Install dependencies:")
@@ -421,4 +1157,11 @@ if __name__ == '__main__':
     print("   Access from your phone at: http://YOUR_IP:5001")
     print("="*60)
     
+    print("   For production use: python serve.py --workers N --threads M")
+    print("   Many slow mobile clients: python serve_asgi.py --threads M (ASGI, no WebSocket)")
+    print("="*60)
+    
+    # Build and warm the pose pool before accepting traffic. With debug=True the
+    # reloader runs this block twice; only the serving child needs the pool.
+    app = create_app({'WARM_UP': os.environ.get('WERKZEUG_RUN_MAIN') == 'true'})
     app.run(debug=True, host='0.0.0.0', port=5001, threaded=True)
\ No newline at end of file